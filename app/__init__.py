@@ -1,21 +1,29 @@
-from flask import Flask, render_template
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
-import os
-from dotenv import load_dotenv
+from .routing import RoutingSession
 
 
-app = Flask(__name__)
-db = SQLAlchemy()
-load_dotenv()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-CONFIG = os.getenv("CONFIG")
-SECRET_KEY = os.getenv('KEY')
 def create_app(test_config=None):
+    """
+    Builds the application. Importing and creating it has no side effects on
+    the database: create the schema with `flask db-upgrade`, and warm caches
+    with app.warmup.
+    """
+    from flask_login import LoginManager
+    from .config import load_config
+    from .database import install_sqlite_pragmas
+    from . import instrumentation, routing
+    from .serialization import make_provider
+
     app = Flask(__name__)
-    app.config['SECRET_KEY'] = SECRET_KEY
-    app.config['SQLALCHEMY_DATABASE_URI'] = CONFIG
+    load_config(app, test_config)
+    app.json = make_provider(app)
     db.init_app(app)
+    install_sqlite_pragmas(app)
+    routing.init_app(app, db)
+    instrumentation.init_app(app, db)
 
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -23,23 +31,32 @@ def create_app(test_config=None):
 
     @login_manager.user_loader
     def load_user(id):
-        return Customer.query.get(int(id))
+        return identity.load_identity(id)
 
     from .views import views
     from .auth import auth
-    from .models import Customer, Cart, Product, Order
     from .product_search import productsearch
+    from . import (admission, catalog_version, commands, compression, identity, jobs, price_index, product_cache,
+                   search_index, suggest)
+
+    admission.init_app(app)
+    commands.init_app(app)
+    identity.init_app(app)
+    product_cache.init_app(app)
+    search_index.init_app(app)
+    price_index.init_app(app)
+    suggest.init_app(app)
+    catalog_version.init_app(app)
+    compression.init_app(app)
+    jobs.init_app(app)
 
     app.register_blueprint(views, url_prefix='/') # localhost:5000/about-us
     app.register_blueprint(auth, url_prefix='/') # localhost:5000/auth/change-password
     app.register_blueprint(productsearch, url_prefix='/')
+    app.register_blueprint(instrumentation.instrumentation, url_prefix='/')
 
-
-    with app.app_context():
-        create_database()
+    if app.config.get('WARMUP_ON_START'):
+        from .warmup import warmup
+        warmup(app)
 
     return app
-
-def create_database():
-    db.create_all()
-    print('Database Created')
\ No newline at end of file
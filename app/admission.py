@@ -0,0 +1,246 @@
+"""
+Admission control for CPU-heavy endpoints.
+
+Views decorated with `admission_controlled` are admitted in two steps before
+they run, and refused fast otherwise, so a burst of password hashing cannot
+occupy every worker thread that cart and search requests also need:
+
+1. Token-bucket rate limits per client address and per account (the email in
+   the JSON body, or whatever the view's `account_key` returns). An empty
+   bucket answers 429 Too Many Requests with Retry-After set to the time
+   until the next token.
+2. A per-process concurrency limit per endpoint. Requests beyond the limit
+   wait in a bounded queue for up to ADMISSION_QUEUE_TIMEOUT seconds; when the
+   queue is full or the wait times out the answer is 503 Service Unavailable
+   with Retry-After.
+
+Buckets live in an LRUCache of ADMISSION_MAX_BUCKETS entries, so a flood of
+distinct addresses or emails cannot grow memory without bound; an evicted
+bucket starts again full. Admitted and shed requests are counted in /metrics.
+Behind a proxy, configure werkzeug's ProxyFix so the client address is the
+real one.
+
+Configuration:
+    ADMISSION_ENABLED: Set to False to admit everything.
+    ADMISSION_CLIENT_RATE: (tokens per second, burst) per client address; None disables.
+    ADMISSION_ACCOUNT_RATE: (tokens per second, burst) per account; None disables.
+    ADMISSION_CONCURRENCY: Endpoint -> requests running at once per process.
+    ADMISSION_DEFAULT_CONCURRENCY: Limit for controlled endpoints not listed there.
+    ADMISSION_QUEUE_SIZE: Requests that may wait for a slot, per endpoint.
+    ADMISSION_QUEUE_TIMEOUT: Seconds a request waits for a slot.
+    ADMISSION_RETRY_AFTER: Retry-After, in seconds, sent with 503.
+    ADMISSION_MAX_BUCKETS: Rate-limit buckets kept per process.
+"""
+import functools
+import math
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, jsonify, request
+
+from app.cache import LRUCache
+
+
+_EXTENSION_KEY = 'admission'
+_BUCKETS_KEY = 'admission_buckets'
+
+DEFAULT_CLIENT_RATE = (5.0, 20)
+DEFAULT_ACCOUNT_RATE = (0.5, 10)
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_QUEUE_TIMEOUT = 0.5
+DEFAULT_RETRY_AFTER = 1
+DEFAULT_MAX_BUCKETS = 100000
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `burst`.
+    Not thread safe; RateLimiter serializes access.
+    """
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """Takes one token. Returns 0 on success, or the seconds until a token is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets keyed by (scope, key), held in a bounded LRUCache."""
+
+    def __init__(self, buckets, clock=time.monotonic):
+        self.buckets = buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def take(self, scope, key, rate, burst):
+        """Returns 0 when a token was taken, or the seconds to wait for the next one."""
+        now = self._clock()
+        with self._lock:
+            bucket = self.buckets.get((scope, key))
+            if bucket is None:
+                bucket = TokenBucket(rate, burst, now)
+                self.buckets.set((scope, key), bucket)
+            return bucket.take(now)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at once, with up to `queue_size` callers waiting for a slot."""
+
+    def __init__(self, limit, queue_size):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout):
+        """Returns True once a slot is held, or False when the queue is full or `timeout` passes."""
+        with self._condition:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue_size or timeout <= 0:
+                return False
+            self.waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self.active < self.limit, timeout):
+                    return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+class AdmissionControl:
+    """Per-app rate limiter, concurrency limiters and counters."""
+
+    def __init__(self, app):
+        self.config = app.config
+        self.buckets = LRUCache(maxsize=app.config.get('ADMISSION_MAX_BUCKETS', DEFAULT_MAX_BUCKETS))
+        self.rate_limiter = RateLimiter(self.buckets)
+        self.admitted = Counter()
+        self.shed = Counter()
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def count(self, counter, key):
+        with self._lock:
+            counter[key] += 1
+
+    def limiter(self, endpoint):
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(endpoint)
+                if limiter is None:
+                    limits = self.config.get('ADMISSION_CONCURRENCY') or {}
+                    limiter = self._limiters[endpoint] = ConcurrencyLimiter(
+                        limits.get(endpoint, self.config.get('ADMISSION_DEFAULT_CONCURRENCY', DEFAULT_CONCURRENCY)),
+                        self.config.get('ADMISSION_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                    )
+        return limiter
+
+    def families(self):
+        limiters = sorted(self._limiters.items())
+        return [
+            ('admission_admitted_total', 'counter', 'Requests admitted by admission control.',
+             [({'endpoint': endpoint}, count) for endpoint, count in sorted(self.admitted.items())]),
+            ('admission_shed_total', 'counter', 'Requests refused by admission control, by reason.',
+             [({'endpoint': endpoint, 'reason': reason}, count)
+              for (endpoint, reason), count in sorted(self.shed.items())]),
+            ('admission_in_flight', 'gauge', 'Admitted requests running now.',
+             [({'endpoint': endpoint}, limiter.active) for endpoint, limiter in limiters]),
+            ('admission_waiting', 'gauge', 'Requests waiting for a concurrency slot.',
+             [({'endpoint': endpoint}, limiter.waiting) for endpoint, limiter in limiters]),
+        ]
+
+
+def init_app(app):
+    control = app.extensions[_EXTENSION_KEY] = AdmissionControl(app)
+    # Registered on its own so the cache metrics report the bucket count and evictions.
+    app.extensions[_BUCKETS_KEY] = control.buckets
+    metrics = app.extensions.get('instrumentation')
+    if metrics is not None:
+        metrics.register_collector(control.families)
+
+
+def get_admission():
+    return current_app.extensions[_EXTENSION_KEY]
+
+
+def json_email():
+    """Account key for views whose JSON body carries the account's email."""
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def _refuse(status, message, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _rate_limited(control, scope, key, setting, default):
+    rate = control.config.get(setting, default)
+    if rate is None or key is None:
+        return 0
+    return control.rate_limiter.take(scope, key, *rate)
+
+
+def admission_controlled(account_key=json_email):
+    """
+    Decorator applying rate limits and a concurrency limit to a view; see the
+    module docstring.
+
+    Parameters:
+        account_key (callable): Returns the account the request acts on, or None
+            to skip the per-account limit.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            control = get_admission()
+            if not control.config.get('ADMISSION_ENABLED', True):
+                return view(*args, **kwargs)
+            endpoint = request.endpoint
+
+            for scope, key, setting, default in (
+                ('client', request.remote_addr, 'ADMISSION_CLIENT_RATE', DEFAULT_CLIENT_RATE),
+                ('account', account_key(), 'ADMISSION_ACCOUNT_RATE', DEFAULT_ACCOUNT_RATE),
+            ):
+                wait = _rate_limited(control, scope, key, setting, default)
+                if wait:
+                    control.count(control.shed, (endpoint, f'{scope}_rate'))
+                    return _refuse(429, 'Too many requests, please retry later', wait)
+
+            limiter = control.limiter(endpoint)
+            if not limiter.acquire(control.config.get('ADMISSION_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)):
+                control.count(control.shed, (endpoint, 'concurrency'))
+                return _refuse(503, 'Service busy, please retry',
+                               control.config.get('ADMISSION_RETRY_AFTER', DEFAULT_RETRY_AFTER))
+            control.count(control.admitted, endpoint)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limiter.release()
+        return wrapper
+    return decorator
@@ -1,15 +1,27 @@
-from flask import Blueprint, render_template, flash, redirect, Flask, request
+from flask import Blueprint, render_template, flash, redirect, Flask, current_app, request
 from .models import Customer
 from . import db
 from flask_login import login_user, login_required, logout_user, current_user
 from flask import jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from .admission import DEFAULT_RETRY_AFTER, admission_controlled
+from .hashing import HashingUnavailable, hash_password, needs_rehash, verify_password
+from .jobs import enqueue
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 auth = Blueprint('auth', __name__)
 
 
+@auth.errorhandler(HashingUnavailable)
+def hashing_unavailable(e):
+    retry_after = current_app.config.get('ADMISSION_RETRY_AFTER', DEFAULT_RETRY_AFTER)
+    return jsonify({'error': 'Service busy, please retry'}), 503, {'Retry-After': str(retry_after)}
+
+
 @auth.route('/sign-up', methods=['GET', 'POST'])
+@admission_controlled()
 def sign_up():
     """
     Registers a new user with email, username, and password.
@@ -43,19 +55,24 @@ def sign_up():
     if Customer.query.filter_by(username=username).first() is not None:
         return jsonify({'error': 'Username already taken'}), 400
 
-    new_user = Customer(email=email, username=username, password_hash=generate_password_hash(password1))
+    new_user = Customer(email=email, username=username, password_hash=hash_password(password1))
 
     db.session.add(new_user)
     try:
+        db.session.flush()
+        # Committed with the account, and sent by a job worker rather than this request.
+        enqueue('send_welcome_email', {'customer_id': new_user.id})
         db.session.commit()
-    except Exception as e:
-        print(e)
+    except Exception:
+        db.session.rollback()
+        logger.exception('Account creation failed for %s', username)
         return jsonify({'error': 'Account creation failed'}), 500
 
     return jsonify({'message': 'Account created successfully'}), 201
 
 
 @auth.route('/login', methods=['GET', 'POST'])
+@admission_controlled()
 def login():
     """
     Authenticates a user based on email and password.
@@ -80,7 +97,11 @@ def login():
 
     user = Customer.query.filter_by(email=email).first()
 
-    if user and check_password_hash(user.password_hash, password):
+    if user and verify_password(user.password_hash, password):
+        if needs_rehash(user.password_hash):
+            # Stored with an older method or cost; upgrade while we have the plaintext.
+            user.password_hash = hash_password(password)
+            db.session.commit()
         login_user(user)
         # Redirect isn't typically used in APIs; instead, return a success message or token
         return jsonify({'message': 'Login successful'}), 200
@@ -102,8 +123,9 @@ def log_out():
     logout_user()
     return redirect('/')
 
-@auth.route('/change-password/<int:customer_id>', methods=['GET', 'POST'])
+@auth.route('/change-password/<int:user_id>', methods=['GET', 'POST'])
 # @login_required
+@admission_controlled(account_key=lambda: 'customer:%d' % request.view_args['user_id'])
 def change_password(user_id):
     """
     Allows a logged-in user to change their password.
@@ -138,12 +160,12 @@ def change_password(user_id):
     if new_password != confirm_new_password:
         return jsonify({'error': 'New passwords do not match'}), 400
 
-    user = Customer.query.get(user_id)
+    user = db.session.get(Customer, user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    if check_password_hash(user.password_hash, current_password):
-        user.password_hash = generate_password_hash(new_password)
+    if verify_password(user.password_hash, current_password):
+        user.password_hash = hash_password(new_password)
         db.session.commit()
         return jsonify({'message': 'Password updated successfully'}), 200
     else:
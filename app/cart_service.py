@@ -0,0 +1,289 @@
+"""
+Cart reads and writes shared by the cart endpoints.
+
+Every function here issues a fixed number of queries regardless of how many
+lines the cart has, and all money amounts are rounded the same way. Writes are
+single atomic statements against the unique (customer_link, product_link)
+index, so concurrent clicks neither lose updates nor duplicate cart rows.
+
+Databases created before that index existed get it from migration 1 (`flask
+db-upgrade`). Until then, adds fall back to an UPDATE and, when it matches no
+line, an INSERT; a warning is logged once per database.
+"""
+import logging
+import weakref
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import Cart, Product
+from app.sql import upsert
+
+
+logger = logging.getLogger(__name__)
+
+# Engine -> whether its cart table has the unique (customer_link, product_link) index.
+_unique_lines = weakref.WeakKeyDictionary()
+
+
+class CartItemError(Exception):
+    """
+    Raised when a cart line cannot be changed.
+
+    Attributes:
+        message (str): Error message for the client.
+        status (int): HTTP status code to answer with.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def round_money(amount):
+    """Rounds a currency amount to two decimal places."""
+    return round(float(amount or 0), 2)
+
+
+# Keys of the dicts returned by cart_lines(), in column order for the columnar response.
+CART_LINE_FIELDS = ('cart_id', 'product_id', 'product_name', 'quantity', 'price_per_item', 'subtotal')
+
+
+def cart_lines(customer_id):
+    """
+    Returns the customer's cart lines, with product details, from one joined query.
+
+    Returns:
+        List of dicts with 'cart_id', 'product_id', 'product_name', 'quantity',
+        'price_per_item' and 'subtotal', ordered by cart id.
+    """
+    rows = db.session.execute(
+        db.select(Cart.id, Cart.product_link, Product.product_name, Cart.quantity, Product.current_price)
+        .join(Product, Product.id == Cart.product_link)
+        .where(Cart.customer_link == customer_id)
+        .order_by(Cart.id)
+    )
+    return [{
+        'cart_id': cart_id,
+        'product_id': product_id,
+        'product_name': product_name,
+        'quantity': quantity,
+        'price_per_item': price,
+        'subtotal': round_money(quantity * price)
+    } for cart_id, product_id, product_name, quantity, price in rows]
+
+
+def lines_total(lines):
+    """
+    Total of lines returned by cart_lines(). Every cart and checkout total is
+    computed here, so all endpoints agree to the cent.
+    """
+    return round_money(sum(line['quantity'] * line['price_per_item'] for line in lines))
+
+
+def add_item(customer_id, product_id, quantity=1):
+    """
+    Adds `quantity` of a product to the cart in one INSERT ... ON CONFLICT DO UPDATE.
+
+    Returns:
+        The line's quantity after the change.
+    """
+    if not _has_unique_lines():
+        return _write_line(customer_id, product_id, quantity, increment=True)
+    stmt = upsert(Cart).values(customer_link=customer_id, product_link=product_id, quantity=quantity)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Cart.customer_link, Cart.product_link],
+        set_={'quantity': Cart.quantity + stmt.excluded.quantity},
+    ).returning(Cart.quantity)
+    return db.session.execute(stmt).scalar_one()
+
+
+def _has_unique_lines():
+    engine = db.session.get_bind(mapper=Cart)
+    found = _unique_lines.get(engine)
+    if found is None:
+        inspector = sa.inspect(db.session.connection(bind_arguments={'mapper': Cart}))
+        columns = {'customer_link', 'product_link'}
+        unique = [index['column_names'] for index in inspector.get_indexes('cart') if index.get('unique')]
+        unique += [constraint['column_names'] for constraint in inspector.get_unique_constraints('cart')]
+        found = any(set(names) == columns for names in unique)
+        if not found:
+            logger.warning('The cart table has no unique (customer_link, product_link) index; '
+                           'run `flask db-upgrade`. Cart adds use UPDATE-then-INSERT until then.')
+        _unique_lines[engine] = found
+    return found
+
+
+def _write_line(customer_id, product_id, quantity, increment):
+    """
+    Fallback for add_item and apply_batch without the unique index: updates the
+    customer's line for the product (adding `quantity` when `increment`, setting
+    it otherwise), inserting it if there is none. Returns the line's quantity.
+    """
+    stmt = (
+        db.update(Cart)
+        .where(Cart.customer_link == customer_id, Cart.product_link == product_id)
+        .values(quantity=Cart.quantity + quantity if increment else quantity)
+        .returning(Cart.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    updated = db.session.execute(stmt).scalars().first()
+    if updated is not None:
+        return updated
+    stmt = db.insert(Cart).values(customer_link=customer_id, product_link=product_id, quantity=quantity)
+    return db.session.execute(stmt.returning(Cart.quantity)).scalar_one()
+
+
+def change_quantity(customer_id, cart_id, delta):
+    """
+    Adds `delta` to a cart line's quantity with one conditional UPDATE.
+
+    A decrement only applies while the quantity is above zero.
+
+    Returns:
+        The line's quantity after the change.
+
+    Raises:
+        CartItemError: If the line doesn't exist, belongs to someone else, or is already at zero.
+    """
+    stmt = (
+        db.update(Cart)
+        .where(Cart.id == cart_id, Cart.customer_link == customer_id)
+        .values(quantity=Cart.quantity + delta)
+        .returning(Cart.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if delta < 0:
+        stmt = stmt.where(Cart.quantity >= -delta)
+    quantity = db.session.execute(stmt).scalar()
+    if quantity is None:
+        _raise_for_missing(customer_id, cart_id, zero_is_error=delta < 0)
+    return quantity
+
+
+def remove_item(customer_id, cart_id):
+    """
+    Deletes a cart line with one DELETE.
+
+    Returns:
+        The quantity the line held.
+
+    Raises:
+        CartItemError: If the line doesn't exist or belongs to someone else.
+    """
+    stmt = (
+        db.delete(Cart)
+        .where(Cart.id == cart_id, Cart.customer_link == customer_id)
+        .returning(Cart.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    quantity = db.session.execute(stmt).scalar()
+    if quantity is None:
+        _raise_for_missing(customer_id, cart_id)
+    return quantity
+
+
+def _raise_for_missing(customer_id, cart_id, zero_is_error=False):
+    # Only reached when the write matched nothing; work out why for the response.
+    owner = db.session.execute(
+        db.select(Cart.customer_link, Cart.quantity).where(Cart.id == cart_id)
+    ).first()
+    if owner is None:
+        raise CartItemError('Cart item not found', 404)
+    if owner.customer_link != customer_id:
+        raise CartItemError('Access denied', 403)
+    if zero_is_error:
+        raise CartItemError('Quantity cannot be less than zero', 400)
+    raise CartItemError('Cart item not found', 404)
+
+
+BATCH_OPERATIONS = ('add', 'set', 'remove')
+
+
+def apply_batch(customer_id, operations):
+    """
+    Applies a list of cart operations with a fixed number of bulk statements.
+
+    Each operation is a dict with 'op' ('add', 'set' or 'remove'), 'product_id'
+    and, for 'add' and 'set', 'quantity'. Operations on the same product are
+    folded in order before anything is written, all product ids are validated
+    with one IN query, and the writes are one executemany upsert per kind plus
+    one DELETE. The caller commits.
+
+    Raises:
+        CartItemError: If an operation is malformed (400) or names unknown products (404).
+    """
+    # product id -> (absolute quantity or None to build on the stored one, quantity to add)
+    folded = {}
+    for position, operation in enumerate(operations):
+        op, product_id, quantity = _parse_operation(position, operation)
+        absolute, delta = folded.get(product_id, (None, 0))
+        if op == 'add':
+            folded[product_id] = (absolute, delta + quantity)
+        elif op == 'set':
+            folded[product_id] = (quantity, 0)
+        else:
+            folded[product_id] = (0, 0)
+
+    if not folded:
+        return
+    known = set(db.session.execute(db.select(Product.id).where(Product.id.in_(list(folded)))).scalars())
+    unknown = sorted(set(folded) - known)
+    if unknown:
+        raise CartItemError(f'Unknown product ids: {unknown}', 404)
+
+    increments = []
+    assignments = []
+    deletions = []
+    for product_id, (absolute, delta) in folded.items():
+        if absolute is None:
+            increments.append({'customer_link': customer_id, 'product_link': product_id, 'quantity': delta})
+        elif absolute + delta > 0:
+            assignments.append({'customer_link': customer_id, 'product_link': product_id, 'quantity': absolute + delta})
+        else:
+            deletions.append(product_id)
+
+    if not _has_unique_lines():
+        for rows, increment in ((increments, True), (assignments, False)):
+            for row in rows:
+                _write_line(customer_id, row['product_link'], row['quantity'], increment)
+        increments, assignments = [], []
+
+    conflict_columns = [Cart.customer_link, Cart.product_link]
+    if increments:
+        stmt = upsert(Cart)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns, set_={'quantity': Cart.quantity + stmt.excluded.quantity})
+        db.session.execute(stmt, increments)
+    if assignments:
+        stmt = upsert(Cart)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns, set_={'quantity': stmt.excluded.quantity})
+        db.session.execute(stmt, assignments)
+    if deletions:
+        db.session.execute(
+            db.delete(Cart)
+            .where(Cart.customer_link == customer_id, Cart.product_link.in_(deletions))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _parse_operation(position, operation):
+    if not isinstance(operation, dict):
+        raise CartItemError(f'Operation {position} must be an object', 400)
+    op = operation.get('op')
+    if op not in BATCH_OPERATIONS:
+        raise CartItemError(f"Operation {position}: 'op' must be one of {', '.join(BATCH_OPERATIONS)}", 400)
+
+    product_id = operation.get('product_id')
+    if not isinstance(product_id, int) or isinstance(product_id, bool):
+        raise CartItemError(f"Operation {position}: 'product_id' must be an integer", 400)
+
+    quantity = None
+    if op != 'remove':
+        quantity = operation.get('quantity', 1 if op == 'add' else None)
+        minimum = 1 if op == 'add' else 0
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < minimum:
+            raise CartItemError(f"Operation {position}: 'quantity' must be an integer of at least {minimum}", 400)
+    return op, product_id, quantity
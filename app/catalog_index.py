@@ -0,0 +1,101 @@
+"""
+Shared plumbing for in-process indexes over the Product table.
+
+The search, price and suggestion indexes are each built from the database on
+first use and then follow committed Product changes through app.model_events.
+Those events only come from commits made by this process, so every index also
+remembers the catalog version (see app.catalog_version) it reflects. A read
+that finds the catalog at a newer version rebuilds the index first, which is
+how changes from other web workers, `flask ingest-products` and job workers
+reach it, within CATALOG_VERSION_TTL seconds.
+
+A commit in this process moves the index to its new version only when that
+commit was the single change since the version the index was at; otherwise
+another process changed the catalog in between and the next read rebuilds.
+
+Subclasses set `extension_key` and implement `_load` (fill an empty index from
+the database) and `_apply` (apply one ModelChanges, returning False when the
+index cannot follow them and must be rebuilt).
+"""
+import threading
+
+from flask import current_app, has_app_context
+
+from app import model_events
+from app.catalog_version import current_version
+from app.models import Product
+
+
+class CatalogIndex:
+    """Mixin adding lazy, version-checked building to an in-process index with a `clear` method."""
+
+    extension_key = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.built = False
+        # Catalog version the contents reflect, or None when unknown.
+        self.version = None
+        # Reentrant: change handlers run under it and may invalidate.
+        self._build_lock = threading.RLock()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _apply(self, changes):
+        raise NotImplementedError
+
+    def ensure_built(self):
+        """Builds the index if it is not built, or was built at an older catalog version."""
+        # Read before loading: a change committed meanwhile then only causes one more rebuild.
+        version = current_version()[0]
+        if self.built and self.version is not None and version <= self.version:
+            return
+        with self._build_lock:
+            if self.built and self.version is not None and version <= self.version:
+                return
+            self.clear()
+            self._load()
+            self.version = version
+            self.built = True
+
+    def invalidate(self):
+        with self._build_lock:
+            self.built = False
+            self.version = None
+            self.clear()
+
+    def apply_changes(self, changes):
+        """Applies committed Product changes from this process, rebuilding later when it cannot."""
+        with self._build_lock:
+            if not self.built:
+                return
+            if changes.reset or not self._apply(changes):
+                self.invalidate()
+                return
+            version = changes.info.get('catalog_version')
+            if version is not None and self.version is not None and version == self.version + 1:
+                self.version = version
+
+    @classmethod
+    def init_app(cls, app):
+        app.extensions[cls.extension_key] = cls()
+
+    @classmethod
+    def get(cls):
+        """Returns the current app's index, building or rebuilding it if needed."""
+        index = current_app.extensions[cls.extension_key]
+        index.ensure_built()
+        return index
+
+    @classmethod
+    def subscribe(cls):
+        model_events.subscribe(Product, cls._on_product_change)
+
+    @classmethod
+    def _on_product_change(cls, changes):
+        if not has_app_context():
+            return
+        index = current_app.extensions.get(cls.extension_key)
+        if index is not None:
+            index.apply_changes(changes)
@@ -0,0 +1,182 @@
+"""
+Catalog version counter and HTTP conditional requests for catalog endpoints.
+
+Every transaction that inserts, updates or deletes products also bumps the
+single catalog_version row before it commits, so the version and the catalog
+change together in every process. Catalog responses carry an ETag derived from
+the version and the normalized request parameters, plus a Last-Modified from
+the time of the bump; a GET whose If-None-Match (or, without it,
+If-Modified-Since) still matches gets 304 Not Modified before the view runs.
+
+The version is read through a per-process cache of CATALOG_VERSION_TTL
+seconds, so revalidations cost no database query. Commits in this process
+update it immediately; changes made by other processes are noticed within the
+TTL. Stock-only changes that keep a product in stock leave the version alone:
+no catalog response shows the stock count itself.
+
+Configuration:
+    CATALOG_VERSION_TTL: Seconds a process trusts its cached version.
+    CATALOG_CACHE_CONTROL: Cache-Control header for catalog responses; None sends none.
+"""
+import functools
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+from app import db, model_events
+from app.models import CatalogVersion, Product
+from app.sql import upsert
+
+
+_EXTENSION_KEY = 'catalog_version'
+_BUMP_KEY = 'catalog_version.bumped'
+_ROW_ID = 1
+
+DEFAULT_TTL = 1.0
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+class VersionCache:
+    """The last known (version, updated_at), trusted for `ttl` seconds."""
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0.0
+
+    def get(self, load):
+        now = self._clock()
+        if self._value is None or now >= self._expires:
+            with self._lock:
+                if self._value is None or now >= self._expires:
+                    self._value = load()
+                    self._expires = now + self.ttl
+        return self._value
+
+    def set(self, value):
+        with self._lock:
+            if self._value is None or value[0] >= self._value[0]:
+                self._value = value
+                self._expires = self._clock() + self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+
+
+def init_app(app):
+    app.extensions[_EXTENSION_KEY] = VersionCache(app.config.get('CATALOG_VERSION_TTL', DEFAULT_TTL))
+
+
+def load_version():
+    """Reads (version, updated_at) from the database; (0, None) before the first catalog change."""
+    row = db.session.execute(db.select(CatalogVersion.version, CatalogVersion.updated_at)
+                             .where(CatalogVersion.id == _ROW_ID)).first()
+    return (row.version, row.updated_at) if row is not None else (0, None)
+
+
+def current_version():
+    """Returns the (version, updated_at) of the catalog, from the process cache when fresh."""
+    return current_app.extensions[_EXTENSION_KEY].get(load_version)
+
+
+def _affects_catalog(changes):
+    if changes.reset or changes.deleted:
+        return True
+    for values in changes.upserted.values():
+        # Unknown values, or anything beyond a stock count that stays positive.
+        if not values or set(values) - {'in_stock'} or values['in_stock'] <= 0:
+            return True
+    return False
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_with_catalog_changes(session):
+    if not has_app_context() or _EXTENSION_KEY not in current_app.extensions:
+        return
+    # Flush now so ORM changes made since the last flush are recorded too.
+    session.flush()
+    changes = model_events.pending(session, Product)
+    if changes is None or session.info.get(_BUMP_KEY) or not _affects_catalog(changes):
+        return
+    bump(session)
+    # Lets in-process indexes tell whether this commit was the only change since they were built.
+    changes.info['catalog_version'] = session.info[_BUMP_KEY][0]
+
+
+def bump(session):
+    """
+    Increments the catalog version in `session`'s transaction; it is published to
+    this process when the transaction commits. Call it after changing products
+    without going through the session, so every process rebuilds its catalog
+    indexes and caches.
+    """
+    if session.info.get(_BUMP_KEY):
+        return session.info[_BUMP_KEY]
+    now = datetime.utcnow().replace(microsecond=0)
+    stmt = upsert(CatalogVersion).values(id=_ROW_ID, version=1, updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CatalogVersion.id],
+        set_={'version': CatalogVersion.version + 1, 'updated_at': now},
+    ).returning(CatalogVersion.version, CatalogVersion.updated_at)
+    session.info[_BUMP_KEY] = tuple(session.connection().execute(stmt).one())
+    return session.info[_BUMP_KEY]
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_bump(session):
+    bumped = session.info.pop(_BUMP_KEY, None)
+    if bumped is not None and has_app_context():
+        cache = current_app.extensions.get(_EXTENSION_KEY)
+        if cache is not None:
+            cache.set(bumped)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bump(session):
+    session.info.pop(_BUMP_KEY, None)
+
+
+def make_etag(version):
+    """ETag for the current request: the catalog version plus the normalized query parameters."""
+    params = sorted((key, value) for key in request.args for value in request.args.getlist(key))
+    digest = hashlib.sha1(repr((request.path, params)).encode()).hexdigest()[:16]
+    return f'{version}-{digest}'
+
+
+def conditional(view):
+    """
+    Decorator adding ETag, Last-Modified and Cache-Control to a catalog view's
+    GET responses and answering matching conditional GETs with 304.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+
+        # Read before the view runs: a concurrent change then yields newer content under an older
+        # ETag, which the next revalidation replaces, never older content under a newer one.
+        version, updated_at = current_version()
+        etag = make_etag(version)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=updated_at):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        if updated_at is not None:
+            response.last_modified = updated_at
+        cache_control = current_app.config.get('CATALOG_CACHE_CONTROL', DEFAULT_CACHE_CONTROL)
+        if cache_control:
+            response.headers['Cache-Control'] = cache_control
+        return response
+    return wrapper
@@ -0,0 +1,187 @@
+"""
+Turns a customer's cart into Order rows.
+
+A checkout is one transaction and issues the same handful of statements
+whatever the size of the cart: claim the idempotency key, read the cart with
+one join, decrement stock for every line with one conditional UPDATE, insert
+the orders in one executemany, read back their ids, add them to the sales
+rollups with one upsert per rollup (see app.sales), delete the cart lines in
+one DELETE and queue the payment reconciliation job. If any product lacks
+stock the UPDATE matches fewer rows than the cart has lines and the whole
+checkout is rolled back.
+"""
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db, model_events
+from app.cart_service import cart_lines, lines_total, round_money
+from app.jobs import enqueue
+from app.models import Cart, Checkout, Order, Product
+from app.sales import record_orders
+
+
+ORDER_STATUS = 'Pending'
+CHECKOUT_STATUS = 'placed'
+MAX_IDEMPOTENCY_KEY_LENGTH = 100
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart cannot be checked out.
+
+    Attributes:
+        message (str): Error message for the client.
+        status (int): HTTP status code to answer with.
+        product_ids (list): Products that caused the failure, if any.
+    """
+
+    def __init__(self, message, status, product_ids=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.product_ids = product_ids or []
+
+
+def checkout(customer_id, idempotency_key, payment_id=''):
+    """
+    Places an order for every line of the customer's cart and commits.
+
+    A request repeating an `idempotency_key` the customer already used returns
+    the stored result of that checkout instead of placing new orders.
+
+    Returns:
+        Tuple of (result dict, replayed flag). The dict has 'checkout_id',
+        'orders' (order_id, product_id, quantity, price) and 'total'.
+
+    Raises:
+        CheckoutError: If the key is missing or too long (400), the cart is
+            empty (400) or a product lacks stock (409).
+    """
+    if not idempotency_key:
+        raise CheckoutError('An Idempotency-Key header is required', 400)
+    if len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise CheckoutError(f'Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters', 400)
+
+    previous = find_checkout(customer_id, idempotency_key)
+    if previous is not None:
+        return previous, True
+
+    try:
+        result = _place_orders(customer_id, idempotency_key, payment_id)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first.
+        db.session.rollback()
+        previous = find_checkout(customer_id, idempotency_key)
+        if previous is None:
+            raise
+        return previous, True
+    except Exception:
+        db.session.rollback()
+        raise
+    return result, False
+
+
+def find_checkout(customer_id, idempotency_key):
+    """Returns the stored result of the customer's checkout with this key, or None."""
+    rows = db.session.execute(
+        db.select(Checkout.id, Checkout.total, Order.id, Order.product_link, Order.quantity, Order.price)
+        .outerjoin(Order, Order.checkout_link == Checkout.id)
+        .where(Checkout.customer_link == customer_id, Checkout.idempotency_key == idempotency_key)
+        .order_by(Order.id)
+    ).all()
+    if not rows:
+        return None
+    return {
+        'checkout_id': rows[0][0],
+        'orders': [_order(order_id, product_id, quantity, price)
+                   for _, _, order_id, product_id, quantity, price in rows if order_id is not None],
+        'total': round_money(rows[0][1]),
+    }
+
+
+def _place_orders(customer_id, idempotency_key, payment_id):
+    now = datetime.utcnow()
+    # Claim the key first: the unique index turns a concurrent duplicate into an IntegrityError,
+    # and on SQLite the insert takes the write lock before the cart is read.
+    checkout_id = db.session.execute(
+        db.insert(Checkout).values(
+            customer_link=customer_id, idempotency_key=idempotency_key,
+            status=CHECKOUT_STATUS, total=0, created_at=now,
+        ).returning(Checkout.id)
+    ).scalar_one()
+
+    cart = cart_lines(customer_id)
+    # /minuscart can leave lines at quantity 0; they are cleared with the cart but never ordered.
+    lines = [line for line in cart if line['quantity'] > 0]
+    if not lines:
+        raise CheckoutError('Cart is empty', 400)
+
+    _decrement_stock(lines)
+
+    # A plain executemany: RETURNING with parameter order would insert row by row on SQLite.
+    db.session.execute(db.insert(Order), [{
+        'customer_link': customer_id,
+        'product_link': line['product_id'],
+        'checkout_link': checkout_id,
+        'quantity': line['quantity'],
+        'price': line['price_per_item'],
+        'status': ORDER_STATUS,
+        'payment_id': payment_id,
+        'created_at': now,
+    } for line in lines])
+    # Cart lines are unique per product, so the product identifies the order within the checkout.
+    order_ids = dict(db.session.execute(
+        db.select(Order.product_link, Order.id).where(Order.checkout_link == checkout_id)
+    ).all())
+    record_orders(customer_id, lines, now)
+
+    db.session.execute(
+        db.delete(Cart)
+        .where(Cart.customer_link == customer_id, Cart.id.in_([line['cart_id'] for line in cart]))
+        .execution_options(synchronize_session=False)
+    )
+
+    total = lines_total(lines)
+    db.session.execute(
+        db.update(Checkout).where(Checkout.id == checkout_id).values(total=total)
+        .execution_options(synchronize_session=False)
+    )
+    enqueue('reconcile_payment', {'checkout_id': checkout_id})
+    return {
+        'checkout_id': checkout_id,
+        'orders': [_order(order_ids[line['product_id']], line['product_id'], line['quantity'], line['price_per_item'])
+                   for line in lines],
+        'total': total,
+    }
+
+
+def _decrement_stock(lines):
+    """
+    Takes every line's quantity off its product's stock in one conditional UPDATE.
+
+    Raises:
+        CheckoutError: If any product has less stock than its line asks for.
+    """
+    quantities = {line['product_id']: line['quantity'] for line in lines}
+    wanted = db.case(quantities, value=Product.id)
+    stmt = (
+        db.update(Product.__table__)
+        .where(Product.id.in_(list(quantities)), Product.in_stock >= wanted)
+        .values(in_stock=Product.in_stock - wanted)
+        .returning(Product.id, Product.in_stock)
+    )
+    # Executed on the connection rather than the ORM session: a bulk ORM UPDATE would make
+    # model_events drop every cached product, while only these rows changed.
+    session = db.session()
+    updated = dict(session.connection().execute(stmt).all())
+    missing = sorted(set(quantities) - set(updated))
+    if missing:
+        raise CheckoutError('Insufficient stock', 409, product_ids=missing)
+    model_events.mark_changed(session, Product, updated,
+                              values={product_id: {'in_stock': stock} for product_id, stock in updated.items()})
+
+
+def _order(order_id, product_id, quantity, price):
+    return {'order_id': order_id, 'product_id': product_id, 'quantity': quantity, 'price': price}
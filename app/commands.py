@@ -0,0 +1,130 @@
+"""
+Flask CLI commands, registered on the app by create_app.
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db, hashing, ingest, jobs, migrations, sales, warmup
+
+
+@click.command('hash-benchmark')
+@click.option('--seconds', default=2.0, show_default=True, help='How long to hash for.')
+@click.option('--workers', type=int, default=None, help='Pool size; defaults to the CPU count.')
+@click.option('--method', default=None, help='werkzeug method; defaults to PASSWORD_HASH_METHOD.')
+@with_appcontext
+def hash_benchmark_command(seconds, workers, method):
+    """Reports password hashes per second, overall and per core."""
+    result = hashing.benchmark(seconds=seconds, workers=workers, method=method)
+    click.echo(f"method:         {result['method']}")
+    click.echo(f"workers:        {result['workers']}")
+    click.echo(f"hashes:         {result['hashes']} in {result['seconds']}s")
+    click.echo(f"hashes/s:       {result['hashes_per_second']}")
+    click.echo(f"hashes/s/core:  {result['hashes_per_second_per_core']}")
+
+
+@click.command('ingest-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=ingest.DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Rows upserted and committed per transaction.')
+@click.option('--checkpoint', default=None, help="Progress file; defaults to '<path>.checkpoint'.")
+@click.option('--restart', is_flag=True, help='Ignore any checkpoint and start from the first record.')
+@with_appcontext
+def ingest_products_command(path, chunk_size, checkpoint, restart):
+    """Streams the Flipkart products dataset at PATH into the Product table."""
+    def progress(stats):
+        click.echo(f"{stats['written']} rows written, {stats['skipped']} skipped "
+                   f"({stats['rows_per_second']} rows/s)")
+
+    try:
+        stats = ingest.ingest_products(path, chunk_size=chunk_size, checkpoint_path=checkpoint,
+                                       resume=not restart, progress=progress)
+    except ingest.IngestError as e:
+        raise click.ClickException(str(e))
+    if stats['resumed_from']:
+        click.echo(f"Resumed after record {stats['resumed_from']}")
+    click.echo(f"Done: {stats['read']} records read, {stats['written']} rows upserted, "
+               f"{stats['skipped']} skipped in {stats['seconds']}s ({stats['rows_per_second']} rows/s)")
+
+
+@click.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Stop after this version.')
+@with_appcontext
+def db_upgrade_command(target):
+    """Creates missing tables and applies pending schema migrations."""
+    applied = migrations.upgrade(target=target, echo=click.echo)
+    if not applied:
+        click.echo('Database is up to date')
+    click.echo(f'Schema version: {migrations.current_version()}')
+
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """Shows the applied schema version and any pending migrations."""
+    click.echo(f'Schema version: {migrations.current_version()}')
+    for version, description, _ in migrations.pending():
+        click.echo(f'Pending {version}: {description}')
+
+
+@click.command('jobs-work')
+@click.option('--workers', default=1, show_default=True, help='Worker threads in this process.')
+@click.option('--kind', 'kinds', multiple=True, help='Only run jobs of this kind; repeatable.')
+@click.option('--burst', is_flag=True, help='Run due jobs in this thread and exit instead of polling.')
+@with_appcontext
+def jobs_work_command(workers, kinds, burst):
+    """Runs background job workers until interrupted."""
+    app = current_app._get_current_object()
+    if burst:
+        processed = jobs.Worker(app, kinds=kinds).run(burst=True)
+        click.echo(f'Processed {processed} jobs')
+        return
+    pool = jobs.WorkerPool(app, workers, kinds=kinds).start()
+    click.echo(f'Started {workers} job workers; Ctrl+C to stop')
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        click.echo('Stopping job workers')
+        pool.stop()
+
+
+@click.command('jobs-status')
+@with_appcontext
+def jobs_status_command():
+    """Shows how many background jobs are in each status."""
+    for status, count in jobs.queue_stats().items():
+        click.echo(f'{status:<8} {count}')
+
+
+@click.command('warmup')
+@click.option('--step', 'steps', multiple=True, help='Only run this warmup step; repeatable.')
+@with_appcontext
+def warmup_command(steps):
+    """Runs the worker warmup steps once and reports how long each took."""
+    app = current_app._get_current_object()
+    try:
+        timings = warmup.warmup(app, steps=steps or None)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name, seconds in timings.items():
+        click.echo(f'{name:<16} {seconds * 1000:>9.1f} ms')
+
+
+@click.command('sales-rebuild')
+@with_appcontext
+def sales_rebuild_command():
+    """Recomputes the sales rollups from the order table."""
+    sales.rebuild(db.session.connection())
+    db.session.commit()
+    click.echo('Sales rollups rebuilt')
+
+
+def init_app(app):
+    app.cli.add_command(hash_benchmark_command)
+    app.cli.add_command(ingest_products_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
+    app.cli.add_command(jobs_work_command)
+    app.cli.add_command(jobs_status_command)
+    app.cli.add_command(warmup_command)
+    app.cli.add_command(sales_rebuild_command)
@@ -0,0 +1,230 @@
+"""
+Response compression negotiated with Accept-Encoding.
+
+Compressible responses of at least COMPRESS_MIN_SIZE bytes are sent with gzip,
+or brotli when the `brotli` package is installed and the client accepts it.
+Streamed responses are compressed chunk by chunk as they are produced.
+
+Catalog views decorated with `precompressed` also keep their compressed bodies
+in a bounded LRU cache keyed by the catalog version, the request parameters
+and the encoding. The unfiltered listing is cached on first use, other
+requests once they have been seen COMPRESS_CACHE_MIN_REQUESTS times; a cache
+hit sends the stored buffer without running the view or encoding anything.
+A catalog change moves to a new version, so old entries are never served
+again and age out of the LRU.
+
+Configuration:
+    COMPRESS_ENABLED: Set to False to send every response uncompressed.
+    COMPRESS_MIN_SIZE: Smallest body, in bytes, worth compressing.
+    COMPRESS_LEVEL: gzip level (1-9).
+    COMPRESS_BROTLI_QUALITY: brotli quality (0-11).
+    COMPRESS_MIMETYPES: Mimetypes that are compressed.
+    COMPRESS_CACHE_SIZE: Precompressed bodies kept per process.
+    COMPRESS_CACHE_MIN_REQUESTS: Requests for the same parameters before their body is cached.
+    COMPRESS_CACHE_MAX_BYTES: Largest compressed body that is cached.
+"""
+import functools
+import hashlib
+import zlib
+
+from flask import current_app, request
+
+from app.cache import LRUCache
+from app.catalog_version import current_version
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+_CACHE_KEY = 'compressed_bodies'
+_REQUESTS_KEY = 'compressed_bodies.requests'
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+DEFAULT_CACHE_SIZE = 16
+DEFAULT_CACHE_MIN_REQUESTS = 2
+DEFAULT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+
+def init_app(app):
+    app.extensions[_CACHE_KEY] = LRUCache(maxsize=app.config.get('COMPRESS_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    # How often each parameter set was requested; only used to decide what is worth caching.
+    app.extensions[_REQUESTS_KEY] = LRUCache(maxsize=1024)
+    app.after_request(compress_response)
+
+
+def available_encodings():
+    """Encodings this process can produce, in order of preference."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate():
+    """Returns the encoding to use for the current request, or None to send it uncompressed."""
+    if not current_app.config.get('COMPRESS_ENABLED', True):
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+
+class _Compressor:
+    """Incremental compressor with a common interface for gzip and brotli."""
+
+    def __init__(self, encoding):
+        config = current_app.config
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=config.get('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+            self._zlib = None
+        else:
+            # wbits=31 writes a gzip header and trailer (with a zero mtime, so output is reproducible).
+            self._zlib = zlib.compressobj(config.get('COMPRESS_LEVEL', DEFAULT_LEVEL), zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._zlib.compress(data) if self._zlib is not None else self._brotli.process(data)
+
+    def finish(self):
+        return self._zlib.flush() if self._zlib is not None else self._brotli.finish()
+
+
+def compress(data, encoding):
+    """Compresses `data` (bytes) with `encoding` in one call."""
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _is_compressible(response):
+    mimetypes = current_app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+    return (response.mimetype in mimetypes and 200 <= response.status_code < 300
+            and response.status_code != 204 and 'Content-Encoding' not in response.headers)
+
+
+def _encode(response, encoding, store=None):
+    """
+    Compresses `response` in place with `encoding`. `store`, when given, is
+    called with the complete compressed body once it has been produced.
+    """
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        source = response.response
+        compressor = _Compressor(encoding)
+
+        def generate():
+            parts = [] if store is not None else None
+            try:
+                for chunk in chunks:
+                    data = compressor.compress(chunk)
+                    if data:
+                        if parts is not None:
+                            parts.append(data)
+                        yield data
+                data = compressor.finish()
+                if parts is not None:
+                    parts.append(data)
+                    store(b''.join(parts))
+                yield data
+            finally:
+                if hasattr(source, 'close'):
+                    source.close()
+
+        response.response = generate()
+        response.headers.pop('Content-Length', None)
+    else:
+        body = compress(response.get_data(), encoding)
+        response.set_data(body)
+        if store is not None:
+            store(body)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response):
+    """after_request hook compressing responses that no view has compressed already."""
+    if 'Content-Encoding' in response.headers:
+        # Compressed by `precompressed`, before catalog_version.conditional added the ETag.
+        _weaken_etag(response)
+        return response
+    if request.method == 'HEAD' or not _is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough:
+        return response
+    if not response.is_streamed:
+        min_size = current_app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        if response.content_length is not None and response.content_length < min_size:
+            return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+    _encode(response, encoding)
+    _weaken_etag(response)
+    return response
+
+
+def _weaken_etag(response):
+    # The compressed body is a different byte sequence from the identity one, so only a weak
+    # validator may be shared between them.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _request_key():
+    params = sorted((key, value) for key in request.args for value in request.args.getlist(key))
+    if request.method == 'POST':
+        params.append(('', sorted((key, value) for key in request.form for value in request.form.getlist(key))))
+    return hashlib.sha1(repr((request.method, request.path, params)).encode()).hexdigest()
+
+
+def _worth_caching(key):
+    """True for the unfiltered listing, and for other requests once they are popular enough."""
+    if request.method == 'GET' and not request.args:
+        return True
+    counts = current_app.extensions[_REQUESTS_KEY]
+    seen = counts.get(key, 0, count=False) + 1
+    counts.set(key, seen)
+    return seen >= current_app.config.get('COMPRESS_CACHE_MIN_REQUESTS', DEFAULT_CACHE_MIN_REQUESTS)
+
+
+def precompressed(view):
+    """
+    Decorator serving a catalog view's compressed responses from the
+    precompressed body cache, and filling it on a miss. Apply it below
+    `catalog_version.conditional`, so revalidations still answer 304 first.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        encoding = negotiate() if request.method in ('GET', 'POST') else None
+        if encoding is None:
+            return view(*args, **kwargs)
+
+        cache = current_app.extensions[_CACHE_KEY]
+        request_key = _request_key()
+        key = (current_version()[0], request_key, encoding)
+        cached = cache.get(key)
+        if cached is not None:
+            body, mimetype = cached
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if not _is_compressible(response) or response.status_code != 200:
+            return response
+        min_size = current_app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        if not response.is_streamed and response.content_length < min_size:
+            return response
+
+        store = None
+        if _worth_caching(request_key):
+            max_bytes = current_app.config.get('COMPRESS_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES)
+            mimetype = response.mimetype
+
+            def store(body):
+                if len(body) <= max_bytes:
+                    cache.set(key, (body, mimetype))
+        return _encode(response, encoding, store)
+    return wrapper
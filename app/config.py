@@ -0,0 +1,165 @@
+"""
+Named configuration profiles for create_app.
+
+The profile is picked from `test_config['PROFILE']`, then the APP_PROFILE
+environment variable ('test' when test_config sets TESTING). Without either it
+is 'prod' when CONFIG is set, as on deployments that predate the profiles, and
+'dev' otherwise. The CONFIG and KEY environment variables supply the database
+URI and secret key; values in test_config override everything.
+
+Only the test profile has a fixed secret key. The dev profile makes up a random
+one per process when KEY is unset, and the prod profile refuses to start
+without one.
+"""
+import os
+import secrets
+
+
+class Config:
+    SECRET_KEY = None
+    SQLALCHEMY_DATABASE_URI = None
+
+    # Pool settings for server databases; SQLite uses SQLAlchemy's per-file defaults.
+    SQLALCHEMY_POOL_SIZE = 5
+    SQLALCHEMY_MAX_OVERFLOW = 10
+    SQLALCHEMY_POOL_TIMEOUT = 30
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    SQLALCHEMY_POOL_PRE_PING = True
+
+    # Read replica; see app.routing. None sends every query to the primary.
+    SQLALCHEMY_REPLICA_URI = None
+    REPLICA_LAG_QUERY = None
+    REPLICA_MAX_LAG = 5.0
+    REPLICA_CHECK_INTERVAL = 10.0
+    REPLICA_STICKY_SECONDS = 5.0
+
+    # 'auto' encodes responses with orjson when it is installed; see app.serialization.
+    JSON_PROVIDER = 'auto'
+
+    # HTTP caching of catalog responses; see app.catalog_version.
+    CATALOG_VERSION_TTL = 1.0
+    CATALOG_CACHE_CONTROL = 'public, max-age=60'
+
+    # Response compression and the precompressed catalog cache; see app.compression.
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_CACHE_SIZE = 16
+    COMPRESS_CACHE_MIN_REQUESTS = 2
+    COMPRESS_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+    # Completions returned by /productsearch/suggest when no limit is given.
+    SUGGEST_LIMIT = 10
+
+    # Largest page of /orders.
+    ORDERS_MAX_PAGE_SIZE = 100
+
+    # Worker warmup; see app.warmup.
+    WARMUP_ON_START = False
+    WARMUP_STEPS = ('catalog_version', 'search_index', 'price_index', 'suggest', 'product_cache', 'listing')
+
+    # Web server processes on this machine; each one's password hashing pool
+    # defaults to its share of the CPUs (see app.hashing). Set from WEB_CONCURRENCY.
+    WEB_WORKERS = 1
+
+    # Admission control for the password-hashing auth endpoints; see app.admission.
+    ADMISSION_ENABLED = True
+    ADMISSION_CLIENT_RATE = (5.0, 20)
+    ADMISSION_ACCOUNT_RATE = (0.5, 10)
+    ADMISSION_CONCURRENCY = {'auth.login': 4, 'auth.sign_up': 2, 'auth.change_password': 2}
+    ADMISSION_DEFAULT_CONCURRENCY = 4
+    ADMISSION_QUEUE_SIZE = 8
+    ADMISSION_QUEUE_TIMEOUT = 0.5
+    ADMISSION_RETRY_AFTER = 1
+    ADMISSION_MAX_BUCKETS = 100000
+
+    # Instrumentation; see app.instrumentation.
+    METRICS_ENABLED = True
+    SLOW_QUERY_THRESHOLD = 0.1
+    SLOW_QUERY_EXPLAIN = False
+    SLOW_QUERY_LOG_PARAMETERS = False
+
+    # Background jobs; see app.jobs. Without in-app workers, run `flask jobs-work`.
+    JOB_MAX_ATTEMPTS = 5
+    JOB_VISIBILITY_TIMEOUT = 300
+    JOB_RETRY_BACKOFF = 10
+    JOB_RETRY_BACKOFF_MAX = 3600
+    JOB_POLL_INTERVAL = 1.0
+    JOB_IN_APP_WORKERS = 0
+
+    # Applied to every new SQLite connection. WAL lets readers run alongside the
+    # cart writer; NORMAL sync is durable in WAL mode except on power loss.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+    }
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    SLOW_QUERY_EXPLAIN = True
+    SLOW_QUERY_LOG_PARAMETERS = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///ecommerce.db'
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'testing'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PASSWORD_HASH_WORKERS = 0
+
+
+class ProductionConfig(Config):
+    # /metrics has no authentication; turn it on where only the scraper can reach it.
+    METRICS_ENABLED = False
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_MAX_OVERFLOW = 20
+
+
+PROFILES = {
+    'dev': DevelopmentConfig,
+    'test': TestingConfig,
+    'prod': ProductionConfig,
+}
+
+
+def load_config(app, test_config=None):
+    """Fills app.config from the selected profile, the environment and `test_config`."""
+    test_config = test_config or {}
+    profile = test_config.get('PROFILE') or ('test' if test_config.get('TESTING') else None)
+    profile = profile or os.getenv('APP_PROFILE') or ('prod' if os.getenv('CONFIG') else 'dev')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown APP_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
+
+    app.config.from_object(PROFILES[profile])
+    app.config['PROFILE'] = profile
+    if os.getenv('CONFIG') and profile != 'test':
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('CONFIG')
+    if os.getenv('KEY'):
+        app.config['SECRET_KEY'] = os.getenv('KEY')
+    if os.getenv('WEB_CONCURRENCY'):
+        app.config['WEB_WORKERS'] = int(os.getenv('WEB_CONCURRENCY'))
+    app.config.update(test_config)
+    if not app.config['SECRET_KEY']:
+        if profile != 'dev':
+            raise RuntimeError(f'The {profile} profile needs a secret key; set the KEY environment variable')
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+
+
+def engine_options(config, uri=None):
+    """Pool options for `uri` (default: the primary database); SQLite keeps SQLAlchemy's defaults."""
+    if (uri or config['SQLALCHEMY_DATABASE_URI']).startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['SQLALCHEMY_POOL_SIZE'],
+        'max_overflow': config['SQLALCHEMY_MAX_OVERFLOW'],
+        'pool_timeout': config['SQLALCHEMY_POOL_TIMEOUT'],
+        'pool_recycle': config['SQLALCHEMY_POOL_RECYCLE'],
+        'pool_pre_ping': config['SQLALCHEMY_POOL_PRE_PING'],
+    }
@@ -0,0 +1,38 @@
+"""
+Engine set-up that Flask-SQLAlchemy doesn't do itself.
+"""
+import logging
+
+from sqlalchemy import event
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+
+def install_sqlite_pragmas(app):
+    """Runs the SQLITE_PRAGMAS of `app` on every new connection of its SQLite engines."""
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_pragmas(engine, app.config.get('SQLITE_PRAGMAS'))
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Runs `pragmas` on every new connection of `engine`, if it is a SQLite engine."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                try:
+                    cursor.execute(f'PRAGMA {name} = {value}')
+                except Exception:
+                    # e.g. journal_mode on a read-only replica connection
+                    logger.warning('Could not set PRAGMA %s = %s', name, value, exc_info=True)
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
@@ -0,0 +1,173 @@
+"""
+Password hashing off the request thread.
+
+Hashes are computed by werkzeug in a bounded process pool, so a burst of
+sign-ups or logins uses every core without holding the GIL of the worker that
+is also serving cart and search requests. The algorithm and its cost come from
+PASSWORD_HASH_METHOD; stored hashes made with a different method are upgraded
+on the next successful login (see needs_rehash).
+
+Configuration:
+    PASSWORD_HASH_METHOD: werkzeug method string, e.g. 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'.
+    PASSWORD_HASH_WORKERS: Pool size; 0 hashes inline on the calling thread. Defaults to
+        default_workers(WEB_WORKERS).
+    PASSWORD_HASH_TIMEOUT: Seconds to wait for a pool slot and for the result.
+    WEB_WORKERS: Web server processes on the machine (WEB_CONCURRENCY, as gunicorn reads it).
+
+Every web server process starts its own pool, so the pools of all of them share
+one budget of the machine's cores: each defaults to its share of the CPU count,
+and an explicit PASSWORD_HASH_WORKERS should be sized the same way.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+DEFAULT_TIMEOUT = 10.0
+
+_DEFAULT_PARAMS = {
+    'pbkdf2': ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)],
+    'scrypt': [str(2 ** 15), '8', '1'],
+}
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+class HashingUnavailable(Exception):
+    """Raised when no hashing slot frees up, or no result arrives, within PASSWORD_HASH_TIMEOUT."""
+
+
+def normalize_method(method):
+    """Expands a werkzeug method string with its default parameters, e.g. 'pbkdf2' -> 'pbkdf2:sha256:600000'."""
+    name, *params = method.split(':')
+    defaults = _DEFAULT_PARAMS.get(name)
+    if defaults is None:
+        return method
+    return ':'.join([name] + params + defaults[len(params):])
+
+
+def _setting(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def configured_method():
+    return normalize_method(_setting('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+
+
+def default_workers(web_workers=1):
+    """Pool size that keeps `web_workers` processes' pools within the CPU count together."""
+    return max(1, (os.cpu_count() or 1) // max(1, web_workers))
+
+
+def _workers():
+    workers = _setting('PASSWORD_HASH_WORKERS', None)
+    if workers is None:
+        return default_workers(_setting('WEB_WORKERS', 1))
+    return workers
+
+
+def _get_pool(workers):
+    global _pool, _pool_pid, _pool_slots
+    # A pool inherited through fork (e.g. gunicorn preload) belongs to the parent.
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+            # Bound the work queued behind the pool to two tasks per worker.
+            _pool_slots = threading.BoundedSemaphore(workers * 2)
+    return _pool
+
+
+def shutdown():
+    """Stops the hashing pool of this process, if one was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=True)
+        _pool = None
+
+
+def _run(fn, *args):
+    workers = _workers()
+    if workers <= 0:
+        return fn(*args)
+
+    pool = _get_pool(workers)
+    timeout = _setting('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT)
+    slots = _pool_slots
+    if not slots.acquire(timeout=timeout):
+        raise HashingUnavailable('No password hashing capacity available')
+    try:
+        future = pool.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingUnavailable('Password hashing timed out') from None
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """Returns a salted hash of `password` made with the configured method."""
+    return _run(generate_password_hash, password, configured_method())
+
+
+def verify_password(pwhash, password):
+    """Checks `password` against a stored hash made with any werkzeug method."""
+    if not pwhash:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True when `pwhash` was not made with the configured method and cost."""
+    return normalize_method(pwhash.split('$', 1)[0]) != configured_method()
+
+
+def benchmark(seconds=2.0, workers=None, method=None):
+    """
+    Measures hashing throughput of the pool for roughly `seconds`.
+
+    Returns:
+        Dict with 'method', 'workers', 'hashes', 'seconds', 'hashes_per_second'
+        and 'hashes_per_second_per_core'.
+    """
+    method = normalize_method(method or configured_method())
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # Start every worker before timing, so process start-up isn't measured.
+        list(pool.map(generate_password_hash, ['warmup'] * workers, [method] * workers))
+
+        hashes = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            batch = [pool.submit(generate_password_hash, 'benchmark', method) for _ in range(workers)]
+            for future in batch:
+                future.result()
+            hashes += len(batch)
+        elapsed = time.perf_counter() - started
+
+    rate = hashes / elapsed
+    return {
+        'method': method,
+        'workers': workers,
+        'hashes': hashes,
+        'seconds': round(elapsed, 3),
+        'hashes_per_second': round(rate, 2),
+        'hashes_per_second_per_core': round(rate / workers, 2),
+    }
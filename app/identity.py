@@ -0,0 +1,87 @@
+"""
+Cached identity resolution for Flask-Login's user_loader.
+
+The loader runs on every authenticated request. Instead of rebuilding a
+Customer from the database each time, it returns a detached CustomerIdentity
+snapshot kept in a short-TTL LRU cache. Committed Customer updates and deletes
+(password changes, profile edits) evict the customer's entry.
+"""
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+
+from app import db, model_events
+from app.cache import LRUCache
+from app.models import Customer
+
+
+_EXTENSION_KEY = 'identity_cache'
+
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 60
+
+
+class CustomerIdentity(UserMixin):
+    """Read-only stand-in for a logged-in Customer, safe to share between requests."""
+
+    __slots__ = ('id', 'email', 'username', 'date_joined')
+
+    def __init__(self, id, email, username, date_joined):
+        self.id = id
+        self.email = email
+        self.username = username
+        self.date_joined = date_joined
+
+    def __repr__(self):
+        return '<CustomerIdentity %r>' % self.id
+
+
+def init_app(app):
+    app.extensions[_EXTENSION_KEY] = LRUCache(
+        maxsize=app.config.get('IDENTITY_CACHE_SIZE', DEFAULT_SIZE),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL),
+    )
+
+
+def get_cache():
+    return current_app.extensions[_EXTENSION_KEY]
+
+
+def load_identity(user_id):
+    """Returns the CustomerIdentity for `user_id`, or None if there is no such customer."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    cache = get_cache()
+    identity = cache.get(user_id)
+    if identity is None:
+        row = db.session.execute(
+            db.select(Customer.id, Customer.email, Customer.username, Customer.date_joined)
+            .where(Customer.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        identity = CustomerIdentity(*row)
+        cache.set(user_id, identity)
+    return identity
+
+
+def invalidate(user_id):
+    get_cache().pop(int(user_id))
+
+
+def _on_customer_change(changes):
+    if not has_app_context():
+        return
+    cache = current_app.extensions.get(_EXTENSION_KEY)
+    if cache is None:
+        return
+    if changes.reset:
+        cache.clear()
+        return
+    for customer_id in list(changes.upserted) + list(changes.deleted):
+        cache.pop(customer_id)
+
+
+model_events.subscribe(Customer, _on_customer_change)
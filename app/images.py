@@ -0,0 +1,125 @@
+"""
+Product image URLs.
+
+The dataset's image list reaches Product.product_picture as its Python string
+form ("['https://...', 'https://...']"), up to 1000 characters that clients had
+to parse themselves. The URLs are now also stored one per row in ProductImage,
+and the first one in Product.primary_image, which is what list endpoints send.
+product_picture is kept as loaded, so the parsing can be redone.
+
+Both follow product_picture: ORM inserts and updates through the mapper
+listeners of watch_pictures, Core inserts through the primary_image column
+default and the ingest's replace_images. Products written without their
+ProductImage rows (bulk inserts) still get their images from product_picture
+in images_of.
+"""
+import ast
+
+from sqlalchemy import event, inspect
+
+from app import db
+
+
+MAX_URL_LENGTH = 500
+
+
+def parse_images(value):
+    """
+    Returns the image URLs stored in a product_picture value, in order.
+
+    Accepts the string form of a list, as the notebook and the ingest store
+    it, or a single URL. Unparseable lists and over-long URLs are dropped.
+    """
+    if isinstance(value, (list, tuple)):
+        urls = value
+    elif not isinstance(value, str) or not value.strip():
+        return []
+    elif value.lstrip().startswith('['):
+        try:
+            urls = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return []
+        if not isinstance(urls, (list, tuple)):
+            return []
+    else:
+        urls = [value]
+    return [url.strip() for url in urls
+            if isinstance(url, str) and url.strip() and len(url.strip()) <= MAX_URL_LENGTH]
+
+
+def primary_image(value):
+    """Returns the first image URL of a product_picture value, or None."""
+    urls = parse_images(value)
+    return urls[0] if urls else None
+
+
+def default_primary_image(context):
+    """Column default for Product.primary_image: the first URL of the row's product_picture."""
+    return primary_image(context.get_current_parameters().get('product_picture'))
+
+
+def replace_images(connection, images):
+    """
+    Replaces the ProductImage rows of every product in `images` ({product id: [url, ...]})
+    with one DELETE and one executemany INSERT, on `connection`.
+    """
+    from app.models import ProductImage  # app.models imports this module for the column default
+
+    if not images:
+        return
+    table = ProductImage.__table__
+    connection.execute(table.delete().where(table.c.product_link.in_(list(images))))
+    rows = [{'product_link': product_id, 'position': position, 'url': url}
+            for product_id, urls in images.items() for position, url in enumerate(urls)]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def images_of(product_ids, chunk_size=500):
+    """
+    Returns {product id: [url, ...]} for the given products, with one query per
+    `chunk_size` ids, plus one for products without ProductImage rows.
+    """
+    from app.models import Product, ProductImage
+
+    found = {}
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        rows = db.session.execute(
+            db.select(ProductImage.product_link, ProductImage.url)
+            .where(ProductImage.product_link.in_(product_ids[start:start + chunk_size]))
+            .order_by(ProductImage.product_link, ProductImage.position)
+        )
+        for product_id, url in rows:
+            found.setdefault(product_id, []).append(url)
+
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    for start in range(0, len(missing), chunk_size):
+        rows = db.session.execute(
+            db.select(Product.id, Product.product_picture).where(Product.id.in_(missing[start:start + chunk_size]))
+        )
+        for product_id, picture in rows:
+            found[product_id] = parse_images(picture)
+    return found
+
+
+def _picture_changed(target):
+    return inspect(target).attrs.product_picture.history.has_changes()
+
+
+def _set_primary_image(mapper, connection, target):
+    if target.primary_image is None or _picture_changed(target):
+        target.primary_image = primary_image(target.product_picture)
+
+
+def _store_images(mapper, connection, target):
+    if _picture_changed(target):
+        replace_images(connection, {target.id: parse_images(target.product_picture)})
+
+
+def watch_pictures(model):
+    """Keeps `model`'s primary_image and ProductImage rows in step with product_picture on ORM flushes."""
+    event.listen(model, 'before_insert', _set_primary_image)
+    event.listen(model, 'before_update', _set_primary_image)
+    event.listen(model, 'after_insert', _store_images)
+    event.listen(model, 'after_update', _store_images)
@@ -0,0 +1,217 @@
+"""
+Streaming catalog ingestion for the Flipkart fashion products dataset.
+
+Replaces the load step of cleaning.ipynb. Records are parsed one at a time from
+a JSON array (or JSON Lines) file, cleaned the way the notebook does, and
+upserted into Product by their Flipkart 'pid' in bounded transactions, so the
+live catalog stays readable and memory does not grow with the file. Progress is
+checkpointed after every committed chunk; an interrupted run picks up where it
+stopped. Each chunk also replaces its products' ProductImage rows, in the same
+transaction.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from app import db
+from app.images import parse_images, primary_image, replace_images
+from app.models import Product
+from app.sql import upsert
+
+
+DEFAULT_CHUNK_SIZE = 1000
+_READ_SIZE = 1 << 16
+
+# Columns the notebook kept, keyed by their name in the dataset.
+COLUMN_MAP = {
+    'pid': 'sku',
+    'title': 'product_name',
+    'selling_price': 'current_price',
+    'actual_price': 'previous_price',
+    'out_of_stock': 'in_stock',
+    'images': 'product_picture',
+    'crawled_at': 'date_added',
+}
+
+_DATE_FORMATS = ('%d/%m/%Y, %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+
+class IngestError(Exception):
+    """Raised when the input file cannot be parsed."""
+
+
+def iter_json_records(fp, read_size=_READ_SIZE):
+    """
+    Yields the objects of a JSON array, or of a JSON Lines stream, read incrementally from `fp`.
+
+    Only a read buffer and the record being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(read_size)
+    position = 0
+    eof = not buffer
+
+    def skip(chars):
+        nonlocal buffer, position, eof
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            buffer, position = fp.read(read_size), 0
+            eof = not buffer
+
+    skip(' \t\r\n')
+    in_array = position < len(buffer) and buffer[position] == '['
+    if in_array:
+        position += 1
+
+    while True:
+        skip(' \t\r\n,' if in_array else ' \t\r\n')
+        if position >= len(buffer):
+            if in_array:
+                raise IngestError('Unexpected end of file inside the JSON array')
+            return
+        if in_array and buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise IngestError(f'Malformed JSON near character {position}') from None
+            more = fp.read(read_size)
+            eof = not more
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        position = end
+        if position > read_size:
+            buffer, position = buffer[position:], 0
+        yield record
+
+
+def _price(value):
+    return float(str(value).replace(',', '').strip())
+
+
+def _date(value):
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def clean_record(record):
+    """
+    Maps a dataset record onto Product columns, or returns None to skip it.
+
+    Like the notebook, records with any missing or empty field are dropped and
+    the image list is stored as its string form; its first URL also goes to
+    primary_image. Prices lose their thousands separators, and 'out_of_stock'
+    becomes a 0/1 in_stock count.
+    """
+    if not isinstance(record, dict):
+        return None
+    if any(record.get(field) in (None, '') for field in COLUMN_MAP):
+        return None
+    if any(value in (None, '') for value in record.values()):
+        return None
+    try:
+        row = {
+            'sku': str(record['pid']),
+            'product_name': str(record['title']),
+            'current_price': _price(record['selling_price']),
+            'previous_price': _price(record['actual_price']),
+            'in_stock': 0 if record['out_of_stock'] else 1,
+            'product_picture': str(record['images']),
+            'primary_image': primary_image(record['images']),
+            'date_added': _date(record['crawled_at']) or datetime.utcnow(),
+        }
+    except ValueError:
+        return None
+    return row
+
+
+def _write_chunk(rows):
+    stmt = upsert(Product)
+    updated = {column: stmt.excluded[column] for column in rows[0] if column not in ('sku', 'date_added')}
+    stmt = stmt.on_conflict_do_update(index_elements=[Product.sku], set_=updated)
+    db.session.execute(stmt, rows)
+    ids = dict(db.session.execute(
+        db.select(Product.sku, Product.id).where(Product.sku.in_([row['sku'] for row in rows]))
+    ).all())
+    replace_images(db.session.connection(),
+                   {ids[row['sku']]: parse_images(row['product_picture']) for row in rows})
+    db.session.commit()
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp).get('records', 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(path, source, records):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump({'source': os.path.abspath(source), 'records': records}, fp)
+    os.replace(tmp_path, path)
+
+
+def ingest_products(path, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None, resume=True, progress=None):
+    """
+    Streams `path` into the Product table.
+
+    Parameters:
+        path (str): Dataset file, a JSON array or JSON Lines.
+        chunk_size (int): Rows written and committed per transaction.
+        checkpoint_path (str): Where progress is recorded; defaults to '<path>.checkpoint'.
+        resume (bool): Skip the records a previous interrupted run already committed.
+        progress (callable): Called with the running stats dict after every chunk.
+
+    Returns:
+        Dict with 'read', 'skipped', 'written', 'resumed_from', 'seconds' and 'rows_per_second'.
+    """
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+    resumed_from = _read_checkpoint(checkpoint_path) if resume else 0
+    stats = {'read': 0, 'skipped': 0, 'written': 0, 'resumed_from': resumed_from}
+    started = time.perf_counter()
+
+    def flush(chunk):
+        # Keyed by sku so a chunk never upserts the same product twice.
+        _write_chunk(list(chunk.values()))
+        stats['written'] += len(chunk)
+        elapsed = time.perf_counter() - started
+        stats['seconds'] = round(elapsed, 3)
+        stats['rows_per_second'] = round(stats['written'] / elapsed, 1) if elapsed else 0.0
+
+    stats['seconds'] = 0.0
+    stats['rows_per_second'] = 0.0
+    chunk = {}
+    with open(path, encoding='utf-8') as fp:
+        for position, record in enumerate(iter_json_records(fp), start=1):
+            if position <= resumed_from:
+                continue
+            stats['read'] += 1
+            row = clean_record(record)
+            if row is None:
+                stats['skipped'] += 1
+            else:
+                chunk[row['sku']] = row
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = {}
+                _write_checkpoint(checkpoint_path, path, position)
+                if progress is not None:
+                    progress(stats)
+        if chunk:
+            flush(chunk)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return stats
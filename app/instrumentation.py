@@ -0,0 +1,311 @@
+"""
+Per-request instrumentation and a Prometheus `/metrics` endpoint.
+
+Every SQL statement is counted and timed through the engine's
+before/after_cursor_execute events and attributed to the request that ran it.
+When a request finishes (after any streamed body), its latency, query count
+and query time are recorded per endpoint. Statements slower than
+SLOW_QUERY_THRESHOLD are logged with the route that issued them, optionally with
+their bound parameters (which hold password hashes and emails, so only in
+development) and the database's query plan.
+
+Metrics live in the worker process; with several workers each one exposes its
+own counters, which Prometheus aggregates per instance.
+
+Configuration:
+    METRICS_ENABLED: Serve GET /metrics.
+    SLOW_QUERY_THRESHOLD: Seconds after which a statement is logged; None disables the log.
+    SLOW_QUERY_EXPLAIN: Also log the EXPLAIN output of slow SELECTs (meant for development).
+    SLOW_QUERY_LOG_PARAMETERS: Log the bound parameters of slow statements instead of
+        their count (meant for development).
+"""
+import bisect
+import logging
+import threading
+import time
+
+from flask import Blueprint, Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('app.slow_queries')
+
+instrumentation = Blueprint('instrumentation', __name__)
+
+_EXTENSION_KEY = 'instrumentation'
+_START_KEY = 'instrumentation_query_start'
+
+DEFAULT_SLOW_QUERY_THRESHOLD = 0.1
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+_MAX_LOGGED_PARAMETERS = 500
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense; not thread-safe on its own."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # bisect_left puts a value equal to a bound into that bound's bucket (le semantics).
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns (upper bound, cumulative count) pairs, ending with +Inf."""
+        running = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+
+class Metrics:
+    """Request, query and slow-query metrics for one app, plus registered collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}         # (endpoint, method, status) -> count
+        self.latency = {}          # (endpoint, method) -> Histogram of seconds
+        self.queries = {}          # endpoint -> Histogram of statements per request
+        self.query_seconds = {}    # endpoint -> total seconds spent in SQL
+        self.slow_queries = {}     # endpoint -> count
+        self.collectors = []
+
+    def observe_request(self, endpoint, method, status, seconds, queries, query_seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault((endpoint, method), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(queries)
+            self.query_seconds[endpoint] = self.query_seconds.get(endpoint, 0.0) + query_seconds
+
+    def observe_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries[endpoint] = self.slow_queries.get(endpoint, 0) + 1
+
+    def register_collector(self, collector):
+        """
+        Adds a callable that contributes extra metric families to /metrics.
+
+        The callable returns an iterable of (name, type, help, samples) tuples,
+        where samples is a list of (labels dict, value) pairs.
+        """
+        self.collectors.append(collector)
+
+    def families(self):
+        with self._lock:
+            families = [
+                ('http_requests_total', 'counter', 'Requests by endpoint, method and status.', [
+                    ({'endpoint': endpoint, 'method': method, 'status': str(status)}, count)
+                    for (endpoint, method, status), count in sorted(self.requests.items())
+                ]),
+                _histogram_family('http_request_duration_seconds', 'Request latency including streamed bodies.', {
+                    (('endpoint', endpoint), ('method', method)): histogram
+                    for (endpoint, method), histogram in self.latency.items()
+                }),
+                _histogram_family('db_queries_per_request', 'SQL statements executed per request.', {
+                    (('endpoint', endpoint),): histogram for endpoint, histogram in self.queries.items()
+                }),
+                ('db_query_seconds_total', 'counter', 'Time spent executing SQL, by endpoint.', [
+                    ({'endpoint': endpoint}, seconds) for endpoint, seconds in sorted(self.query_seconds.items())
+                ]),
+                ('db_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_THRESHOLD.', [
+                    ({'endpoint': endpoint}, count) for endpoint, count in sorted(self.slow_queries.items())
+                ]),
+            ]
+        for collector in self.collectors:
+            families.extend(collector())
+        return families
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, kind, help_text, samples in self.families():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                labels = dict(labels)
+                sample_name = labels.pop('__name__', name)
+                lines.append(f'{sample_name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_family(name, help_text, histograms):
+    samples = []
+    for label_pairs, histogram in sorted(histograms.items()):
+        labels = dict(label_pairs)
+        for bound, count in histogram.cumulative():
+            samples.append(({'__name__': f'{name}_bucket', **labels, 'le': _number(bound)}, count))
+        samples.append(({'__name__': f'{name}_sum', **labels}, histogram.sum))
+        samples.append(({'__name__': f'{name}_count', **labels}, histogram.count))
+    return name, 'histogram', help_text, samples
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+
+def init_app(app, db):
+    metrics = Metrics()
+    app.extensions[_EXTENSION_KEY] = metrics
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    router = app.extensions.get('db_routing')
+    if router is not None and router.engine is not None:
+        engines.append(router.engine)
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if router is not None:
+        metrics.register_collector(lambda: [
+            ('db_routing_events_total', 'counter', 'Primary/replica routing decisions and query counts.', [
+                ({'event': key}, value) for key, value in sorted(router.stats.items())
+            ]),
+        ])
+
+    metrics.register_collector(lambda: _cache_families(app.extensions))
+
+    @app.before_request
+    def start_request_timer():
+        g._instrumentation_started = time.perf_counter()
+        g._instrumentation_queries = 0
+        g._instrumentation_query_seconds = 0.0
+
+    @app.after_request
+    def remember_status(response):
+        g._instrumentation_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.get('_instrumentation_started')
+        if started is None:
+            return
+        status = 500 if exc is not None else g.get('_instrumentation_status', 500)
+        metrics.observe_request(
+            _endpoint(), request.method, status, time.perf_counter() - started,
+            g.get('_instrumentation_queries', 0), g.get('_instrumentation_query_seconds', 0.0),
+        )
+
+
+def _cache_families(extensions):
+    from app.cache import LRUCache
+
+    caches = sorted((key, value.stats()) for key, value in extensions.items() if isinstance(value, LRUCache))
+    return [
+        ('cache_entries', 'gauge', 'Entries held by each in-process cache.',
+         [({'cache': key}, stats['size']) for key, stats in caches]),
+        ('cache_hits_total', 'counter', 'Cache lookups that found a live entry.',
+         [({'cache': key}, stats['hits']) for key, stats in caches]),
+        ('cache_misses_total', 'counter', 'Cache lookups that missed or found an expired entry.',
+         [({'cache': key}, stats['misses']) for key, stats in caches]),
+        ('cache_evictions_total', 'counter', 'Entries evicted to stay within maxsize.',
+         [({'cache': key}, stats['evictions']) for key, stats in caches]),
+    ]
+
+
+def get_metrics():
+    return current_app.extensions[_EXTENSION_KEY]
+
+
+def _endpoint():
+    # Unmatched URLs share one label so 404 scans cannot grow the metric set.
+    return request.endpoint or 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if not has_request_context():
+        return
+
+    g._instrumentation_queries = g.get('_instrumentation_queries', 0) + 1
+    g._instrumentation_query_seconds = g.get('_instrumentation_query_seconds', 0.0) + elapsed
+
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD', DEFAULT_SLOW_QUERY_THRESHOLD)
+    if threshold is None or elapsed < threshold:
+        return
+    current_app.extensions[_EXTENSION_KEY].observe_slow_query(_endpoint())
+
+    plan = None
+    if current_app.config.get('SLOW_QUERY_EXPLAIN') and not executemany:
+        plan = _explain(conn, statement, parameters)
+    params = _format_parameters(parameters, current_app.config.get('SLOW_QUERY_LOG_PARAMETERS', False))
+    slow_query_logger.warning(
+        'Slow query (%.1f ms) in %s %s [%s]: %s; parameters: %s%s',
+        elapsed * 1000, request.method,
+        request.url_rule.rule if request.url_rule is not None else request.path,
+        request.blueprint or 'app', statement, params,
+        f'\nplan:\n{plan}' if plan else '',
+    )
+
+
+def _format_parameters(parameters, reveal):
+    """Returns the parameters for the slow-query log: their repr when `reveal`, otherwise only how many there are."""
+    if not reveal:
+        count = len(parameters) if isinstance(parameters, (list, tuple, dict)) else 0
+        return f'<{count} redacted>'
+    params = repr(parameters)
+    if len(params) > _MAX_LOGGED_PARAMETERS:
+        params = params[:_MAX_LOGGED_PARAMETERS] + '...'
+    return params
+
+
+def _explain(conn, statement, parameters):
+    """Returns the query plan for a SELECT as text, or None when it cannot be obtained."""
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        # A raw DBAPI cursor, so the EXPLAIN itself is not counted or timed.
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception:
+        logger.debug('Could not EXPLAIN slow query', exc_info=True)
+        return None
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+@instrumentation.route('/metrics')
+def metrics_endpoint():
+    """
+    Exposes request, SQL and cache metrics for Prometheus.
+
+    Returns:
+        Plain-text response in the Prometheus exposition format, or 404 when METRICS_ENABLED is off.
+    """
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
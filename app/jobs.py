@@ -0,0 +1,286 @@
+"""
+Durable background jobs stored in the application database.
+
+Request handlers call enqueue() inside their own transaction, so a job exists
+exactly when the write that caused it commits, and return without waiting for
+it. Workers claim one job at a time with a single conditional UPDATE, which
+marks it running and locks it for JOB_VISIBILITY_TIMEOUT seconds; a job whose
+worker died is claimed again once the lock expires. A failed attempt is retried
+with exponential backoff until JOB_MAX_ATTEMPTS, after which the job is left
+'failed' with its last error. Because a job can run more than once, handlers
+must be idempotent.
+
+Workers run in their own process (`flask jobs-work`) or, with
+JOB_IN_APP_WORKERS > 0, as daemon threads inside each app process.
+
+Configuration:
+    JOB_MAX_ATTEMPTS: Attempts before a job is marked failed.
+    JOB_VISIBILITY_TIMEOUT: Seconds a claimed job stays locked to its worker.
+    JOB_RETRY_BACKOFF: Delay before the first retry, doubled for every further attempt.
+    JOB_RETRY_BACKOFF_MAX: Upper bound for the retry delay.
+    JOB_POLL_INTERVAL: Seconds an idle worker sleeps before polling again.
+    JOB_IN_APP_WORKERS: Worker threads started in each app process on its first request.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+_EXTENSION_KEY = 'jobs'
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_VISIBILITY_TIMEOUT = 300
+DEFAULT_RETRY_BACKOFF = 10
+DEFAULT_RETRY_BACKOFF_MAX = 3600
+DEFAULT_POLL_INTERVAL = 1.0
+_MAX_ERROR_LENGTH = 2000
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+HANDLERS = {}
+
+
+class UnknownJobKind(Exception):
+    """Raised when enqueueing a kind of job that has no registered handler."""
+
+
+def handler(kind):
+    """Decorator registering `fn(payload)` as the handler for jobs of `kind`."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=None):
+    """
+    Adds a job to the current transaction; it becomes visible to workers when the caller commits.
+
+    Parameters:
+        payload (dict): JSON-serializable arguments for the handler.
+        delay (float): Seconds before the first attempt.
+
+    Returns:
+        The new job's id.
+
+    Raises:
+        UnknownJobKind: If no handler is registered for `kind`.
+    """
+    if kind not in HANDLERS:
+        raise UnknownJobKind(kind)
+    return db.session.execute(
+        db.insert(Job).values(
+            kind=kind,
+            payload=json.dumps(payload or {}),
+            status='queued',
+            attempts=0,
+            max_attempts=max_attempts or _config('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+            created_at=datetime.utcnow(),
+        ).returning(Job.id)
+    ).scalar_one()
+
+
+def retry_delay(attempts, base, maximum):
+    """Seconds to wait after the `attempts`-th failed attempt."""
+    return min(base * 2 ** (attempts - 1), maximum)
+
+
+def queue_stats():
+    """Returns the number of jobs in each status."""
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all())
+    return counts
+
+
+class Worker:
+    """
+    Claims and runs jobs for one app, one at a time.
+
+    Parameters:
+        name (str): Identifies this worker in Job.locked_by; defaults to host, pid and thread.
+        kinds (list): Only run jobs of these kinds; default all.
+    """
+
+    def __init__(self, app, name=None, kinds=None):
+        self.app = app
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.kinds = list(kinds) if kinds else None
+
+    def run_one(self):
+        """
+        Claims and runs the next due job.
+
+        Returns:
+            The job's status afterwards ('done', 'queued' for a scheduled retry
+            or 'failed'), or None if no job was due.
+        """
+        with self.app.app_context():
+            job = self._claim()
+            if job is None:
+                return None
+            job_id, kind, payload, attempts, max_attempts = job
+            if attempts > max_attempts:
+                # Its last attempt was lost with a worker; don't try again.
+                return self._finish(job_id, 'failed', error='Visibility timeout expired on the last attempt')
+
+            fn = HANDLERS.get(kind)
+            try:
+                if fn is None:
+                    raise UnknownJobKind(kind)
+                fn(json.loads(payload))
+                # The handler's own writes commit together with the 'done' mark.
+                return self._finish(job_id, 'done')
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Job %s (%s) failed on attempt %d of %d', job_id, kind, attempts, max_attempts)
+                if attempts >= max_attempts or isinstance(e, UnknownJobKind):
+                    return self._finish(job_id, 'failed', error=repr(e))
+                delay = retry_delay(attempts, _config('JOB_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF),
+                                    _config('JOB_RETRY_BACKOFF_MAX', DEFAULT_RETRY_BACKOFF_MAX))
+                return self._finish(job_id, 'queued', error=repr(e), run_at=datetime.utcnow() + timedelta(seconds=delay))
+
+    def run(self, stop_event=None, burst=False):
+        """
+        Runs jobs until `stop_event` is set, sleeping JOB_POLL_INTERVAL when idle.
+
+        Parameters:
+            burst (bool): Return as soon as no job is due instead of polling.
+
+        Returns:
+            Number of jobs processed.
+        """
+        stop_event = stop_event or threading.Event()
+        poll_interval = self.app.config.get('JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        processed = 0
+        while not stop_event.is_set():
+            try:
+                status = self.run_one()
+            except Exception:
+                # Database unavailable or locked; back off and poll again.
+                logger.exception('Job worker %s could not claim a job', self.name)
+                status = None
+            if status is not None:
+                processed += 1
+                continue
+            if burst:
+                break
+            stop_event.wait(poll_interval)
+        return processed
+
+    def _claim(self):
+        now = datetime.utcnow()
+        due = db.or_(
+            db.and_(Job.status == 'queued', Job.run_at <= now),
+            db.and_(Job.status == 'running', Job.locked_until < now),
+        )
+        if self.kinds:
+            due = db.and_(due, Job.kind.in_(self.kinds))
+        next_id = db.select(Job.id).where(due).order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+        timeout = _config('JOB_VISIBILITY_TIMEOUT', DEFAULT_VISIBILITY_TIMEOUT)
+        # The outer condition repeats `due`, so two workers racing for the same row cannot both win it.
+        job = db.session.execute(
+            db.update(Job.__table__)
+            .where(Job.id == next_id, due)
+            .values(status='running', attempts=Job.attempts + 1, locked_by=self.name,
+                    locked_until=now + timedelta(seconds=timeout))
+            .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        ).first()
+        db.session.commit()
+        return job
+
+    def _finish(self, job_id, status, error=None, run_at=None):
+        values = {'status': status, 'locked_by': None, 'locked_until': None}
+        if status == 'queued':
+            values['run_at'] = run_at
+        else:
+            values['finished_at'] = datetime.utcnow()
+        if error is not None:
+            values['last_error'] = error[:_MAX_ERROR_LENGTH]
+        # Only while we still hold the lock; after a timeout another worker owns the job.
+        db.session.execute(
+            db.update(Job.__table__).where(Job.id == job_id, Job.locked_by == self.name).values(**values)
+        )
+        db.session.commit()
+        return status
+
+
+class WorkerPool:
+    """A number of Worker threads sharing one stop event."""
+
+    def __init__(self, app, size, kinds=None):
+        self.app = app
+        self.size = size
+        self.kinds = kinds
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for number in range(self.size):
+            worker = Worker(self.app, name=f'{socket.gethostname()}:{os.getpid()}:worker-{number}', kinds=self.kinds)
+            thread = threading.Thread(target=worker.run, args=(self.stop_event,),
+                                      name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+def init_app(app):
+    from app import tasks  # noqa: F401  registers the handlers
+
+    state = {'pool': None, 'pid': None}
+    app.extensions[_EXTENSION_KEY] = state
+
+    in_app_workers = app.config.get('JOB_IN_APP_WORKERS', 0)
+    if in_app_workers:
+        lock = threading.Lock()
+
+        @app.before_request
+        def start_in_app_workers():
+            # Per process: a pool started before a fork does not run in the children.
+            if state['pid'] == os.getpid():
+                return
+            with lock:
+                if state['pid'] != os.getpid():
+                    state['pool'] = WorkerPool(app, in_app_workers).start()
+                    state['pid'] = os.getpid()
+                    atexit.register(state['pool'].stop, 5)
+
+    metrics = app.extensions.get('instrumentation')
+    if metrics is not None:
+        metrics.register_collector(lambda: _queue_families(app))
+
+
+def _queue_families(app):
+    with app.app_context():
+        try:
+            counts = queue_stats()
+        except Exception:
+            logger.debug('Job queue stats unavailable', exc_info=True)
+            return []
+    return [('jobs', 'gauge', 'Background jobs by status.',
+             [({'status': status}, count) for status, count in counts.items()])]
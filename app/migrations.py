@@ -0,0 +1,173 @@
+"""
+Versioned schema migrations for existing databases.
+
+db.create_all() only creates missing tables, so changes to existing tables
+(new columns, indexes) are shipped here as numbered steps. Each step runs in
+its own transaction and is recorded in the schema_version table; steps are
+written to be idempotent so they are also safe on a database that create_all()
+just built with the current models. Apply them with `flask db-upgrade`.
+"""
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from app.images import parse_images, replace_images
+from app.sales import rebuild as rebuild_sales
+
+
+_metadata = sa.MetaData()
+
+schema_version = sa.Table(
+    'schema_version', _metadata,
+    sa.Column('version', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('description', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _create_index(connection, name, table, columns, unique=False):
+    connection.execute(sa.text('CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)' % (
+        'UNIQUE ' if unique else '',
+        _quote(connection, name),
+        _quote(connection, table),
+        ', '.join(_quote(connection, column) for column in columns),
+    )))
+
+
+def _columns(connection, table):
+    return {column['name'] for column in sa.inspect(connection).get_columns(table)}
+
+
+def _add_column(connection, table, name, type_):
+    # The type is compiled for the connection's dialect: DATETIME on SQLite, TIMESTAMP on PostgreSQL.
+    connection.execute(sa.text('ALTER TABLE %s ADD COLUMN %s %s' % (
+        _quote(connection, table), _quote(connection, name), type_.compile(dialect=connection.dialect))))
+
+
+def _unique_cart_lines(connection):
+    # Fold duplicate (customer, product) lines into the oldest one before indexing.
+    connection.execute(sa.text(
+        'UPDATE cart SET quantity = ('
+        '  SELECT SUM(other.quantity) FROM cart AS other'
+        '  WHERE other.customer_link = cart.customer_link AND other.product_link = cart.product_link'
+        ') WHERE id IN ('
+        '  SELECT MIN(id) FROM cart GROUP BY customer_link, product_link HAVING COUNT(*) > 1'
+        ')'
+    ))
+    connection.execute(sa.text(
+        'DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY customer_link, product_link)'
+    ))
+    _create_index(connection, 'uq_cart_customer_product', 'cart', ['customer_link', 'product_link'], unique=True)
+
+
+def _product_sku(connection):
+    if 'sku' not in _columns(connection, 'product'):
+        connection.execute(sa.text('ALTER TABLE product ADD COLUMN sku VARCHAR(32)'))
+    _create_index(connection, 'uq_product_sku', 'product', ['sku'], unique=True)
+
+
+def _hot_path_indexes(connection):
+    _create_index(connection, 'ix_customer_username', 'customer', ['username'])
+    _create_index(connection, 'ix_cart_product_link', 'cart', ['product_link'])
+    _create_index(connection, 'ix_order_customer_link', 'order', ['customer_link'])
+    _create_index(connection, 'ix_order_product_link', 'order', ['product_link'])
+    _create_index(connection, 'ix_product_current_price', 'product', ['current_price'])
+
+
+def _order_checkout_link(connection):
+    # The checkout table itself is new, so create_all() has already built it.
+    if 'checkout_link' not in _columns(connection, 'order'):
+        connection.execute(sa.text('ALTER TABLE "order" ADD COLUMN checkout_link INTEGER REFERENCES checkout (id)'))
+    _create_index(connection, 'ix_order_checkout_link', 'order', ['checkout_link'])
+
+
+def _sales_rollups(connection):
+    # The rollup tables are new, so create_all() has already built them; fill them from the orders.
+    if 'created_at' not in _columns(connection, 'order'):
+        _add_column(connection, 'order', 'created_at', sa.DateTime())
+    # Orders placed through checkout take their checkout's time; older ones stay undated.
+    connection.execute(sa.text(
+        'UPDATE "order" SET created_at = ('
+        '  SELECT checkout.created_at FROM checkout WHERE checkout.id = "order".checkout_link'
+        ') WHERE created_at IS NULL AND checkout_link IS NOT NULL'
+    ))
+    _create_index(connection, 'ix_order_created_at', 'order', ['created_at'])
+    rebuild_sales(connection)
+
+
+def _product_images(connection, batch_size=1000):
+    # product_image is new, so create_all() has already built it.
+    if 'primary_image' not in _columns(connection, 'product'):
+        connection.execute(sa.text('ALTER TABLE product ADD COLUMN primary_image VARCHAR(500)'))
+    set_primary = sa.text('UPDATE product SET primary_image = :image WHERE id = :id')
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text('SELECT id, product_picture FROM product WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': batch_size},
+        ).all()
+        if not rows:
+            break
+        images = {product_id: parse_images(picture) for product_id, picture in rows}
+        connection.execute(set_primary, [{'id': product_id, 'image': urls[0] if urls else None}
+                                         for product_id, urls in images.items()])
+        replace_images(connection, images)
+        last_id = rows[-1][0]
+
+
+# (version, description, step). Append only; never renumber or edit a released step.
+MIGRATIONS = [
+    (1, 'Unique cart line per customer and product', _unique_cart_lines),
+    (2, 'Product.sku for catalog ingestion', _product_sku),
+    (3, 'Indexes for cart, order, customer and price lookups', _hot_path_indexes),
+    (4, 'Order.checkout_link for idempotent checkout', _order_checkout_link),
+    (5, 'Order.created_at and sales rollups', _sales_rollups),
+    (6, 'Product.primary_image and product_image rows parsed from product_picture', _product_images),
+]
+
+
+def current_version(engine=None):
+    """Returns the highest applied migration version, 0 for an unmigrated database."""
+    engine = engine or db.engine
+    with engine.connect() as connection:
+        if not sa.inspect(connection).has_table('schema_version'):
+            return 0
+        return connection.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+
+
+def pending(engine=None):
+    version = current_version(engine)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def upgrade(target=None, engine=None, echo=None):
+    """
+    Applies pending migrations up to `target` (default: the latest).
+
+    Parameters:
+        echo (callable): Called with a message for every applied step.
+
+    Returns:
+        List of applied versions.
+    """
+    engine = engine or db.engine
+    db.create_all()
+    _metadata.create_all(engine)
+
+    applied = []
+    for version, description, step in pending(engine):
+        if target is not None and version > target:
+            break
+        with engine.begin() as connection:
+            step(connection)
+            connection.execute(schema_version.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+        applied.append(version)
+        if echo is not None:
+            echo(f'Applied {version}: {description}')
+    return applied
@@ -0,0 +1,168 @@
+"""
+Committed-change notifications for mapped models.
+
+In-process structures that mirror database rows (the product search index,
+caches) subscribe here instead of polling the database. Row changes are
+collected on the session while it flushes and are only handed to subscribers
+once the surrounding transaction commits; a rollback discards them.
+"""
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = 'model_events.pending'
+
+_subscribers = {}
+_watched_tables = {}
+
+
+class ModelChanges:
+    """
+    Changes to one model committed by a single transaction.
+
+    Attributes:
+        model: The mapped class the changes belong to.
+        upserted (dict): Primary key -> column values of inserted or updated rows.
+            Only attributes that were loaded at flush time are present.
+        deleted (set): Primary keys of deleted rows.
+        reset (bool): True when rows were changed by a bulk statement and the
+            affected keys are unknown; subscribers should drop everything they hold.
+        info (dict): Facts other listeners recorded about the transaction, such as
+            the 'catalog_version' it bumped to (see app.catalog_version).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.upserted = {}
+        self.deleted = set()
+        self.reset = False
+        self.info = {}
+
+    def __bool__(self):
+        return self.reset or bool(self.upserted) or bool(self.deleted)
+
+    def __repr__(self):
+        return '<ModelChanges %s upserted=%d deleted=%d reset=%r>' % (
+            self.model.__name__, len(self.upserted), len(self.deleted), self.reset)
+
+
+def subscribe(model, callback):
+    """
+    Calls `callback(changes)` with a ModelChanges after every commit that touched `model`.
+
+    Callbacks run inside the committing app context but must not use the
+    committing session to emit SQL.
+    """
+    _watch(model)
+    callbacks = _subscribers.setdefault(model, [])
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+
+def mark_changed(session, model, ids, values=None):
+    """
+    Records rows changed through Core statements, which bypass mapper events.
+
+    Parameters:
+        values (dict): Optional primary key -> new column values. Columns left
+            out are taken as unchanged; rows without values as entirely unknown.
+    """
+    changes = _pending(session, model)
+    values = values or {}
+    for pk in ids:
+        changes.deleted.discard(pk)
+        changes.upserted.setdefault(pk, {}).update(values.get(pk, {}))
+
+
+def mark_reset(session, model):
+    """Records that an unknown set of `model` rows changed in the current transaction."""
+    _pending(session, model).reset = True
+
+
+def pending(session, model):
+    """Returns the uncommitted ModelChanges recorded for `model` on `session`, or None."""
+    changes = session.info.get(_PENDING_KEY, {}).get(model)
+    return changes if changes else None
+
+
+def notify(changes):
+    """Hands `changes` to every subscriber of its model, outside of any transaction."""
+    for callback in list(_subscribers.get(changes.model, ())):
+        try:
+            callback(changes)
+        except Exception:
+            logger.exception('model change subscriber %r failed', callback)
+
+
+def _pending(session, model):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    if model not in pending:
+        pending[model] = ModelChanges(model)
+    return pending[model]
+
+
+def _row_values(mapper, target):
+    loaded = target.__dict__
+    return {attr.key: loaded[attr.key] for attr in mapper.column_attrs if attr.key in loaded}
+
+
+def _after_upsert(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    pk = mapper.primary_key_from_instance(target)[0]
+    changes = _pending(session, mapper.class_)
+    changes.deleted.discard(pk)
+    changes.upserted[pk] = _row_values(mapper, target)
+
+
+def _after_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    pk = mapper.primary_key_from_instance(target)[0]
+    changes = _pending(session, mapper.class_)
+    changes.upserted.pop(pk, None)
+    changes.deleted.add(pk)
+
+
+def _watch(model):
+    table = inspect(model).local_table
+    if table in _watched_tables:
+        return
+    _watched_tables[table] = model
+    event.listen(model, 'after_insert', _after_upsert)
+    event.listen(model, 'after_update', _after_upsert)
+    event.listen(model, 'after_delete', _after_delete)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    model = None
+    if orm_execute_state.bind_mapper is not None:
+        model = orm_execute_state.bind_mapper.class_
+    else:
+        model = _watched_tables.get(getattr(orm_execute_state.statement, 'table', None))
+    if model is not None and model in _subscribers:
+        mark_reset(orm_execute_state.session, model)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for changes in pending.values():
+        if changes:
+            notify(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop(_PENDING_KEY, None)
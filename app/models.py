@@ -1,13 +1,14 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.hashing import hash_password, verify_password
+from app.images import default_primary_image, watch_pictures
 
 
 class Customer(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True)
-    username = db.Column(db.String(100))
+    username = db.Column(db.String(100), index=True)
     password_hash = db.Column(db.String(150))
     date_joined = db.Column(db.DateTime(), default=datetime.utcnow)
 
@@ -20,10 +21,10 @@ class Customer(db.Model, UserMixin):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password=password)
+        self.password_hash = hash_password(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password=password)
+        return verify_password(self.password_hash, password)
 
     def __str__(self):
         return '<Customer %r>' % Customer.id
@@ -31,28 +32,58 @@ class Customer(db.Model, UserMixin):
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(32))  # Flipkart 'pid'; key for catalog ingestion
     product_name = db.Column(db.String(100), nullable=False)
-    current_price = db.Column(db.Float, nullable=False)
+    current_price = db.Column(db.Float, nullable=False, index=True)
     previous_price = db.Column(db.Float, nullable=False)
     in_stock = db.Column(db.Integer, nullable=False)
     product_picture = db.Column(db.String(1000), nullable=False)
+    # First URL of product_picture; see app.images.
+    primary_image = db.Column(db.String(500), default=default_primary_image)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
 
     carts = db.relationship('Cart', backref=db.backref('product', lazy=True))
     orders = db.relationship('Order', backref=db.backref('product', lazy=True))
+    images = db.relationship('ProductImage', order_by='ProductImage.position', cascade='all, delete-orphan',
+                             backref=db.backref('product', lazy=True))
+
+    __table_args__ = (
+        db.Index('uq_product_sku', 'sku', unique=True),
+    )
 
     def __str__(self):
         return '<Product %r>' % self.product_name
 
 
+watch_pictures(Product)
+
+
+class ProductImage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+
+    __table_args__ = (
+        db.Index('uq_product_image_position', 'product_link', 'position', unique=True),
+    )
+
+    def __str__(self):
+        return '<ProductImage %r>' % self.url
+
+
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, nullable=False)
 
     customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
-    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
 
     # customer product
+    __table_args__ = (
+        # One row per (customer, product); cart mutations upsert against it.
+        db.Index('uq_cart_customer_product', 'customer_link', 'product_link', unique=True),
+    )
 
     def __str__(self):
         return '<Cart %r>' % self.id
@@ -65,8 +96,10 @@ class Order(db.Model):
     status = db.Column(db.String(100), nullable=False)
     payment_id = db.Column(db.String(1000), nullable=False)
 
-    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
-    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    checkout_link = db.Column(db.Integer, db.ForeignKey('checkout.id'), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # customer
 
@@ -74,11 +107,92 @@ class Order(db.Model):
         return '<Order %r>' % self.id
 
 
+class Checkout(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(100), nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
 
+    orders = db.relationship('Order', backref=db.backref('checkout', lazy=True))
 
+    __table_args__ = (
+        # A retried checkout with the same key finds the first attempt instead of charging twice.
+        db.Index('uq_checkout_customer_key', 'customer_link', 'idempotency_key', unique=True),
+    )
 
+    def __str__(self):
+        return '<Checkout %r>' % self.id
 
 
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)  # earliest next attempt
+    locked_until = db.Column(db.DateTime)  # a running job whose lock expired is claimed again
+    locked_by = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
 
+    def __str__(self):
+        return '<Job %r %r>' % (self.id, self.kind)
 
+
+class CatalogVersion(db.Model):
+    # A single row, bumped in every transaction that changes the catalog; see app.catalog_version.
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __str__(self):
+        return '<CatalogVersion %r>' % self.version
+
+
+# Sales rollups, maintained by app.sales in the same transaction as the orders they count.
+
+class ProductSales(db.Model):
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False)
+    units = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    last_ordered_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_product_sales_units', 'units'),
+    )
+
+    def __str__(self):
+        return '<ProductSales %r>' % self.product_link
+
+
+class DailyProductSales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False)
+    units = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+
+    def __str__(self):
+        return '<DailyProductSales %r %r>' % (self.day, self.product_link)
+
+
+class CustomerSales(db.Model):
+    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False)
+    units = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    last_ordered_at = db.Column(db.DateTime)
+
+    def __str__(self):
+        return '<CustomerSales %r>' % self.customer_link
@@ -0,0 +1,251 @@
+"""
+In-process price index over the catalog.
+
+Products are held in three parallel arrays sorted by (current_price, id):
+prices, ids and stock counts, plus a prefix sum of in-stock flags. A price
+range is two bisections; the number of products and of in-stock products in
+any range, and so in every bucket of a histogram, is a difference of positions
+or of prefix sums, so neither depends on the size of the catalog. An id ->
+price map answers "is this product in the range" for ranked search hits
+without loading them.
+
+Like the search index, it is built from the database on first use, kept in
+sync through committed Product changes and rebuilt when another process
+changes the catalog (see app.catalog_index).
+"""
+import bisect
+import itertools
+import threading
+from array import array
+
+from app import db
+from app.catalog_index import CatalogIndex
+from app.models import Product
+
+
+_EXTENSION_KEY = 'price_index'
+
+
+class PriceRange:
+    """
+    A price range; either bound may be None for an open end.
+
+    Parameters:
+        low (float): Lower bound, or None.
+        high (float): Upper bound, or None.
+        low_inclusive (bool): Whether a price equal to `low` is in the range.
+        high_inclusive (bool): Whether a price equal to `high` is in the range.
+    """
+
+    def __init__(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        self.low = low
+        self.high = high
+        self.low_inclusive = low_inclusive
+        self.high_inclusive = high_inclusive
+
+    def __contains__(self, price):
+        if self.low is not None and (price < self.low or (price == self.low and not self.low_inclusive)):
+            return False
+        if self.high is not None and (price > self.high or (price == self.high and not self.high_inclusive)):
+            return False
+        return True
+
+    def __bool__(self):
+        return self.low is not None or self.high is not None
+
+    def __repr__(self):
+        return '%s%s, %s%s' % ('[' if self.low_inclusive else '(', self.low, self.high,
+                               ']' if self.high_inclusive else ')')
+
+
+class PriceIndex:
+    """Products sorted by price in parallel arrays; see the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._prices = array('d')
+            self._ids = array('q')
+            self._stock = array('q')
+            self._price_by_id = {}
+            self._in_stock_prefix = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def load(self, rows):
+        """Replaces the contents with `rows` of (id, current_price, in_stock)."""
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        with self._lock:
+            self._ids = array('q', (row[0] for row in rows))
+            self._prices = array('d', (row[1] for row in rows))
+            self._stock = array('q', (row[2] for row in rows))
+            self._price_by_id = dict(zip(self._ids, self._prices))
+            self._in_stock_prefix = None
+
+    def price(self, product_id):
+        """Returns the indexed price of `product_id`, or None."""
+        return self._price_by_id.get(product_id)
+
+    def _position(self, product_id):
+        price = self._price_by_id[product_id]
+        start = bisect.bisect_left(self._prices, price)
+        end = bisect.bisect_right(self._prices, price)
+        # Ties on price are ordered by id.
+        return start + bisect.bisect_left(self._ids[start:end], product_id)
+
+    def upsert(self, product_id, price=None, in_stock=None):
+        """
+        Adds or updates one product. A new product needs both `price` and
+        `in_stock`; for a known one, either may be None to keep its value.
+        """
+        with self._lock:
+            if product_id in self._price_by_id:
+                position = self._position(product_id)
+                if price is None or price == self._prices[position]:
+                    if in_stock is not None:
+                        if (in_stock > 0) != (self._stock[position] > 0):
+                            # Most stock changes keep the product in stock and leave the prefix sums valid.
+                            self._in_stock_prefix = None
+                        self._stock[position] = in_stock
+                    return
+                if in_stock is None:
+                    in_stock = self._stock[position]
+                self._delete_at(position)
+            elif price is None or in_stock is None:
+                raise ValueError(f'New product {product_id} needs both a price and a stock count')
+
+            start = bisect.bisect_left(self._prices, price)
+            end = bisect.bisect_right(self._prices, price)
+            position = start + bisect.bisect_left(self._ids[start:end], product_id)
+            self._prices.insert(position, price)
+            self._ids.insert(position, product_id)
+            self._stock.insert(position, in_stock)
+            self._price_by_id[product_id] = price
+            self._in_stock_prefix = None
+
+    def remove(self, product_id):
+        with self._lock:
+            if product_id in self._price_by_id:
+                self._delete_at(self._position(product_id))
+
+    def _delete_at(self, position):
+        del self._price_by_id[self._ids[position]]
+        del self._prices[position]
+        del self._ids[position]
+        del self._stock[position]
+        self._in_stock_prefix = None
+
+    def _bounds(self, price_range):
+        """Returns the [start, end) positions of the products in `price_range`."""
+        if price_range.low is None:
+            start = 0
+        elif price_range.low_inclusive:
+            start = bisect.bisect_left(self._prices, price_range.low)
+        else:
+            start = bisect.bisect_right(self._prices, price_range.low)
+        if price_range.high is None:
+            end = len(self._prices)
+        elif price_range.high_inclusive:
+            end = bisect.bisect_right(self._prices, price_range.high)
+        else:
+            end = bisect.bisect_left(self._prices, price_range.high)
+        return start, max(start, end)
+
+    def _prefix(self):
+        if self._in_stock_prefix is None:
+            self._in_stock_prefix = array('q', itertools.accumulate((stock > 0 for stock in self._stock), initial=0))
+        return self._in_stock_prefix
+
+    def ids_in_range(self, price_range):
+        """Returns an array of the ids priced within `price_range`, cheapest first."""
+        with self._lock:
+            start, end = self._bounds(price_range)
+            return self._ids[start:end]
+
+    def count(self, price_range):
+        """Returns (products, in-stock products) priced within `price_range`."""
+        with self._lock:
+            start, end = self._bounds(price_range)
+            prefix = self._prefix()
+            return end - start, prefix[end] - prefix[start]
+
+    def histogram(self, edges):
+        """
+        Counts products per price bucket. `edges` e0 < e1 < ... < ek define the
+        buckets [e0, e1), ..., [e(k-1), ek) and the open-ended [ek, ...).
+
+        Returns:
+            List of (low, high, products, in-stock products), with high None for the last bucket.
+        """
+        edges = _check_edges(edges)
+        with self._lock:
+            prefix = self._prefix()
+            positions = [bisect.bisect_left(self._prices, edge) for edge in edges] + [len(self._prices)]
+            return [(low, high, end - start, prefix[end] - prefix[start])
+                    for low, high, start, end in zip(edges, edges[1:] + [None], positions, positions[1:])]
+
+    def histogram_of(self, product_ids, edges):
+        """Like `histogram`, restricted to `product_ids` (for example search hits)."""
+        edges = _check_edges(edges)
+        products = [0] * len(edges)
+        stocked = [0] * len(edges)
+        with self._lock:
+            for product_id in product_ids:
+                price = self._price_by_id.get(product_id)
+                if price is None:
+                    continue
+                bucket = bisect.bisect_right(edges, price) - 1
+                if bucket < 0:
+                    continue
+                products[bucket] += 1
+                stocked[bucket] += self._stock[self._position(product_id)] > 0
+        return [(low, high, products[i], stocked[i]) for i, (low, high) in enumerate(zip(edges, edges[1:] + [None]))]
+
+
+def _check_edges(edges):
+    edges = [float(edge) for edge in edges]
+    if not edges or any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError('Bucket edges must be a non-empty, strictly increasing sequence')
+    return edges
+
+
+class ProductPriceIndex(CatalogIndex, PriceIndex):
+    """PriceIndex over the Product table, built from the database and kept current; see app.catalog_index."""
+
+    extension_key = _EXTENSION_KEY
+
+    def _load(self):
+        self.load(db.session.execute(
+            db.select(Product.id, Product.current_price, Product.in_stock).execution_options(yield_per=1000)
+        ))
+
+    def _apply(self, changes):
+        for product_id in changes.deleted:
+            self.remove(product_id)
+        for product_id, values in changes.upserted.items():
+            price, in_stock = values.get('current_price'), values.get('in_stock')
+            if price is None and in_stock is None:
+                if not values or self.price(product_id) is None:
+                    return False
+                continue  # Neither column changed.
+            try:
+                self.upsert(product_id, price, in_stock)
+            except ValueError:
+                return False
+        return True
+
+
+def init_app(app):
+    ProductPriceIndex.init_app(app)
+
+
+def get_price_index():
+    """Returns the current app's price index, building or rebuilding it if needed."""
+    return ProductPriceIndex.get()
+
+
+ProductPriceIndex.subscribe()
@@ -0,0 +1,116 @@
+"""
+Read-through cache of Product rows.
+
+Entries are immutable ProductSnapshot tuples rather than ORM objects, so they
+can be shared between requests and sessions. Committed Product updates and
+deletes in this process evict the affected entries (see app.model_events). The
+cache also remembers the catalog version (see app.catalog_version) it was
+filled at and is emptied when the catalog moves past it, so changes made by
+other processes are picked up within CATALOG_VERSION_TTL. Stock-only changes
+that leave the version alone are bounded by the TTL.
+"""
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+
+from app import db, model_events
+from app.cache import LRUCache
+from app.catalog_version import current_version
+from app.models import Product
+
+
+_EXTENSION_KEY = 'product_cache'
+
+DEFAULT_SIZE = 4096
+DEFAULT_TTL = 300
+
+ProductSnapshot = namedtuple('ProductSnapshot', [
+    'id', 'product_name', 'current_price', 'previous_price', 'in_stock', 'primary_image', 'date_added'
+])
+
+_SNAPSHOT_COLUMNS = [getattr(Product, field) for field in ProductSnapshot._fields]
+
+
+class ProductCache(LRUCache):
+    """LRUCache of ProductSnapshots that also tracks the catalog version they reflect."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Catalog version the entries reflect, or None before the first read.
+        self.version = None
+
+    def sync(self, version):
+        """Empties the cache if the catalog is at a newer `version` than its entries."""
+        with self._lock:
+            if self.version is None or version > self.version:
+                self._data.clear()
+                self.version = version
+
+
+def init_app(app):
+    app.extensions[_EXTENSION_KEY] = ProductCache(
+        maxsize=app.config.get('PRODUCT_CACHE_SIZE', DEFAULT_SIZE),
+        ttl=app.config.get('PRODUCT_CACHE_TTL', DEFAULT_TTL),
+    )
+
+
+def get_cache():
+    return current_app.extensions[_EXTENSION_KEY]
+
+
+def get_product(product_id):
+    """Returns the ProductSnapshot for `product_id`, or None if no such product exists."""
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return None
+    return get_products([product_id]).get(product_id)
+
+
+def get_products(product_ids):
+    """
+    Returns {id: ProductSnapshot} for the given ids that exist.
+
+    Cached entries are served from memory; all misses are loaded with a single query.
+    """
+    cache = get_cache()
+    # Read before loading: a change committed meanwhile then only empties the cache once more.
+    version = current_version()[0]
+    cache.sync(version)
+    found = {}
+    missing = []
+    for product_id in product_ids:
+        snapshot = cache.get(product_id)
+        if snapshot is None:
+            missing.append(product_id)
+        else:
+            found[product_id] = snapshot
+
+    if missing:
+        rows = db.session.execute(db.select(*_SNAPSHOT_COLUMNS).where(Product.id.in_(missing)))
+        for row in rows:
+            snapshot = ProductSnapshot(*row)
+            if cache.version == version:
+                cache.set(snapshot.id, snapshot)
+            found[snapshot.id] = snapshot
+    return found
+
+
+def _on_product_change(changes):
+    if not has_app_context():
+        return
+    cache = current_app.extensions.get(_EXTENSION_KEY)
+    if cache is None:
+        return
+    if changes.reset:
+        cache.clear()
+        return
+    for product_id in list(changes.upserted) + list(changes.deleted):
+        cache.pop(product_id)
+    # Keep the other entries when this commit was the only change since the cache was filled.
+    version = changes.info.get('catalog_version')
+    if version is not None and cache.version is not None and version == cache.version + 1:
+        cache.version = version
+
+
+model_events.subscribe(Product, _on_product_change)
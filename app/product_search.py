@@ -1,42 +1,278 @@
-from flask import Blueprint, request, jsonify
+import math
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from app.models import Product
 from app import db
+from app.catalog_version import conditional
+from app.images import images_of
+from app.compression import precompressed
+from app.price_index import PriceRange, get_price_index
+from app.product_cache import get_products
+from app.routing import route_reads_to_replica
+from app import sales
+from app.search_index import get_index
+from app.serialization import columnar, project, requested_fields, wants_columnar
+from app.suggest import get_suggest_index
 
 productsearch = Blueprint('productsearch', __name__)
+# Catalog reads never write, so the whole blueprint may read from the replica.
+productsearch.before_request(route_reads_to_replica)
+
+# Rows fetched per IN (...) query when loading ranked search hits.
+ID_CHUNK_SIZE = 500
+# Rows buffered per round trip while streaming the full listing.
+STREAM_BATCH_SIZE = 500
+DEFAULT_MAX_PAGE_SIZE = 500
+DEFAULT_SUGGEST_LIMIT = 10
+
+
+LISTING_FIELDS = ('id', 'product_name', 'price', 'stock_status')
+SEARCH_FIELDS = ('id', 'product_name', 'price', 'product_picture_link', 'stock_status')
+# Search fields only sent when named in fields=: every image URL costs one more query.
+SEARCH_EXTRA_FIELDS = ('images',)
+
+_LISTING_COLUMNS = (Product.id, Product.product_name, Product.current_price, Product.in_stock)
+_SEARCH_COLUMNS = (Product.id, Product.product_name, Product.current_price, Product.primary_image, Product.in_stock)
+
+
+def _listing_values(product_id, product_name, current_price, in_stock):
+    return (product_id, product_name, current_price, 'In Stock' if in_stock > 0 else 'Out of Stock')
+
+
+def _search_values(product_id, product_name, current_price, primary_image, in_stock):
+    return (product_id, product_name, current_price, primary_image,
+            'Out of Stock' if in_stock > 0 else 'In Stock')
+
+
+def _rows_response(fields, rows, **extra):
+    """JSON response for rows of `fields` values, as {"results": [...]} or in the columnar layout."""
+    if wants_columnar():
+        return jsonify(columnar(fields, rows, **extra))
+    return jsonify(results=[dict(zip(fields, row)) for row in rows], **extra)
+
+
+def _price_range(form):
+    """Reads min_price/max_price from `form` into a PriceRange; either may be omitted. Raises ValueError."""
+    bounds = []
+    for name in ('min_price', 'max_price'):
+        value = form.get(name)
+        value = float(value) if value not in (None, '') else None
+        if value is not None and not math.isfinite(value):
+            raise ValueError(f'{name} must be finite')
+        bounds.append(value)
+    return PriceRange(*bounds)
+
+
+def _price_facets(form, ranked_ids=None):
+    """
+    Price facet counts for the price_buckets edges in `form` ("0,25,50,100"),
+    over `ranked_ids` or the whole catalog, or None when none were asked for.
+    Facets ignore the price filter itself, so every bucket stays selectable.
+    """
+    buckets = form.get('price_buckets')
+    if not buckets:
+        return None
+    edges = [float(edge) for edge in buckets.split(',')]
+    if not all(math.isfinite(edge) for edge in edges):
+        raise ValueError('price_buckets must be finite')
+    index = get_price_index()
+    counts = index.histogram(edges) if ranked_ids is None else index.histogram_of(ranked_ids, edges)
+    return [{'min': low, 'max': high, 'count': count, 'in_stock': in_stock}
+            for low, high, count, in_stock in counts]
+
+
+def _load_ranked(ranked_ids, price_range):
+    """
+    Loads the products for `ranked_ids` through the product cache, applying the
+    price filter, in rank order.
+    """
+    if price_range:
+        # Drop hits outside the range before loading them. Ids the index doesn't know yet
+        # (added by another process) are loaded and checked below.
+        index = get_price_index()
+        ranked_ids = [product_id for product_id in ranked_ids
+                      if index.price(product_id) is None or index.price(product_id) in price_range]
+    items = []
+    for start in range(0, len(ranked_ids), ID_CHUNK_SIZE):
+        chunk = ranked_ids[start:start + ID_CHUNK_SIZE]
+        by_id = get_products(chunk)
+        for product_id in chunk:
+            item = by_id.get(product_id)
+            if item is None:
+                continue
+            if price_range and item.current_price not in price_range:
+                continue
+            items.append(item)
+    return items
+
 
 @productsearch.route('/productsearch', methods=['GET', 'POST'])
+@conditional
+@precompressed
 def search_page():
     if request.method == 'POST':
         search_query = request.form.get('search')
-        min_price = request.form.get('min_price')
-        max_price = request.form.get('max_price')
-
-        query = Product.query.filter(Product.product_name.ilike(f'%{search_query}%'))
-
-        if min_price and max_price:
-            query = query.filter(Product.current_price >= float(min_price), Product.current_price <= float(max_price))
-
-        items = query.all()
-
-        results = [
-            {
-                'id': item.id,
-                'product_name': item.product_name,
-                'price': item.current_price,
-                'product_picture_link': item.product_picture,
-                'stock_status': 'Out of Stock' if item.in_stock > 0 else 'In Stock'
-            } for item in items
-        ]
-
-        return jsonify(results=results)
-
-    items = Product.query.all()
-    results = [
-        {
-            'id': item.id,
-            'product_name': item.product_name,
-            'price': item.current_price,
-            'stock_status': 'In Stock' if item.in_stock > 0 else 'Out of Stock'
-        } for item in items
-    ]
-    return jsonify(results=results)
+        try:
+            price_range = _price_range(request.form)
+        except ValueError:
+            return jsonify({'error': 'min_price and max_price must be numbers'}), 400
+        try:
+            fields = requested_fields(SEARCH_FIELDS + SEARCH_EXTRA_FIELDS, default=SEARCH_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        ranked_ids = None
+        if search_query and search_query.strip():
+            # Ranked full-text lookup; the Product table is only read for the hits.
+            ranked_ids = [product_id for product_id, _ in get_index().search(search_query)]
+            rows = [_search_values(item.id, item.product_name, item.current_price, item.primary_image, item.in_stock)
+                    for item in _load_ranked(ranked_ids, price_range)]
+        else:
+            # Plain column tuples: no ORM objects or identity map for what can be the whole catalog.
+            query = db.select(*_SEARCH_COLUMNS).order_by(Product.id)
+            if price_range.low is not None:
+                query = query.where(Product.current_price >= price_range.low)
+            if price_range.high is not None:
+                query = query.where(Product.current_price <= price_range.high)
+            rows = [_search_values(*row) for row in db.session.execute(query)]
+
+        extra = {}
+        try:
+            facets = _price_facets(request.form, ranked_ids)
+        except ValueError:
+            return jsonify({'error': 'price_buckets must be increasing numbers separated by commas'}), 400
+        if facets is not None:
+            extra['price_facets'] = facets
+
+        columns = SEARCH_FIELDS
+        if 'images' in fields:
+            images = images_of([row[0] for row in rows])
+            rows = [row + (images.get(row[0], []),) for row in rows]
+            columns += ('images',)
+        return _rows_response(fields, project(columns, fields, rows), **extra)
+
+    try:
+        fields = requested_fields(LISTING_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'limit' in request.args or 'after' in request.args:
+        return _listing_page(fields)
+    return _listing_stream(fields)
+
+
+@productsearch.route('/productsearch/suggest', methods=['GET'])
+def suggest():
+    """
+    Returns product name completions for search-as-you-type, from the
+    in-process suggestion index rather than the database.
+
+    Query parameters:
+        q (str): The text typed so far; matched against the start of any word in a product name.
+        limit (int): Number of suggestions, at most 50 (default SUGGEST_LIMIT).
+
+    Returns:
+        JSON response with 'suggestions', a list of {'id', 'product_name'} ranked by
+        stock and popularity, or an error message with HTTP status code 400.
+    """
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('SUGGEST_LIMIT', DEFAULT_SUGGEST_LIMIT)))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    matches = get_suggest_index().suggest(request.args.get('q', ''), limit)
+    return jsonify(suggestions=[{'id': product_id, 'product_name': name} for product_id, name in matches])
+
+
+@productsearch.route('/products/top', methods=['GET'])
+def top_products():
+    """
+    Returns the best-selling products, read from the sales rollups.
+
+    Query parameters:
+        limit (int): Number of products, at most 100 (default 10).
+        days (int): Only count sales of the last `days` days, today included, at most 366;
+            omitted for all-time sales.
+
+    Returns:
+        JSON response with 'results' (or 'columns' and 'rows' with ?format=columnar), each
+        product's id, product_name, units sold, revenue and number of orders, most units
+        first, or an error message with HTTP status code 400.
+    """
+    try:
+        limit = int(request.args.get('limit', sales.DEFAULT_TOP_LIMIT))
+        days = request.args.get('days')
+        days = int(days) if days not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'limit and days must be integers'}), 400
+    if not 1 <= limit <= sales.MAX_TOP_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {sales.MAX_TOP_LIMIT}'}), 400
+    if days is not None and not 1 <= days <= sales.MAX_TOP_DAYS:
+        return jsonify({'error': f'days must be between 1 and {sales.MAX_TOP_DAYS}'}), 400
+
+    return _rows_response(sales.TOP_FIELDS, sales.top_products(limit, days))
+
+
+def _listing_page(fields=LISTING_FIELDS):
+    """
+    Returns one keyset page of the catalog listing, ordered by product id.
+
+    Query parameters:
+        limit (int): Page size, capped at PRODUCTSEARCH_MAX_PAGE_SIZE.
+        after (int): Only products with an id greater than this are returned.
+        fields (str): Comma-separated LISTING_FIELDS to send; all of them by default.
+
+    Returns:
+        JSON response with 'results' (or 'columns' and 'rows' with ?format=columnar) and
+        'next_after', the cursor for the next page (null on the last page), or an error
+        message with HTTP status code 400.
+    """
+    max_page_size = current_app.config.get('PRODUCTSEARCH_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    try:
+        limit = int(request.args.get('limit', max_page_size))
+        after = request.args.get('after')
+        after = int(after) if after not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'limit and after must be integers'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, max_page_size)
+
+    query = db.select(*_LISTING_COLUMNS).order_by(Product.id).limit(limit)
+    if after is not None:
+        query = query.where(Product.id > after)
+    rows = [_listing_values(*row) for row in db.session.execute(query)]
+
+    next_after = rows[-1][0] if len(rows) == limit else None
+    return _rows_response(fields, project(LISTING_FIELDS, fields, rows), next_after=next_after)
+
+
+def _listing_stream(fields=LISTING_FIELDS):
+    """
+    Streams the whole catalog listing as {"results": [...]}, or as
+    {"columns": [...], "rows": [...]} with ?format=columnar, limited to `fields`.
+
+    Rows are read through a server-side cursor and encoded in batches of
+    STREAM_BATCH_SIZE, so memory use does not grow with the catalog.
+    """
+    query = db.select(*_LISTING_COLUMNS).order_by(Product.id).execution_options(
+        stream_results=True, yield_per=STREAM_BATCH_SIZE)
+    as_columns = wants_columnar()
+
+    def generate():
+        dumps = current_app.json.dumps
+        if as_columns:
+            yield '{"columns": ' + dumps(list(fields)) + ', "rows": ['
+        else:
+            yield '{"results": ['
+        separator = ''
+        for rows in db.session.execute(query).partitions():
+            values = project(LISTING_FIELDS, fields, [_listing_values(*row) for row in rows])
+            batch = values if as_columns else [dict(zip(fields, row)) for row in values]
+            # One encoder call per batch; strip the list brackets to splice it into the stream.
+            yield separator + dumps(batch).strip()[1:-1]
+            separator = ', '
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
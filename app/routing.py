@@ -0,0 +1,199 @@
+"""
+Read/write routing between the primary database and a read replica.
+
+When SQLALCHEMY_REPLICA_URI is set, a second engine is created for it.
+SELECTs issued while replica reads are enabled for the request (see
+route_reads_to_replica, use_replica and replica_reads) go to the replica
+engine; everything else goes to the primary. Reads stay on the primary when:
+
+- the session has already written in this request (read-after-write),
+- the client wrote within the last REPLICA_STICKY_SECONDS,
+- the replica failed its last health check or lags more than REPLICA_MAX_LAG seconds.
+
+Configuration:
+    SQLALCHEMY_REPLICA_URI: Replica database URI, e.g. a read-only SQLite URI with an absolute path.
+    REPLICA_LAG_QUERY: SQL returning the replica's lag in seconds; without it lag is taken as 0.
+    REPLICA_MAX_LAG: Lag above which reads fall back to the primary.
+    REPLICA_CHECK_INTERVAL: Seconds between replica health/lag checks.
+    REPLICA_STICKY_SECONDS: How long a client's reads stay on the primary after it wrote.
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, session as client_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+
+logger = logging.getLogger(__name__)
+
+_EXTENSION_KEY = 'db_routing'
+_STICKY_KEY = '_db_primary_until'
+
+DEFAULT_MAX_LAG = 5.0
+DEFAULT_CHECK_INTERVAL = 10.0
+DEFAULT_STICKY_SECONDS = 5.0
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible SELECTs to the replica engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._wants_replica(clause):
+            router = current_app.extensions.get(_EXTENSION_KEY)
+            engine = router.replica_for_read() if router is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _wants_replica(self, clause):
+        if not has_app_context() or not g.get('_db_use_replica'):
+            return False
+        if self._flushing or self.info.get('_db_wrote'):
+            return False
+        return getattr(clause, 'is_select', False)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flag_flush_write(session, flush_context):
+    session.info['_db_wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _flag_statement_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['_db_wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_client_write(session):
+    if session.info.get('_db_wrote') and has_request_context():
+        g._db_client_wrote = True
+
+
+class ReplicaRouter:
+    """Tracks replica health and lag, and per-engine query counts."""
+
+    def __init__(self, app, engine=None):
+        self.engine = engine
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        self.lag_query = app.config.get('REPLICA_LAG_QUERY')
+        self.healthy = True
+        self.lag = 0.0
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'primary_queries': 0,
+            'replica_queries': 0,
+            'replica_reads': 0,
+            'sticky_primary_reads': 0,
+            'fallback_reads': 0,
+            'failed_checks': 0,
+        }
+
+    def replica_for_read(self):
+        engine = self.engine
+        if engine is None:
+            return None
+        if _client_is_sticky():
+            self.stats['sticky_primary_reads'] += 1
+            return None
+        if not self._replica_usable(engine):
+            self.stats['fallback_reads'] += 1
+            return None
+        self.stats['replica_reads'] += 1
+        return engine
+
+    def _replica_usable(self, engine):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._check(engine)
+                    self._checked_at = now
+        return self.healthy and self.lag <= self.max_lag
+
+    def _check(self, engine):
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(text(self.lag_query or 'SELECT 0')).scalar()
+            self.lag = float(lag or 0.0)
+            self.healthy = True
+        except Exception:
+            logger.warning('Replica health check failed; reading from the primary', exc_info=True)
+            self.stats['failed_checks'] += 1
+            self.healthy = False
+
+
+def _client_is_sticky():
+    if not has_request_context():
+        return False
+    return client_session.get(_STICKY_KEY, 0) > time.time()
+
+
+def init_app(app, db):
+    from app.config import engine_options
+    from app.database import apply_sqlite_pragmas
+
+    replica = None
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        # A plain engine rather than a Flask-SQLAlchemy bind, so create_all()/drop_all() never touch it.
+        replica = create_engine(replica_uri, **engine_options(app.config, replica_uri))
+        apply_sqlite_pragmas(replica, app.config.get('SQLITE_PRAGMAS'))
+
+    router = ReplicaRouter(app, replica)
+    app.extensions[_EXTENSION_KEY] = router
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _counter(router, 'primary_queries'))
+    if replica is not None:
+        event.listen(replica, 'before_cursor_execute', _counter(router, 'replica_queries'))
+
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+    @app.after_request
+    def pin_writer_to_primary(response):
+        if router.engine is not None and g.get('_db_client_wrote'):
+            client_session[_STICKY_KEY] = time.time() + sticky_seconds
+        return response
+
+
+def _counter(router, key):
+    def count(conn, cursor, statement, parameters, context, executemany):
+        router.stats[key] += 1
+    return count
+
+
+def get_router():
+    return current_app.extensions[_EXTENSION_KEY]
+
+
+def route_reads_to_replica():
+    """before_request hook that lets the rest of the request, including streamed bodies, read from the replica."""
+    g._db_use_replica = True
+
+
+@contextmanager
+def use_replica():
+    """Lets SELECTs inside the block read from the replica, subject to the fallbacks above."""
+    previous = g.get('_db_use_replica', False)
+    g._db_use_replica = True
+    try:
+        yield
+    finally:
+        g._db_use_replica = previous
+
+
+def replica_reads(view):
+    """Decorator for read-only views whose queries may be served by the replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,158 @@
+"""
+Sales rollups: per-product, per-day-per-product and per-customer totals.
+
+Checkout adds its orders to the rollups in its own transaction (see
+record_orders), so reading best sellers or a customer's totals costs one
+indexed lookup however many orders exist. `rebuild` recomputes every rollup
+from the order table with one GROUP BY per rollup; run it after changing
+orders by other means (`flask sales-rebuild`, or the 'rebuild_sales' job).
+
+Orders placed before Order.created_at existed have no date; they count in the
+product and customer totals but not in any day.
+"""
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app import db, model_events
+from app.cart_service import round_money
+from app.models import CustomerSales, DailyProductSales, Order, Product, ProductSales
+from app.sql import upsert
+
+
+DEFAULT_TOP_LIMIT = 10
+MAX_TOP_LIMIT = 100
+MAX_TOP_DAYS = 366
+
+TOP_FIELDS = ('id', 'product_name', 'units', 'revenue', 'orders')
+ORDER_FIELDS = ('order_id', 'product_id', 'product_name', 'quantity', 'price', 'status', 'created_at', 'checkout_id')
+
+
+def _accumulate(model, key_columns, rows, returning=()):
+    """
+    Adds `rows` to `model`'s counters, inserting the rows whose key is new, in one
+    executemany. Returns the result, with the `returning` columns of every row.
+    """
+    stmt = upsert(model)
+    set_ = {name: getattr(model, name) + getattr(stmt.excluded, name) for name in ('orders', 'units', 'revenue')}
+    if 'last_ordered_at' in model.__table__.c:
+        set_['last_ordered_at'] = stmt.excluded.last_ordered_at
+    stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_)
+    if returning:
+        stmt = stmt.returning(*returning)
+    return db.session.connection().execute(stmt, rows)
+
+
+def record_orders(customer_id, lines, ordered_at):
+    """
+    Adds orders to the rollups, in the caller's transaction. The new ProductSales
+    units are published through app.model_events when it commits.
+
+    Parameters:
+        customer_id (int): The customer who placed them.
+        lines (list): Dicts with 'product_id', 'quantity' and 'price_per_item', one per order.
+        ordered_at (datetime): When they were placed.
+    """
+    if not lines:
+        return
+    day = ordered_at.date()
+    per_product = [{
+        'product_link': line['product_id'],
+        'orders': 1,
+        'units': line['quantity'],
+        'revenue': line['quantity'] * line['price_per_item'],
+    } for line in lines]
+
+    units = _accumulate(ProductSales, [ProductSales.product_link],
+                        [dict(row, last_ordered_at=ordered_at) for row in per_product],
+                        returning=(ProductSales.product_link, ProductSales.units)).all()
+    model_events.mark_changed(db.session, ProductSales, [product_id for product_id, _ in units],
+                              {product_id: {'units': total} for product_id, total in units})
+    _accumulate(DailyProductSales, [DailyProductSales.day, DailyProductSales.product_link],
+                [dict(row, day=day) for row in per_product])
+    _accumulate(CustomerSales, [CustomerSales.customer_link], [{
+        'customer_link': customer_id,
+        'orders': len(lines),
+        'units': sum(row['units'] for row in per_product),
+        'revenue': sum(row['revenue'] for row in per_product),
+        'last_ordered_at': ordered_at,
+    }])
+
+
+def rebuild(connection):
+    """Recomputes every rollup from the order table on `connection`, inside its transaction."""
+    orders = Order.__table__.c
+    totals = (sa.func.count(), sa.func.sum(orders.quantity), sa.func.sum(orders.quantity * orders.price))
+
+    for model in (ProductSales, DailyProductSales, CustomerSales):
+        connection.execute(sa.delete(model.__table__))
+
+    connection.execute(sa.insert(ProductSales.__table__).from_select(
+        ['product_link', 'orders', 'units', 'revenue', 'last_ordered_at'],
+        sa.select(orders.product_link, *totals, sa.func.max(orders.created_at)).group_by(orders.product_link),
+    ))
+    day = sa.func.date(orders.created_at)
+    connection.execute(sa.insert(DailyProductSales.__table__).from_select(
+        ['day', 'product_link', 'orders', 'units', 'revenue'],
+        sa.select(day, orders.product_link, *totals)
+        .where(orders.created_at.is_not(None))
+        .group_by(day, orders.product_link),
+    ))
+    connection.execute(sa.insert(CustomerSales.__table__).from_select(
+        ['customer_link', 'orders', 'units', 'revenue', 'last_ordered_at'],
+        sa.select(orders.customer_link, *totals, sa.func.max(orders.created_at)).group_by(orders.customer_link),
+    ))
+
+
+def top_products(limit=DEFAULT_TOP_LIMIT, days=None):
+    """
+    Returns the best-selling products by units, as tuples in TOP_FIELDS order.
+
+    Parameters:
+        limit (int): Number of products.
+        days (int): Only count the last `days` days, today included; None for all time.
+    """
+    if days is None:
+        query = (
+            db.select(ProductSales.product_link, Product.product_name, ProductSales.units,
+                      ProductSales.revenue, ProductSales.orders)
+            .join(Product, Product.id == ProductSales.product_link)
+            .order_by(ProductSales.units.desc(), ProductSales.product_link)
+        )
+    else:
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        units = sa.func.sum(DailyProductSales.units)
+        query = (
+            db.select(DailyProductSales.product_link, Product.product_name, units,
+                      sa.func.sum(DailyProductSales.revenue), sa.func.sum(DailyProductSales.orders))
+            .join(Product, Product.id == DailyProductSales.product_link)
+            .where(DailyProductSales.day >= since)
+            .group_by(DailyProductSales.product_link, Product.product_name)
+            .order_by(units.desc(), DailyProductSales.product_link)
+        )
+    return [(product_id, name, units, round_money(revenue), orders)
+            for product_id, name, units, revenue, orders in db.session.execute(query.limit(limit))]
+
+
+def customer_summary(customer_id):
+    """Returns the customer's order totals from the rollup."""
+    row = db.session.get(CustomerSales, customer_id)
+    if row is None:
+        return {'orders': 0, 'units': 0, 'revenue': 0.0, 'last_ordered_at': None}
+    return {'orders': row.orders, 'units': row.units, 'revenue': round_money(row.revenue),
+            'last_ordered_at': row.last_ordered_at}
+
+
+def customer_orders(customer_id, limit, before=None):
+    """Returns one page of the customer's orders, newest first, as tuples in ORDER_FIELDS order."""
+    query = (
+        db.select(Order.id, Order.product_link, Product.product_name, Order.quantity, Order.price,
+                  Order.status, Order.created_at, Order.checkout_link)
+        .join(Product, Product.id == Order.product_link)
+        .where(Order.customer_link == customer_id)
+        .order_by(Order.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        query = query.where(Order.id < before)
+    return [tuple(row) for row in db.session.execute(query)]
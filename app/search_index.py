@@ -0,0 +1,152 @@
+"""
+In-process inverted index over Product.product_name, ranked with BM25.
+
+The index is built lazily from the database on first use, then kept in sync
+through committed Product changes and rebuilt when another process changes the
+catalog (see app.catalog_index), so searches never scan the Product table.
+"""
+import math
+import re
+import threading
+
+from app import db
+from app.catalog_index import CatalogIndex
+from app.models import Product
+
+
+_EXTENSION_KEY = 'product_search_index'
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Splits text into lowercase alphanumeric tokens."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Token -> {doc id: term frequency} postings with BM25 scoring.
+
+    Queries use AND semantics: every query token must appear in a document for
+    it to match. All methods are thread safe.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._doc_tokens = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def add(self, doc_id, text):
+        """Indexes `text` under `doc_id`, replacing any previous text for that id."""
+        tokens = tokenize(text)
+        with self._lock:
+            self._remove(doc_id)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, tf in frequencies.items():
+                self._postings.setdefault(token, {})[doc_id] = tf
+            self._doc_tokens[doc_id] = (len(tokens), tuple(frequencies))
+            self._total_length += len(tokens)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_tokens.clear()
+            self._total_length = 0
+
+    def search(self, query, limit=None):
+        """
+        Returns (doc id, score) pairs for documents containing every token of `query`.
+
+        Results are ordered by descending BM25 score, ties broken by ascending id.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+
+            doc_count = len(self._doc_tokens)
+            avg_length = self._total_length / doc_count
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+
+            scores = dict.fromkeys(candidates, 0.0)
+            for posting in postings:
+                df = len(posting)
+                idf = math.log((doc_count - df + 0.5) / (df + 0.5) + 1.0)
+                for doc_id in candidates:
+                    tf = posting[doc_id]
+                    length = self._doc_tokens[doc_id][0]
+                    norm = self.k1 * (1.0 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit is not None else ranked
+
+    def _remove(self, doc_id):
+        entry = self._doc_tokens.pop(doc_id, None)
+        if entry is None:
+            return
+        length, tokens = entry
+        self._total_length -= length
+        for token in tokens:
+            posting = self._postings[token]
+            del posting[doc_id]
+            if not posting:
+                del self._postings[token]
+
+
+class ProductSearchIndex(CatalogIndex, SearchIndex):
+    """SearchIndex over product names, built from the database and kept current; see app.catalog_index."""
+
+    extension_key = _EXTENSION_KEY
+
+    def _load(self):
+        rows = db.session.execute(
+            db.select(Product.id, Product.product_name).execution_options(yield_per=1000)
+        )
+        for product_id, product_name in rows:
+            self.add(product_id, product_name)
+
+    def _apply(self, changes):
+        for product_id in changes.deleted:
+            self.remove(product_id)
+        for product_id, values in changes.upserted.items():
+            if not values:
+                return False
+            if 'product_name' in values:
+                self.add(product_id, values['product_name'])
+        return True
+
+
+def init_app(app):
+    ProductSearchIndex.init_app(app)
+
+
+def get_index():
+    """Returns the current app's product index, building or rebuilding it if needed."""
+    return ProductSearchIndex.get()
+
+
+ProductSearchIndex.subscribe()
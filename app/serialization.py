@@ -0,0 +1,108 @@
+"""
+JSON encoding for API responses.
+
+FastJSONProvider encodes with orjson when it is installed and otherwise falls
+back to Flask's standard provider. Documents are equivalent either way: keys
+are sorted as with `sort_keys`, output is indented in debug mode, and dates and
+other non-JSON types go through Flask's default conversions. Only non-ASCII
+text differs, sent as UTF-8 rather than \\u escapes.
+
+Large listings can also be requested in a columnar layout with
+`?format=columnar`: {"columns": [...], "rows": [[...], ...]} names each field
+once instead of repeating it in every row. List endpoints also take
+`fields=id,price` to send only the named fields (see requested_fields).
+
+Configuration:
+    JSON_PROVIDER: 'auto' (orjson if importable), 'orjson' or 'default'.
+"""
+import operator
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+COLUMNAR = 'columnar'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson."""
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def make_provider(app):
+    """Returns the JSON provider selected by JSON_PROVIDER for `app`."""
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice not in ('auto', 'orjson', 'default'):
+        raise ValueError(f"Unknown JSON_PROVIDER {choice!r}; expected 'auto', 'orjson' or 'default'")
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+    if choice == 'default' or orjson is None:
+        return DefaultJSONProvider(app)
+    return FastJSONProvider(app)
+
+
+def wants_columnar():
+    """True when the request asked for the columnar layout with ?format=columnar."""
+    return request.args.get('format') == COLUMNAR
+
+
+def columnar(columns, rows, **extra):
+    """Builds a {"columns": [...], "rows": [[...]]} document, plus any `extra` top-level keys."""
+    return {'columns': list(columns), 'rows': [list(row) for row in rows], **extra}
+
+
+def requested_fields(available, default=None):
+    """
+    Returns the fields named by the request's comma-separated `fields` parameter, in
+    the order given, or `default` (all of `available`) when it is absent.
+
+    Raises:
+        ValueError: If a name is unknown or repeated.
+    """
+    value = request.values.get('fields')
+    if not value:
+        return tuple(default or available)
+    fields = tuple(name.strip() for name in value.split(','))
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(unknown) + '; expected some of ' + ', '.join(available))
+    if len(set(fields)) != len(fields):
+        raise ValueError('fields must not repeat a name')
+    return fields
+
+
+def project(available, fields, rows):
+    """Returns `rows` of `available` values cut down to `fields`, in that order."""
+    if tuple(fields) == tuple(available):
+        return rows
+    getter = operator.itemgetter(*[available.index(name) for name in fields])
+    if len(fields) == 1:
+        return [(getter(row),) for row in rows]
+    return [getter(row) for row in rows]
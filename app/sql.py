@@ -0,0 +1,24 @@
+"""
+Dialect-specific SQL constructs shared across the app.
+"""
+import importlib
+
+from app import db
+
+
+# Dialect packages are imported on first use: the PostgreSQL one alone costs tens of
+# milliseconds of worker startup, and a deployment only ever needs one of them.
+_UPSERT_DIALECTS = {
+    'postgresql': 'sqlalchemy.dialects.postgresql',
+    'sqlite': 'sqlalchemy.dialects.sqlite',
+}
+
+
+def upsert(model):
+    """Returns the dialect's INSERT ... ON CONFLICT construct for `model`."""
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    try:
+        module = _UPSERT_DIALECTS[dialect]
+    except KeyError:
+        raise NotImplementedError(f'Upserts are not supported on {dialect}') from None
+    return importlib.import_module(module).insert(model)
@@ -0,0 +1,209 @@
+"""
+Search-as-you-type suggestions over product names.
+
+Every product name is indexed once per word start: "Red Cotton Shirt" is
+stored under "red cotton shirt", "cotton shirt" and "shirt", in one sorted
+list of (key, product id) entries. The products completing a prefix are one
+contiguous slice of that list, found with two bisections.
+
+Matches are ranked by in-stock first, then popularity (units ordered, from the
+ProductSales rollup), then stock count. Broad prefixes match thousands of entries, so the ranked top list
+of any slice longer than SCAN_LIMIT is kept until a product under that prefix
+changes. A suggestion is therefore a couple of bisections plus at most
+SCAN_LIMIT entries ranked, never a database query.
+
+Like the search index, it is built from the database on first use, kept in
+sync through committed Product changes and rebuilt when another process
+changes the catalog (see app.catalog_index). Popularity between rebuilds
+follows the ProductSales units that checkouts in this process commit (see
+app.sales.record_orders); stock changes only move the stock count.
+"""
+import bisect
+import heapq
+import threading
+
+from flask import current_app, has_app_context
+
+from app import db, model_events
+from app.cache import LRUCache
+from app.catalog_index import CatalogIndex
+from app.models import Product, ProductSales
+from app.search_index import tokenize
+
+
+_EXTENSION_KEY = 'suggest_index'
+_END = '\U0010ffff'
+
+# Slices up to this many entries are ranked on every request; longer ones are cached.
+SCAN_LIMIT = 256
+# Suggestions kept per cached prefix; requests may ask for up to this many.
+MAX_LIMIT = 50
+
+
+def _keys(name):
+    tokens = tokenize(name)
+    return [' '.join(tokens[start:]) for start in range(len(tokens))]
+
+
+class SuggestIndex:
+    """Sorted word-start keys over product names; see the module docstring. Thread safe."""
+
+    def __init__(self, top_cache_size=4096):
+        self._lock = threading.RLock()
+        self._top = LRUCache(maxsize=top_cache_size)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._products = {}  # id -> [name, in_stock, popularity]
+            self._top.clear()
+
+    def __len__(self):
+        return len(self._products)
+
+    def __contains__(self, product_id):
+        return product_id in self._products
+
+    def load(self, rows):
+        """Replaces the contents with `rows` of (id, name, in_stock, popularity)."""
+        with self._lock:
+            self._products = {product_id: [name, in_stock, popularity]
+                              for product_id, name, in_stock, popularity in rows}
+            self._entries = sorted((key, product_id) for product_id, (name, _, _) in self._products.items()
+                                   for key in _keys(name))
+            self._top.clear()
+
+    def upsert(self, product_id, name=None, in_stock=None, popularity=None):
+        """
+        Adds or updates one product. A new product needs `name` and `in_stock`;
+        for a known one, None keeps the current value.
+        """
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is None:
+                if name is None or in_stock is None:
+                    raise ValueError(f'New product {product_id} needs a name and a stock count')
+                product = self._products[product_id] = [name, in_stock, popularity or 0]
+                self._insert_keys(product_id, name)
+                return
+            self._forget_tops(product[0])
+            if name is not None and name != product[0]:
+                self._remove_keys(product_id, product[0])
+                self._insert_keys(product_id, name)
+                product[0] = name
+            if in_stock is not None:
+                product[1] = in_stock
+            if popularity is not None:
+                product[2] = popularity
+
+    def remove(self, product_id):
+        with self._lock:
+            product = self._products.pop(product_id, None)
+            if product is not None:
+                self._remove_keys(product_id, product[0])
+
+    def _insert_keys(self, product_id, name):
+        self._forget_tops(name)
+        for key in _keys(name):
+            bisect.insort(self._entries, (key, product_id))
+
+    def _remove_keys(self, product_id, name):
+        self._forget_tops(name)
+        for key in _keys(name):
+            position = bisect.bisect_left(self._entries, (key, product_id))
+            if position < len(self._entries) and self._entries[position] == (key, product_id):
+                del self._entries[position]
+
+    def _forget_tops(self, name):
+        # Drop every cached ranking this product could appear in: those of the prefixes of its keys.
+        for key in _keys(name):
+            for length in range(1, len(key) + 1):
+                self._top.pop(key[:length])
+
+    def _rank(self, product_id):
+        _, in_stock, popularity = self._products[product_id]
+        return (in_stock > 0, popularity, in_stock, -product_id)
+
+    def suggest(self, query, limit=10):
+        """
+        Returns up to `limit` (id, name) pairs of products with a word sequence
+        starting with `query`, best ranked first.
+        """
+        prefix = ' '.join(tokenize(query))
+        if not prefix or limit < 1:
+            return []
+        limit = min(limit, MAX_LIMIT)
+        with self._lock:
+            ranked = self._top.get(prefix)
+            if ranked is None:
+                start = bisect.bisect_left(self._entries, (prefix,))
+                end = bisect.bisect_left(self._entries, (prefix + _END,), start)
+                candidates = {product_id for _, product_id in self._entries[start:end]}
+                ranked = heapq.nlargest(MAX_LIMIT, candidates, key=self._rank)
+                if end - start > SCAN_LIMIT:
+                    self._top.set(prefix, ranked)
+            return [(product_id, self._products[product_id][0]) for product_id in ranked[:limit]]
+
+
+class ProductSuggestIndex(CatalogIndex, SuggestIndex):
+    """SuggestIndex over the Product table, built from the database and kept current; see app.catalog_index."""
+
+    extension_key = _EXTENSION_KEY
+
+    def _load(self):
+        self.load(db.session.execute(
+            db.select(Product.id, Product.product_name, Product.in_stock, db.func.coalesce(ProductSales.units, 0))
+            .outerjoin(ProductSales, ProductSales.product_link == Product.id)
+            .execution_options(yield_per=1000)
+        ))
+
+    def _apply(self, changes):
+        for product_id in changes.deleted:
+            self.remove(product_id)
+        for product_id, values in changes.upserted.items():
+            name, in_stock = values.get('product_name'), values.get('in_stock')
+            if product_id in self and not values:
+                return False
+            try:
+                self.upsert(product_id, name=name, in_stock=in_stock)
+            except ValueError:
+                return False
+        return True
+
+    def apply_sales(self, changes):
+        """Takes the popularity of products from committed ProductSales changes."""
+        with self._build_lock:
+            if not self.built:
+                return
+            if changes.reset or changes.deleted or not all('units' in values for values in changes.upserted.values()):
+                self.invalidate()
+                return
+            for product_id, values in changes.upserted.items():
+                if product_id in self:
+                    self.upsert(product_id, popularity=values['units'])
+
+    @classmethod
+    def subscribe(cls):
+        super().subscribe()
+        model_events.subscribe(ProductSales, cls._on_sales_change)
+
+    @classmethod
+    def _on_sales_change(cls, changes):
+        if not has_app_context():
+            return
+        index = current_app.extensions.get(cls.extension_key)
+        if index is not None:
+            index.apply_sales(changes)
+
+
+def init_app(app):
+    ProductSuggestIndex.init_app(app)
+
+
+def get_suggest_index():
+    """Returns the current app's suggestion index, building or rebuilding it if needed."""
+    return ProductSuggestIndex.get()
+
+
+ProductSuggestIndex.subscribe()
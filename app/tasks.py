@@ -0,0 +1,67 @@
+"""
+Background job handlers; see app.jobs.
+
+Each handler receives the job's JSON payload and runs inside an app context.
+Handlers may run more than once for the same job, so they must be idempotent.
+"""
+import logging
+
+from app import db
+from app.jobs import handler
+from app.models import Customer, Order
+
+
+logger = logging.getLogger(__name__)
+
+
+@handler('send_welcome_email')
+def send_welcome_email(payload):
+    """Sends the sign-up confirmation. There is no mail service yet, so the message is only logged."""
+    customer = db.session.get(Customer, payload['customer_id'])
+    if customer is None:
+        logger.info('Welcome email skipped: customer %s no longer exists', payload['customer_id'])
+        return
+    logger.info('Welcome email to %s <%s>', customer.username, customer.email)
+
+
+@handler('reconcile_payment')
+def reconcile_payment(payload):
+    """
+    Checks a checkout's orders against the payment they reference.
+
+    No payment provider is integrated yet, so this stub only totals the orders
+    per payment_id and logs orders that were placed without one.
+    """
+    rows = db.session.execute(
+        db.select(Order.payment_id, db.func.count(), db.func.sum(Order.quantity * Order.price))
+        .where(Order.checkout_link == payload['checkout_id'])
+        .group_by(Order.payment_id)
+    ).all()
+    for payment_id, orders, amount in rows:
+        if not payment_id:
+            logger.warning('Checkout %s has %d orders without a payment id', payload['checkout_id'], orders)
+        else:
+            logger.info('Checkout %s: payment %s should cover %.2f over %d orders',
+                        payload['checkout_id'], payment_id, amount, orders)
+
+
+@handler('refresh_search_index')
+def refresh_search_index(payload):
+    """
+    Bumps the catalog version, so every web worker rebuilds its search, price and
+    suggestion indexes on its next read (see app.catalog_index). Only needed after
+    products were changed outside the app, e.g. with SQL; app commits bump it themselves.
+    """
+    from app.catalog_version import bump
+
+    bump(db.session())
+    db.session.commit()
+
+
+@handler('rebuild_sales')
+def rebuild_sales(payload):
+    """Recomputes the sales rollups from the order table, after orders were changed outside checkout."""
+    from app.sales import rebuild
+
+    rebuild(db.session.connection())
+    db.session.commit()
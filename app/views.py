@@ -1,7 +1,16 @@
-from flask import Blueprint, render_template, flash, redirect, request, jsonify
+from flask import Blueprint, render_template, flash, redirect, request, jsonify, current_app
 from app.models import Product, Cart, Order
 from flask_login import login_required, current_user
 from app import db
+from app.cart_service import (
+    CART_LINE_FIELDS, CartItemError, add_item, apply_batch, cart_lines, change_quantity, lines_total,
+    remove_item
+)
+from app.checkout_service import CheckoutError, checkout as place_checkout
+from app.product_cache import get_product
+from app.routing import replica_reads
+from app import sales
+from app.serialization import columnar, requested_fields, wants_columnar
 
 
 views = Blueprint('views', __name__)
@@ -25,52 +34,177 @@ def add_to_cart(item_id):
         or if there's an exception during database operation.'''
     test_user_id = 1  
 
-    item_to_add = Product.query.get(item_id)
+    item_to_add = get_product(item_id)
     if item_to_add:
-        item_exists = Cart.query.filter_by(product_link=item_id, customer_link=test_user_id).first()
-        if item_exists:
-            try:
-                item_exists.quantity += 1
-                db.session.commit()
-                return jsonify(message=f'Quantity of {item_exists.product.product_name} has been updated'), 200
-            except Exception as e:
-                return jsonify(error=str(e)), 500
-
-        new_cart_item = Cart(quantity=1, product_link=item_id, customer_link=test_user_id)
         try:
-            db.session.add(new_cart_item)
+            quantity = add_item(test_user_id, item_to_add.id)
             db.session.commit()
-            return jsonify(message=f'{item_to_add.product_name} added to cart'), 200
         except Exception as e:
+            db.session.rollback()
             return jsonify(error=str(e)), 500
+        if quantity > 1:
+            return jsonify(message=f'Quantity of {item_to_add.product_name} has been updated'), 200
+        return jsonify(message=f'{item_to_add.product_name} added to cart'), 200
     else:
         return jsonify(error='Product not found'), 404
 
 
+def _cart_id_arg():
+    cart_id = request.args.get('cart_id')
+    if not cart_id:
+        raise CartItemError('No cart ID provided', 400)
+    try:
+        return int(cart_id)
+    except ValueError:
+        raise CartItemError('Invalid cart ID', 400) from None
+
+
+@views.errorhandler(CartItemError)
+def cart_item_error(e):
+    db.session.rollback()
+    return jsonify({'error': e.message}), e.status
+
+
+@views.errorhandler(CheckoutError)
+def checkout_error(e):
+    db.session.rollback()
+    body = {'error': e.message}
+    if e.product_ids:
+        body['product_ids'] = e.product_ids
+    return jsonify(body), e.status
+
+
 
 @views.route('/cart', methods=['GET', 'POST'])
 # @login_required 
+@replica_reads
 def show_cart():
     """
     Displays the current user's cart, including product names, quantities, and prices.
     
     Retrieves all cart items for the current user, calculates the subtotal for each item, and computes the total cart amount. Responds with this data in JSON format.
     
+    Accepts a comma-separated 'fields' parameter (e.g. ?fields=product_id,quantity)
+    naming the item fields to send; all of them by default.
+
     Returns:
-        JSON response containing the cart items' details and the total amount.
+        JSON response containing the cart items' details and the total amount,
+        with the items as 'columns' and 'rows' when ?format=columnar is given,
+        or an error message with HTTP status code 400 for unknown fields.
     """   
     test_user_id = 1 
 
-    cart_items = Cart.query.filter_by(customer_link=test_user_id).all()
-    cart_data = [{
-        'product_name': item.product.product_name,
-        'quantity': item.quantity,
-        'price_per_item': item.product.current_price,
-        'subtotal': item.quantity * int(item.product.current_price)
-    } for item in cart_items]
+    try:
+        fields = requested_fields(CART_LINE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cart_data = cart_lines(test_user_id)
+    total = lines_total(cart_data)
+    if wants_columnar():
+        rows = ([line[field] for field in fields] for line in cart_data)
+        return jsonify(columnar(fields, rows, total=total))
+    if fields != CART_LINE_FIELDS:
+        cart_data = [{field: line[field] for field in fields} for line in cart_data]
+    return jsonify(cart=cart_data, total=total)
+
+@views.route('/cart/batch', methods=['POST'])
+# @login_required
+def batch_cart():
+    """
+    Applies several cart operations in one request and one transaction.
+
+    Expects a JSON payload with 'operations', a list of objects such as
+    {"op": "add", "product_id": 1, "quantity": 2}, {"op": "set", "product_id": 2, "quantity": 5}
+    or {"op": "remove", "product_id": 3}. Operations are applied in order; if any of them
+    is invalid or names an unknown product, nothing is changed.
+
+    Returns:
+        JSON response containing the resulting cart items and total amount,
+        or an error message with appropriate HTTP status code.
+    """
+    test_user_id = 1
+
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('operations'), list):
+        return jsonify({'error': 'A list of operations is required'}), 400
+
+    operations = data['operations']
+    max_operations = current_app.config.get('CART_BATCH_MAX_OPERATIONS', 500)
+    if len(operations) > max_operations:
+        return jsonify({'error': f'At most {max_operations} operations are allowed per batch'}), 400
+
+    apply_batch(test_user_id, operations)
+    db.session.commit()
+
+    cart_data = cart_lines(test_user_id)
+    return jsonify(cart=cart_data, total=lines_total(cart_data))
+
+@views.route('/checkout', methods=['POST'])
+# @login_required
+def checkout():
+    """
+    Places an order for every item in the user's cart and empties the cart.
+
+    Requires an 'Idempotency-Key' header; retrying with the same key returns the
+    original checkout instead of ordering and decrementing stock again. Accepts an
+    optional JSON payload with 'payment_id'. Stock is reserved for all items or none.
+
+    Returns:
+        JSON response with the checkout id, the created orders and the total, with HTTP
+        status code 201 (200 for a replayed key), or an error message with HTTP status
+        code 400 for a missing key or empty cart and 409 with the 'product_ids' that are
+        out of stock.
+    """
+    test_user_id = 1
+
+    data = request.get_json(silent=True) or {}
+    payment_id = str(data.get('payment_id') or '')
+    result, replayed = place_checkout(test_user_id, request.headers.get('Idempotency-Key'), payment_id)
+
+    response = jsonify(result)
+    response.status_code = 200 if replayed else 201
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@views.route('/orders', methods=['GET'])
+# @login_required
+@replica_reads
+def list_orders():
+    """
+    Lists the user's orders, newest first, with their overall totals.
+
+    Query parameters:
+        limit (int): Page size, at most ORDERS_MAX_PAGE_SIZE (default 20).
+        before (int): Only orders with an id lower than this are returned.
 
-    total_amount = sum(float(item['subtotal']) for item in cart_data) 
-    return jsonify(cart=cart_data, total=total_amount)
+    Returns:
+        JSON response with 'orders' (or 'columns' and 'rows' with ?format=columnar),
+        'summary' (orders, units, revenue and last_ordered_at over all the user's orders)
+        and 'next_before', the cursor for the next page (null on the last page), or an
+        error message with HTTP status code 400.
+    """
+    test_user_id = 1
+
+    max_page_size = current_app.config.get('ORDERS_MAX_PAGE_SIZE', 100)
+    try:
+        limit = int(request.args.get('limit', 20))
+        before = request.args.get('before')
+        before = int(before) if before not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be integers'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, max_page_size)
+
+    rows = sales.customer_orders(test_user_id, limit, before)
+    summary = sales.customer_summary(test_user_id)
+    next_before = rows[-1][0] if len(rows) == limit else None
+    if wants_columnar():
+        return jsonify(columnar(sales.ORDER_FIELDS, rows, summary=summary, next_before=next_before))
+    return jsonify(orders=[dict(zip(sales.ORDER_FIELDS, row)) for row in rows],
+                   summary=summary, next_before=next_before)
 
 @views.route('/pluscart')
 # @login_required
@@ -88,27 +222,14 @@ def plus_cart():
     """
     test_user_id = 1 
 
-    cart_id = request.args.get('cart_id')
-    if cart_id is None:
-        return jsonify({'error': 'No cart ID provided'}), 400
-
-    cart_item = Cart.query.get(cart_id)
-    if not cart_item:
-        return jsonify({'error': 'Cart item not found'}), 404
-
-    # Check if the cart_item belongs to the test_user_id
-    if cart_item.customer_link != test_user_id:
-        return jsonify({'error': 'Access denied'}), 403
-
-    cart_item.quantity += 1 
+    # One conditional UPDATE; it only matches the test user's own cart line.
+    quantity = change_quantity(test_user_id, _cart_id_arg(), 1)
     db.session.commit()
 
-    cart = Cart.query.filter_by(customer_link=test_user_id).all()
-
-    amount = sum(int(item.product.current_price) * item.quantity for item in cart)
+    amount = lines_total(cart_lines(test_user_id))
 
     data = {
-        'quantity': cart_item.quantity,    
+        'quantity': quantity,
         'total': amount  
     }
 
@@ -130,31 +251,19 @@ def minus_cart():
     """   
     test_user_id = 1 
 
-    cart_id = request.args.get('cart_id')
-    if cart_id is None:
-        return jsonify({'error': 'No cart ID provided'}), 400
-
-    cart_item = Cart.query.get(cart_id)
-    if not cart_item :
-        return jsonify({'error': 'Cart item not found or access denied'}), 404
-
-    if cart_item.quantity > 0:
-        cart_item.quantity -= 1
-        db.session.commit()
+    # UPDATE ... WHERE quantity > 0, so the quantity can never go negative.
+    quantity = change_quantity(test_user_id, _cart_id_arg(), -1)
+    db.session.commit()
 
-        cart = Cart.query.filter_by(customer_link=test_user_id).all()
+    amount = lines_total(cart_lines(test_user_id))
 
-        amount = sum(int(int(item.product.current_price) * item.quantity) for item in cart)
-        
-        data = {
-            'quantity': cart_item.quantity,
-            'amount': amount,
-            'total': amount
-        }
+    data = {
+        'quantity': quantity,
+        'amount': amount,
+        'total': amount
+    }
 
-        return jsonify(data)
-    else:
-        return jsonify({'error': 'Quantity cannot be less than zero'}), 400
+    return jsonify(data)
 
 
 @views.route('/removecart', methods=['GET'])
@@ -172,20 +281,9 @@ def remove_cart():
         no cart ID is provided, or the current user does not have permission to remove the cart item.
     """
     test_user_id = 1
-    cart_id = request.args.get('cart_id')
-    if not cart_id:
-        return jsonify({'error': 'No cart ID provided'}), 400
-
-    cart_item = Cart.query.get(cart_id)
-    if not cart_item:
-        return jsonify({'error': 'Cart item not found'}), 404
-    if cart_item.customer_link != test_user_id:
-        return jsonify({'error': 'Access denied'}), 403
-    quantity_deleted = cart_item.quantity 
-    db.session.delete(cart_item)
+    quantity_deleted = remove_item(test_user_id, _cart_id_arg())
     db.session.commit()
-    cart = Cart.query.filter_by(customer_link=test_user_id).all()
-    amount = sum(item.product.current_price * item.quantity for item in cart)
+    amount = lines_total(cart_lines(test_user_id))
 
     data = {
         'quantity': quantity_deleted, 
@@ -0,0 +1,107 @@
+"""
+Worker warmup: fills per-process caches before a worker takes traffic.
+
+Each step loads one cache the first requests would otherwise pay for. Run the
+steps listed in WARMUP_STEPS from a server's post-fork hook, for example in a
+gunicorn config:
+
+    def post_worker_init(worker):
+        from app.warmup import warmup
+        warmup(worker.wsgi)
+
+or set WARMUP_ON_START to run them at the end of create_app. `flask warmup`
+runs them once and reports how long each took.
+
+Configuration:
+    WARMUP_ON_START: Run the warmup steps when the app is created.
+    WARMUP_STEPS: Names of the steps to run, in order; see STEPS.
+"""
+import logging
+import time
+
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = ('catalog_version', 'search_index', 'price_index', 'suggest', 'product_cache', 'listing')
+
+
+def _catalog_version():
+    from app.catalog_version import current_version
+    current_version()
+
+
+def _search_index():
+    from app.search_index import get_index
+    get_index()
+
+
+def _price_index():
+    from app.price_index import get_price_index
+    get_price_index()
+
+
+def _suggest():
+    from app.suggest import get_suggest_index
+    get_suggest_index()
+
+
+def _product_cache():
+    from app import db
+    from app.models import Product
+    from app.product_cache import get_cache, get_products
+
+    ids = db.session.execute(db.select(Product.id).order_by(Product.id).limit(get_cache().maxsize)).scalars().all()
+    get_products(ids)
+
+
+def _listing():
+    # Goes through the full request path, so the compressed listing lands in its cache.
+    response = current_app.test_client().get('/productsearch', headers={'Accept-Encoding': 'gzip'})
+    response.get_data()  # The body is streamed; it is cached once it has been read to the end.
+    response.close()
+
+
+STEPS = {
+    'catalog_version': _catalog_version,
+    'search_index': _search_index,
+    'price_index': _price_index,
+    'suggest': _suggest,
+    'product_cache': _product_cache,
+    'listing': _listing,
+}
+
+
+def warmup(app, steps=None):
+    """
+    Runs warmup steps for `app`.
+
+    Parameters:
+        steps (iterable): Step names; defaults to WARMUP_STEPS.
+
+    Returns:
+        Dict of step name to the seconds it took. A step that fails is logged
+        and skipped: a cold cache is slower, not broken.
+    """
+    steps = app.config.get('WARMUP_STEPS', DEFAULT_STEPS) if steps is None else steps
+    unknown = [name for name in steps if name not in STEPS]
+    if unknown:
+        raise ValueError(f'Unknown warmup steps: {", ".join(unknown)}')
+
+    timings = {}
+    with app.app_context():
+        for name in steps:
+            started = time.perf_counter()
+            try:
+                STEPS[name]()
+            except Exception:
+                logger.exception('Warmup step %s failed', name)
+                continue
+            finally:
+                # Steps must not leave a session (and its connection) behind in the worker.
+                from app import db
+                db.session.remove()
+            timings[name] = time.perf_counter() - started
+    logger.info('Warmup finished: %s', ', '.join(f'{name} {seconds:.3f}s' for name, seconds in timings.items()))
+    return timings
@@ -0,0 +1,452 @@
+"""
+Latency, throughput and query-count benchmarks for the API endpoints.
+
+Seeds a temporary SQLite database with synthetic products, customers and cart
+lines, then drives every endpoint scenario in two modes:
+
+- client: sequential requests through Flask's test client, counting the SQL
+  statements each request executes;
+- server: concurrent HTTP requests against `benchmarks.serve`, a local server
+  with several worker processes.
+
+Each scenario reports p50/p95/p99 latency, requests per second, errors and
+(client mode) queries per request. Results are compared with
+benchmarks/baseline.json and the run exits non-zero on a regression.
+
+    python -m benchmarks.bench_endpoints                   # run and compare
+    python -m benchmarks.bench_endpoints --update-baseline # record a new baseline
+    python -m benchmarks.bench_endpoints --mode client --scenario cart
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from app import create_app, db
+from benchmarks.seed import BENCH_PASSWORD, SEARCH_TERMS, seed
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+CUSTOMER_ID = 1  # The cart views act for the hard-coded test user.
+# Allowed growth of queries per request, in queries; below one, so a query added to
+# every request always counts. See compare.
+QUERY_TOLERANCE = 0.5
+# Latency growth in ms that is always ignored as jitter on very fast endpoints. The
+# p99 of a scenario is set by its two slowest requests, so it gets the widest margin.
+LATENCY_JITTER_MS = {'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 5.0}
+
+
+class Context:
+    """State shared by the scenarios of one run against one database."""
+
+    def __init__(self, db_path, settings):
+        self.db_path = db_path
+        self.settings = settings
+        self.rng = random.Random(settings['seed'])
+        self.run_id = f'{os.getpid()}-{int(time.time() * 1000)}'
+        self.cart_ids = []
+        self.removable_ids = []
+
+    def query(self, sql, params=()):
+        with sqlite3.connect(self.db_path, timeout=30) as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def random_product(self):
+        return self.rng.randint(1, self.settings['products'])
+
+
+class Scenario:
+    """
+    One endpoint under test.
+
+    Parameters:
+        build (callable): (ctx, i) -> (method, path, form, json) for the i-th request.
+        prepare (callable): Optional (ctx, count) hook run before the scenario's requests.
+        auth (bool): Password-hashing endpoints, which run --auth-requests requests.
+        warmup (bool): Safe to repeat, so a few unmeasured requests warm the caches first.
+    """
+
+    def __init__(self, name, build, prepare=None, auth=False, warmup=False):
+        self.name = name
+        self.build = build
+        self.prepare = prepare
+        self.auth = auth
+        self.warmup = warmup
+
+
+def _load_cart_ids(ctx, count):
+    ctx.cart_ids = [row[0] for row in ctx.query(
+        'SELECT id FROM cart WHERE customer_link = ? ORDER BY id', (CUSTOMER_ID,))]
+
+
+def _add_removable_lines(ctx, count):
+    # Fresh lines for products not yet in the cart, one per removal.
+    in_cart = {row[0] for row in ctx.query('SELECT product_link FROM cart WHERE customer_link = ?', (CUSTOMER_ID,))}
+    candidates = [pid for pid in range(1, ctx.settings['products'] + 1) if pid not in in_cart][:count]
+    with sqlite3.connect(ctx.db_path, timeout=30) as connection:
+        connection.executemany(
+            'INSERT INTO cart (customer_link, product_link, quantity) VALUES (?, ?, 1)',
+            [(CUSTOMER_ID, pid) for pid in candidates])
+    placeholders = ','.join('?' * len(candidates))
+    ctx.removable_ids = [row[0] for row in ctx.query(
+        f'SELECT id FROM cart WHERE customer_link = ? AND product_link IN ({placeholders})',
+        (CUSTOMER_ID, *candidates))]
+
+
+def _cart_line(ctx, i):
+    return ctx.cart_ids[i % len(ctx.cart_ids)]
+
+
+SCENARIOS = [
+    Scenario('productsearch_page', lambda ctx, i: (
+        'GET', f'/productsearch?limit=100&after={ctx.rng.randint(0, ctx.settings["products"])}', None, None),
+        warmup=True),
+    Scenario('productsearch_stream', lambda ctx, i: ('GET', '/productsearch', None, None), warmup=True),
+    Scenario('productsearch_post', lambda ctx, i: (
+        'POST', '/productsearch', {'search': ctx.rng.choice(SEARCH_TERMS)}, None), warmup=True),
+    Scenario('productsearch_post_price', lambda ctx, i: (
+        'POST', '/productsearch', {'min_price': '500', 'max_price': '1500'}, None), warmup=True),
+    Scenario('add_to_cart', lambda ctx, i: ('GET', f'/add-to-cart/{ctx.random_product()}', None, None)),
+    Scenario('cart', lambda ctx, i: ('GET', '/cart', None, None), prepare=_load_cart_ids, warmup=True),
+    Scenario('pluscart', lambda ctx, i: ('GET', f'/pluscart?cart_id={_cart_line(ctx, i)}', None, None),
+             prepare=_load_cart_ids),
+    # Same count and spread as pluscart, so no line is decremented below its seeded quantity.
+    Scenario('minuscart', lambda ctx, i: ('GET', f'/minuscart?cart_id={_cart_line(ctx, i)}', None, None),
+             prepare=_load_cart_ids),
+    Scenario('removecart', lambda ctx, i: ('GET', f'/removecart?cart_id={ctx.removable_ids[i]}', None, None),
+             prepare=_add_removable_lines),
+    Scenario('sign_up', lambda ctx, i: ('POST', '/sign-up', None, {
+        'email': f'bench-{ctx.run_id}-{i}@bench.test',
+        'username': f'bench-{ctx.run_id}-{i}',
+        'password1': BENCH_PASSWORD,
+        'password2': BENCH_PASSWORD,
+    }), auth=True),
+    Scenario('login', lambda ctx, i: ('POST', '/login', None, {
+        'email': f'customer{ctx.rng.randint(1, ctx.settings["customers"])}@bench.test',
+        'password': BENCH_PASSWORD,
+    }), auth=True, warmup=True),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, queries=None):
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if queries is not None:
+        result['queries_per_request'] = round(queries / len(latencies), 2)
+    return result
+
+
+def _request_count(scenario, settings):
+    return settings['auth_requests'] if scenario.auth else settings['requests']
+
+
+def _make_app(db_path, settings):
+    return create_app({
+        'PROFILE': 'prod',
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'PASSWORD_HASH_METHOD': settings['hash_method'],
+    })
+
+
+def prepare_database(settings):
+    """Creates and seeds a temporary database; returns its path."""
+    fd, db_path = tempfile.mkstemp(prefix='bench-', suffix='.db')
+    os.close(fd)
+    app = _make_app(db_path, settings)
+    with app.app_context():
+        seed(settings['products'], settings['customers'], settings['cart_lines'], settings['seed'])
+        db.engine.dispose()
+    return db_path
+
+
+def run_client(scenarios, settings, echo):
+    db_path = prepare_database(settings)
+    ctx = Context(db_path, settings)
+    app = _make_app(db_path, settings)
+    client = app.test_client()
+    statements = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+
+    def send(method, path, form, payload):
+        response = client.open(path, method=method, data=form, json=payload)
+        response.get_data()  # Drain streamed bodies inside the timing.
+        return response.status_code
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            count_requests = _request_count(scenario, settings)
+            if scenario.prepare is not None:
+                scenario.prepare(ctx, count_requests)
+            if scenario.warmup:
+                for i in range(settings['warmup']):
+                    send(*scenario.build(ctx, i))
+
+            requests = [scenario.build(ctx, i) for i in range(count_requests)]
+            latencies, errors = [], 0
+            statements[0] = 0
+            started = time.perf_counter()
+            for request in requests:
+                t0 = time.perf_counter()
+                status = send(*request)
+                latencies.append(time.perf_counter() - t0)
+                errors += status >= 400
+            elapsed = time.perf_counter() - started
+            results[scenario.name] = summarize(latencies, errors, elapsed, statements[0])
+            echo(_format_row('client', scenario.name, results[scenario.name]))
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        _remove_database(db_path)
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'benchmark server exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'{base_url}/productsearch?limit=1', timeout=2) as response:
+                response.read()
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError('benchmark server did not start in time')
+
+
+def _http(base_url, method, path, form, payload):
+    data, headers = None, {}
+    if form is not None:
+        data = urllib.parse.urlencode(form).encode()
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    elif payload is not None:
+        data = json.dumps(payload).encode()
+        headers['Content-Type'] = 'application/json'
+    request = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except (urllib.error.URLError, ConnectionError):
+        status = 599
+    return time.perf_counter() - t0, status
+
+
+def run_server(scenarios, settings, echo):
+    db_path = prepare_database(settings)
+    ctx = Context(db_path, settings)
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--db', db_path, '--port', str(port),
+         '--workers', str(settings['workers']), '--hash-method', settings['hash_method']],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    results = {}
+    try:
+        _wait_for_server(base_url, process)
+        with ThreadPoolExecutor(max_workers=settings['concurrency']) as pool:
+            for scenario in scenarios:
+                count_requests = _request_count(scenario, settings)
+                if scenario.prepare is not None:
+                    scenario.prepare(ctx, count_requests)
+                if scenario.warmup:
+                    for i in range(settings['warmup']):
+                        _http(base_url, *scenario.build(ctx, i))
+
+                requests = [scenario.build(ctx, i) for i in range(count_requests)]
+                started = time.perf_counter()
+                timings = list(pool.map(lambda request: _http(base_url, *request), requests))
+                elapsed = time.perf_counter() - started
+                latencies = [latency for latency, _ in timings]
+                errors = sum(status >= 400 for _, status in timings)
+                results[scenario.name] = summarize(latencies, errors, elapsed)
+                echo(_format_row('server', scenario.name, results[scenario.name]))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        _remove_database(db_path)
+    return results
+
+
+def _remove_database(db_path):
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(db_path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _format_row(mode, name, result):
+    queries = result.get('queries_per_request')
+    return (f'{mode:<6} {name:<26} n={result["requests"]:<5} err={result["errors"]:<3} '
+            f'p50={result["p50_ms"]:>8.2f}ms p95={result["p95_ms"]:>8.2f}ms p99={result["p99_ms"]:>8.2f}ms '
+            f'rps={result["rps"]:>8.1f}' + (f' q/req={queries:.2f}' if queries is not None else ''))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares a run with the stored baseline.
+
+    Latency may grow and throughput shrink by `tolerance` (a fraction), and
+    latency also by LATENCY_JITTER_MS, before it counts. Queries per request may
+    grow by QUERY_TOLERANCE queries, which absorbs occasional queries such as
+    the catalog version reload every CATALOG_VERSION_TTL but not one more query
+    per request, however many queries the endpoint makes; any increase in errors
+    is a regression.
+
+    Returns:
+        List of human-readable regression messages, empty if none.
+    """
+    regressions = []
+    for mode, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get(mode, {}).get(name)
+            if previous is None:
+                continue
+            label = f'{mode}/{name}'
+            for key, jitter in LATENCY_JITTER_MS.items():
+                limit = max(previous[key] * (1 + tolerance), previous[key] + jitter)
+                if current[key] > limit:
+                    regressions.append(f'{label}: {key} {current[key]:.2f} > {previous[key]:.2f} (+{tolerance:.0%})')
+            if previous.get('rps') and current['rps'] < previous['rps'] / (1 + tolerance):
+                regressions.append(f'{label}: rps {current["rps"]:.1f} < {previous["rps"]:.1f} (-{tolerance:.0%})')
+            if 'queries_per_request' in previous and current.get('queries_per_request') is not None:
+                if current['queries_per_request'] > previous['queries_per_request'] + QUERY_TOLERANCE:
+                    regressions.append(f'{label}: queries/request {current["queries_per_request"]:.2f} '
+                                       f'> {previous["queries_per_request"]:.2f} (+{QUERY_TOLERANCE})')
+            if current['errors'] > previous['errors']:
+                regressions.append(f'{label}: errors {current["errors"]} > {previous["errors"]}')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+    parser.add_argument('--scenario', action='append', help='Only run the named scenario(s).')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--cart-lines', type=int, default=20, help='Cart lines for the benchmark customer.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+    parser.add_argument('--auth-requests', type=int, default=20, help='Requests per sign-up/login scenario.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests for repeatable scenarios.')
+    parser.add_argument('--workers', type=int, default=4, help='Server worker processes.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent server clients.')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed latency/throughput slowdown as a fraction (default 0.5).')
+    parser.add_argument('--update-baseline', action='store_true', help='Write this run as the new baseline.')
+    parser.add_argument('--output', help='Also write the results as JSON to this path.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = {
+        'products': args.products,
+        'customers': args.customers,
+        'cart_lines': args.cart_lines,
+        'requests': args.requests,
+        'auth_requests': args.auth_requests,
+        'warmup': args.warmup,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'hash_method': args.hash_method,
+        'seed': args.seed,
+    }
+    scenarios = SCENARIOS
+    if args.scenario:
+        unknown = set(args.scenario) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            sys.exit(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.scenario]
+
+    results = {}
+    if args.mode in ('client', 'both'):
+        results['client'] = run_client(scenarios, settings, print)
+    if args.mode in ('server', 'both'):
+        results['server'] = run_server(scenarios, settings, print)
+
+    report = {'settings': settings, **results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --update-baseline to record one.')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != settings:
+        print('WARNING: baseline was recorded with different settings; comparison may be meaningless.')
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\nPERFORMANCE REGRESSION', file=sys.stderr)
+        for message in regressions:
+            print(f'  {message}', file=sys.stderr)
+        return 1
+    print('\nNo regressions against the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Compares ways of turning the product catalog into a JSON response.
+
+- orm_default: ORM Product objects copied into dicts, encoded by Flask's json
+  provider (how POST /productsearch worked before column projection);
+- columns_default: column-projected rows, Flask's json provider;
+- columns_fast: column-projected rows, the orjson provider;
+- columnar_fast: column-projected rows in the columnar layout, orjson provider;
+- fields_fast: only id, product_name and price, as with `fields=`, orjson provider.
+
+    python -m benchmarks.bench_serialization --products 20000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app, db
+from app.models import Product
+from app.product_search import SEARCH_FIELDS, _SEARCH_COLUMNS, _search_values
+from app.serialization import FastJSONProvider, columnar, orjson, project
+from benchmarks.seed import seed
+
+
+FEW_FIELDS = ('id', 'product_name', 'price')
+
+
+def orm_rows():
+    return [{
+        'id': item.id,
+        'product_name': item.product_name,
+        'price': item.current_price,
+        'product_picture_link': item.product_picture,
+        'stock_status': 'Out of Stock' if item.in_stock > 0 else 'In Stock'
+    } for item in Product.query.order_by(Product.id).all()]
+
+
+def projected_rows():
+    return [_search_values(*row) for row in db.session.execute(db.select(*_SEARCH_COLUMNS).order_by(Product.id))]
+
+
+def run_variant(app, provider, build):
+    # A fresh session per run, so the ORM variant pays for identity-map population every time.
+    with app.app_context():
+        started = time.perf_counter()
+        body = provider.response(build()).get_data()
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+    return elapsed, len(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        seed(products=args.products, customers=1, cart_lines=0)
+
+    default = DefaultJSONProvider(app)
+    variants = {
+        'orm_default': (default, lambda: {'results': orm_rows()}),
+        'columns_default': (default, lambda: {'results': [dict(zip(SEARCH_FIELDS, row)) for row in projected_rows()]}),
+    }
+    if orjson is not None:
+        fast = FastJSONProvider(app)
+        variants['columns_fast'] = (fast, lambda: {
+            'results': [dict(zip(SEARCH_FIELDS, row)) for row in projected_rows()]})
+        variants['columnar_fast'] = (fast, lambda: columnar(SEARCH_FIELDS, projected_rows()))
+        variants['fields_fast'] = (fast, lambda: {'results': [
+            dict(zip(FEW_FIELDS, row)) for row in project(SEARCH_FIELDS, FEW_FIELDS, projected_rows())]})
+    else:
+        print('orjson is not installed; skipping the fast provider variants')
+
+    print(f'{args.products} products, median of {args.repeat} runs')
+    baseline = None
+    for name, (provider, build) in variants.items():
+        run_variant(app, provider, build)  # warm up
+        timings, size = [], 0
+        for _ in range(args.repeat):
+            elapsed, size = run_variant(app, provider, build)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(f'{name:<16} {median * 1000:>9.1f} ms  {size / 1024:>9.1f} KiB  {baseline / median:>5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Measures worker cold start: import, create_app and the first request.
+
+Every run is a fresh interpreter against the same seeded SQLite file, so
+nothing is shared between runs but the OS page cache. Reported per phase
+(median of --runs):
+
+- import: `from app import create_app`;
+- create_app: building the app, and the SQL statements it ran;
+- warmup: app.warmup, with --warmup only;
+- first_request: the first GET /productsearch?limit=50, and its SQL statements;
+- total: import to first response.
+
+--create-all adds a db.create_all() after create_app, which is what every
+boot used to do, for comparison.
+
+    python -m benchmarks.bench_startup --products 20000 --runs 5 [--warmup] [--create-all]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from app import create_app, db
+from benchmarks.seed import seed
+
+
+_CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = [0]
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.__setitem__(0, statements[0] + 1))
+
+options = json.loads(sys.argv[1])
+app = create_app({'PROFILE': 'prod', 'SECRET_KEY': 'benchmark', 'SQLALCHEMY_DATABASE_URI': options['uri']})
+if options['create_all']:
+    with app.app_context():
+        db.create_all()
+created = time.perf_counter()
+create_statements = statements[0]
+
+if options['warmup']:
+    from app.warmup import warmup
+    warmup(app)
+warmed = time.perf_counter()
+
+statements[0] = 0
+response = app.test_client().get('/productsearch?limit=50')
+response.get_data()
+assert response.status_code == 200, response.status_code
+finished = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'create_app_queries': create_statements,
+    'warmup': warmed - created,
+    'first_request': finished - warmed,
+    'first_request_queries': statements[0],
+    'total': finished - started,
+}))
+'''
+
+
+def prepare_database(products):
+    fd, db_path = tempfile.mkstemp(prefix='bench-startup-', suffix='.db')
+    os.close(fd)
+    app = create_app({'PROFILE': 'prod', 'SECRET_KEY': 'benchmark', 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        seed(products=products, customers=1, cart_lines=0)
+        db.engine.dispose()
+    return db_path
+
+
+def run_once(options):
+    output = subprocess.run([sys.executable, '-c', _CHILD, json.dumps(options)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true', help='Run app.warmup before the first request.')
+    parser.add_argument('--create-all', action='store_true', help='Also run db.create_all() at startup.')
+    args = parser.parse_args(argv)
+
+    db_path = prepare_database(args.products)
+    options = {'uri': f'sqlite:///{db_path}', 'warmup': args.warmup, 'create_all': args.create_all}
+    try:
+        run_once(options)  # Prime the page cache so every measured run starts equally warm.
+        runs = [run_once(options) for _ in range(args.runs)]
+    finally:
+        os.remove(db_path)
+
+    print(f'{args.products} products, median of {args.runs} fresh processes'
+          f'{", with warmup" if args.warmup else ""}{", with create_all" if args.create_all else ""}')
+    for phase in ('import', 'create_app', 'warmup', 'first_request', 'total'):
+        print(f'{phase:<14} {statistics.median(run[phase] for run in runs) * 1000:>9.1f} ms')
+    print(f"SQL statements: create_app {runs[-1]['create_app_queries']}, "
+          f"first request {runs[-1]['first_request_queries']}")
+
+
+if __name__ == '__main__':
+    main()
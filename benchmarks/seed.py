@@ -0,0 +1,73 @@
+"""
+Synthetic data for the benchmarks: products, customers and cart lines.
+"""
+import random
+
+from app import db
+from app.hashing import hash_password
+from app.models import Cart, Customer, Product
+
+
+BENCH_PASSWORD = 'benchmark-password'
+
+_ADJECTIVES = ['Solid', 'Printed', 'Striped', 'Checked', 'Slim', 'Regular', 'Casual', 'Formal', 'Washed', 'Knitted']
+_COLOURS = ['Black', 'White', 'Blue', 'Red', 'Green', 'Grey', 'Navy', 'Maroon', 'Olive', 'Multicolor']
+_AUDIENCES = ['Men', 'Women', 'Boys', 'Girls']
+_ITEMS = ['T-Shirt', 'Shirt', 'Track Pants', 'Jeans', 'Shorts', 'Kurta', 'Jacket', 'Sweatshirt', 'Trousers', 'Dress']
+
+SEARCH_TERMS = [item.lower() for item in _ITEMS] + ['solid men', 'blue jeans', 'women kurta', 'black t shirt']
+
+_CHUNK = 1000
+
+
+def product_name(rng):
+    return f'{rng.choice(_ADJECTIVES)} {rng.choice(_AUDIENCES)} {rng.choice(_COLOURS)} {rng.choice(_ITEMS)}'
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), _CHUNK):
+        db.session.execute(db.insert(model), rows[start:start + _CHUNK])
+    db.session.commit()
+
+
+def seed(products=5000, customers=200, cart_lines=20, seed=42):
+    """
+    Fills an empty schema with deterministic synthetic data.
+
+    Customer 1 is the user the cart endpoints act for and gets `cart_lines`
+    lines; every customer has the password BENCH_PASSWORD and the email
+    'customer<id>@bench.test'.
+
+    Returns:
+        Dict with the seeded counts.
+    """
+    rng = random.Random(seed)
+    db.create_all()
+
+    _insert(Product, [{
+        'id': product_id,
+        'sku': f'BENCH{product_id:08d}',
+        'product_name': product_name(rng),
+        'current_price': round(rng.uniform(199, 4999), 2),
+        'previous_price': round(rng.uniform(4999, 9999), 2),
+        'in_stock': rng.choice([0, 1, 5, 20, 100]),
+        'product_picture': str([f'https://img.bench.test/{product_id}/{n}.jpg' for n in range(4)]),
+    } for product_id in range(1, products + 1)])
+
+    # Hashing is deliberately slow, and every customer shares the password.
+    password_hash = hash_password(BENCH_PASSWORD)
+    _insert(Customer, [{
+        'id': customer_id,
+        'email': f'customer{customer_id}@bench.test',
+        'username': f'customer{customer_id}',
+        'password_hash': password_hash,
+    } for customer_id in range(1, customers + 1)])
+
+    lines = []
+    for customer_id in range(1, customers + 1):
+        count = cart_lines if customer_id == 1 else rng.randint(0, cart_lines)
+        for product_id in rng.sample(range(1, products + 1), min(count, products)):
+            lines.append({'customer_link': customer_id, 'product_link': product_id, 'quantity': rng.randint(1, 3)})
+    _insert(Cart, lines)
+
+    return {'products': products, 'customers': customers, 'cart_lines': len(lines)}
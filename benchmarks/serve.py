@@ -0,0 +1,86 @@
+"""
+Serves the app against a benchmark database with several worker processes.
+
+    python -m benchmarks.serve --db /tmp/bench.db --port 5050 --workers 4
+
+Workers are pre-forked and share one listening socket, like gunicorn's sync
+workers, so per-process caches survive between requests. Platforms without
+fork fall back to a single threaded server. With --warmup each worker runs
+app.warmup after forking, before it accepts connections.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+
+from werkzeug.serving import make_server
+
+from app import create_app, db
+from app.warmup import warmup
+
+
+def _serve_forever(app, host, port, fd, warm):
+    if warm:
+        warmup(app)
+    server = make_server(host, port, app, threaded=False, fd=fd)
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', required=True, help='SQLite database file to serve.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes.')
+    parser.add_argument('--warmup', action='store_true', help='Fill per-process caches before serving.')
+    parser.add_argument('--hash-method', default=None, help='PASSWORD_HASH_METHOD for the served app.')
+    args = parser.parse_args(argv)
+
+    config = {'PROFILE': 'prod', 'SECRET_KEY': 'benchmark', 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{args.db}'}
+    if args.hash_method:
+        config['PASSWORD_HASH_METHOD'] = args.hash_method
+    app = create_app(config)
+    # Connections opened while building the app must not be shared by the forked workers.
+    with app.app_context():
+        db.engine.dispose()
+
+    if not hasattr(os, 'fork'):
+        if args.warmup:
+            warmup(app)
+        make_server(args.host, args.port, app, threaded=True).serve_forever()
+        return
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _serve_forever(app, args.host, args.port, listener.fileno(), args.warmup)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+if __name__ == '__main__':
+    main()
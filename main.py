@@ -1,5 +1,12 @@
 from app import create_app
 
+try:
+    from dotenv import load_dotenv
+except ImportError:  # python-dotenv is optional; `flask` loads .env by itself when it is installed.
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv()
 
 app = create_app()
 
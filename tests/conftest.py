@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy import event
+from app import db
+
+
+@pytest.fixture
+def count_queries(app):
+    """Returns a function that runs fn() and returns (its result, the number of SQL statements it ran)."""
+    with app.app_context():
+        engine = db.engine
+
+    def count(fn):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return result, len(statements)
+    return count
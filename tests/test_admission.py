@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+from app import create_app, db
+from app.admission import ConcurrencyLimiter, TokenBucket, admission_controlled
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2.0, burst=2, now=0.0)
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == pytest.approx(0.5)
+    assert bucket.take(0.25) == pytest.approx(0.25)
+    assert bucket.take(0.5) == 0
+    assert bucket.take(100.0) == 0  # never more than the burst
+    assert bucket.take(100.0) == 0
+    assert bucket.take(100.0) > 0
+
+
+def test_concurrency_limiter_queues_then_sheds():
+    limiter = ConcurrencyLimiter(limit=1, queue_size=1)
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)  # waited and timed out
+
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: limiter.acquire(timeout=5) and admitted.set())
+    waiter.start()
+    while limiter.waiting == 0:
+        time.sleep(0.001)
+    assert not limiter.acquire(timeout=5)  # queue full: refused without waiting
+    limiter.release()
+    waiter.join()
+    assert admitted.is_set()
+    assert limiter.active == 1
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'ADMISSION_CLIENT_RATE': (0.001, 5),
+        'ADMISSION_ACCOUNT_RATE': (0.001, 2),
+        'ADMISSION_CONCURRENCY': {'slow': 1},
+        'ADMISSION_QUEUE_SIZE': 0,
+    })
+    release = threading.Event()
+    app.config['TEST_RELEASE'] = release
+
+    @app.route('/slow', endpoint='slow')
+    @admission_controlled(account_key=lambda: None)
+    def slow():
+        release.wait(5)
+        return 'done'
+
+    with app.app_context():
+        db.create_all()
+    yield app
+    release.set()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, email, address='10.0.0.1'):
+    return client.post('/login', json={'email': email, 'password': 'wrong'}, environ_base={'REMOTE_ADDR': address})
+
+
+def test_per_account_rate_limit(client):
+    assert login(client, 'victim@example.com').status_code == 401
+    assert login(client, 'Victim@example.com ', address='10.0.0.2').status_code == 401
+    response = login(client, 'victim@example.com', address='10.0.0.3')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert login(client, 'other@example.com').status_code == 401
+
+
+def test_per_client_rate_limit(client):
+    for i in range(5):
+        assert login(client, f'user{i}@example.com').status_code == 401
+    assert login(client, 'user5@example.com').status_code == 429
+    assert login(client, 'user5@example.com', address='10.0.0.9').status_code == 401
+
+
+def test_concurrency_limit_sheds_with_503(app):
+    first = threading.Thread(target=lambda: app.test_client().get('/slow'))
+    first.start()
+    control = app.extensions['admission']
+    while control.limiter('slow').active == 0:
+        time.sleep(0.001)
+    response = app.test_client().get('/slow')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    app.config['TEST_RELEASE'].set()
+    first.join()
+    assert app.test_client().get('/slow').status_code == 200
+
+
+def test_shed_requests_are_counted_in_metrics(client):
+    for _ in range(3):
+        login(client, 'victim@example.com')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'admission_shed_total{endpoint="auth.login",reason="account_rate"} 1' in body
+    assert 'admission_admitted_total{endpoint="auth.login"} 2' in body
+    assert 'cache_entries{cache="admission_buckets"} 2' in body
+
+
+def test_bucket_map_is_bounded():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'ADMISSION_MAX_BUCKETS': 3})
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    for i in range(5):
+        login(client, f'user{i}@example.com')
+    assert len(app.extensions['admission_buckets']) == 3
+
+
+def test_admission_can_be_disabled(app, client):
+    app.config['ADMISSION_ENABLED'] = False
+    for _ in range(5):
+        assert login(client, 'victim@example.com').status_code == 401
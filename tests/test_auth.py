@@ -68,3 +68,68 @@ class TestLogin:
         response = client.post('/login', json={'email': "'; DROP TABLE Customer; --", 'password': "'; DROP TABLE Customer; --"})
         assert response.status_code == 401
         assert response.get_json() == {'error': 'Invalid email or password'}
+
+
+class TestPasswordHashing:
+    def test_normalize_method_fills_in_defaults(self):
+        from app.hashing import normalize_method
+        assert normalize_method('pbkdf2') == normalize_method('pbkdf2:sha256')
+        assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+
+    def test_pool_size_is_shared_between_web_workers(self, app):
+        from app.hashing import _workers, default_workers
+        with patch('app.hashing.os.cpu_count', return_value=8):
+            assert default_workers() == 8
+            assert default_workers(4) == 2
+            assert default_workers(16) == 1
+            app.config.update(PASSWORD_HASH_WORKERS=None, WEB_WORKERS=4)
+            with app.app_context():
+                assert _workers() == 2
+
+    def test_slow_hashes_answer_503_with_retry_after(self, app, client):
+        from app.hashing import shutdown
+        app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_TIMEOUT=0.001)
+        try:
+            response = client.post('/sign-up', json={'email': 'slow@example.com', 'username': 'slow',
+                                                     'password1': 'password123', 'password2': 'password123'})
+        finally:
+            shutdown()
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert response.get_json() == {'error': 'Service busy, please retry'}
+
+    def test_login_rehashes_outdated_password_hash(self, app, client):
+        from werkzeug.security import generate_password_hash
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        with app.app_context():
+            db.session.add(Customer(email='old@example.com', username='old',
+                                    password_hash=generate_password_hash('secret', 'pbkdf2:sha256:1000')))
+            db.session.commit()
+
+        response = client.post('/login', json={'email': 'old@example.com', 'password': 'secret'})
+        assert response.status_code == 200
+        with app.app_context():
+            stored = Customer.query.filter_by(email='old@example.com').one().password_hash
+        assert stored.startswith('pbkdf2:sha256:2000$')
+
+
+class TestIdentityCache:
+    def test_loader_is_served_from_cache_and_evicted_on_password_change(self, app, client):
+        from app.identity import get_cache
+        client.post('/sign-up', json={'email': 'id@example.com', 'username': 'ident',
+                                      'password1': 'password123', 'password2': 'password123'})
+        assert client.post('/login', json={'email': 'id@example.com', 'password': 'password123'}).status_code == 200
+        with app.app_context():
+            user_id = Customer.query.filter_by(email='id@example.com').one().id
+
+        wrong = {'current_password': 'nope', 'new_password': 'password456', 'confirm_new_password': 'password456'}
+        assert client.post(f'/change-password/{user_id}', json=wrong).status_code == 401
+        assert client.post(f'/change-password/{user_id}', json=wrong).status_code == 401
+        with app.app_context():
+            assert user_id in get_cache()
+            assert get_cache().stats()['hits'] == 1
+
+        response = client.post(f'/change-password/{user_id}', json=dict(wrong, current_password='password123'))
+        assert response.status_code == 200
+        with app.app_context():
+            assert user_id not in get_cache()
@@ -0,0 +1,71 @@
+import pytest
+from app import create_app, db
+from app.cache import LRUCache
+from app.models import Product
+from app.product_cache import get_cache, get_product
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    clock.now = 4.9
+    assert cache.get('a') == 1
+    clock.now = 5.0
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Product(id=1, product_name='Cached Product', current_price=10.0,
+                               previous_price=12.0, product_picture='c.jpg', in_stock=4))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+
+def test_product_reads_are_served_from_cache(app):
+    assert get_product(1).product_name == 'Cached Product'
+    assert get_product('1').current_price == 10.0
+    assert get_cache().stats()['hits'] == 1
+    assert get_product(999) is None
+
+
+def test_committed_update_evicts_cached_product(app):
+    assert get_product(1).current_price == 10.0
+    db.session.get(Product, 1).current_price = 8.0
+    db.session.commit()
+    assert 1 not in get_cache()
+    assert get_product(1).current_price == 8.0
+
+
+def test_rolled_back_update_keeps_cached_product(app):
+    get_product(1)
+    db.session.get(Product, 1).current_price = 8.0
+    db.session.flush()
+    db.session.rollback()
+    assert 1 in get_cache()
+    assert get_product(1).current_price == 10.0
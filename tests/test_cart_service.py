@@ -0,0 +1,124 @@
+import pytest
+from app import create_app, db
+from app.cart_service import CartItemError, add_item, cart_lines, change_quantity, lines_total, remove_item
+from app.models import Cart, Customer, Product
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='cart@example.com', username='cart', password_hash='x'))
+        for product_id in range(1, 41):
+            db.session.add(Product(id=product_id, product_name=f'Product {product_id}', current_price=9.99,
+                                   previous_price=12.0, product_picture='p.jpg', in_stock=5))
+            db.session.add(Cart(quantity=product_id % 3 + 1, customer_link=1, product_link=product_id))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+
+def test_cart_lines_use_a_single_query(app, count_queries):
+    lines, queries = count_queries(lambda: cart_lines(1))
+    assert queries == 1
+    assert len(lines) == 40
+    assert lines[0] == {'cart_id': 1, 'product_id': 1, 'product_name': 'Product 1',
+                        'quantity': 2, 'price_per_item': 9.99, 'subtotal': 19.98}
+
+
+def test_lines_total(app):
+    assert lines_total(cart_lines(1)) == 799.2
+
+
+def test_empty_cart_total_is_zero(app):
+    assert cart_lines(2) == []
+    assert lines_total(cart_lines(2)) == 0.0
+
+
+def test_cart_endpoints_report_the_same_total(app):
+    client = app.test_client()
+    plus = client.get('/pluscart?cart_id=1').json['total']
+    minus = client.get('/minuscart?cart_id=2').json['total']
+    assert minus == client.get('/cart').json['total'] == round(plus - 9.99, 2)
+    removed = client.get('/removecart?cart_id=3').json['total']
+    assert removed == client.get('/cart').json['total'] == lines_total(cart_lines(1))
+
+
+def test_add_item_upserts_a_single_row(app):
+    assert add_item(1, 1) == 3
+    assert add_item(1, 1, quantity=2) == 5
+    db.session.commit()
+    assert Cart.query.filter_by(customer_link=1, product_link=1).count() == 1
+
+
+def test_decrement_stops_at_zero(app):
+    add_item(2, 1)
+    cart_id = Cart.query.filter_by(customer_link=2).one().id
+    assert change_quantity(2, cart_id, -1) == 0
+    with pytest.raises(CartItemError) as excinfo:
+        change_quantity(2, cart_id, -1)
+    assert excinfo.value.status == 400
+
+
+def test_mutations_reject_other_customers_lines(app):
+    with pytest.raises(CartItemError) as excinfo:
+        change_quantity(2, 1, 1)
+    assert excinfo.value.status == 403
+    with pytest.raises(CartItemError) as excinfo:
+        remove_item(1, 999)
+    assert excinfo.value.status == 404
+    assert remove_item(1, 1) == 2
+
+
+def test_batch_endpoint_applies_operations_in_one_request(app):
+    client = app.test_client()
+    response = client.post('/cart/batch', json={'operations': [
+        {'op': 'add', 'product_id': 1, 'quantity': 3},
+        {'op': 'set', 'product_id': 2, 'quantity': 1},
+        {'op': 'add', 'product_id': 2},
+        {'op': 'remove', 'product_id': 3},
+        {'op': 'set', 'product_id': 4, 'quantity': 0},
+    ]})
+    assert response.status_code == 200
+    quantities = {line['product_id']: line['quantity'] for line in response.json['cart']}
+    assert quantities[1] == 5
+    assert quantities[2] == 2
+    assert 3 not in quantities and 4 not in quantities
+    assert response.json['total'] == lines_total(cart_lines(1))
+
+
+def test_batch_endpoint_is_all_or_nothing(app):
+    client = app.test_client()
+    response = client.post('/cart/batch', json={'operations': [
+        {'op': 'add', 'product_id': 1},
+        {'op': 'add', 'product_id': 999},
+    ]})
+    assert response.status_code == 404
+    assert Cart.query.filter_by(customer_link=1, product_link=1).one().quantity == 2
+
+    response = client.post('/cart/batch', json={'operations': [{'op': 'add', 'product_id': 1, 'quantity': 0}]})
+    assert response.status_code == 400
+
+
+def test_adds_work_before_the_unique_index_migration(tmp_path):
+    from app import cart_service
+    from sqlalchemy import text
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'old.db'}"})
+    with app.app_context():
+        db.create_all()
+        db.session.execute(text('DROP INDEX uq_cart_customer_product'))
+        for product_id in (1, 2):
+            db.session.add(Product(id=product_id, product_name=f'Old Cart Product {product_id}', current_price=1.0,
+                                   previous_price=1.0, product_picture='p.jpg', in_stock=5))
+        db.session.commit()
+        cart_service._unique_lines.clear()
+
+        assert add_item(1, 1) == 1
+        assert add_item(1, 1, quantity=2) == 3
+        db.session.commit()
+        response = app.test_client().post('/cart/batch', json={'operations': [
+            {'op': 'add', 'product_id': 1}, {'op': 'set', 'product_id': 2, 'quantity': 7}]})
+        assert response.status_code == 200
+        assert sorted((line.product_link, line.quantity) for line in Cart.query.all()) == [(1, 4), (2, 7)]
+        db.session.remove()
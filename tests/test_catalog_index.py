@@ -0,0 +1,116 @@
+import pytest
+from app import create_app, db
+from app.models import Product
+
+
+def make_app(path):
+    return create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'CATALOG_VERSION_TTL': 0})
+
+
+@pytest.fixture
+def apps(tmp_path):
+    # Two processes' worth of app state over one database, like two web workers.
+    first, second = make_app(tmp_path / 'shared.db'), make_app(tmp_path / 'shared.db')
+    with first.app_context():
+        db.create_all()
+        db.session.add(Product(id=1, product_name='Desk Lamp', current_price=20.0, previous_price=20.0,
+                               product_picture='1.jpg', in_stock=5))
+        db.session.commit()
+    yield first, second
+    with first.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def add_product(app, product_id, name, price):
+    with app.app_context():
+        db.session.add(Product(id=product_id, product_name=name, current_price=price, previous_price=price,
+                               product_picture=f'{product_id}.jpg', in_stock=3))
+        db.session.commit()
+
+
+def search_ids(app, text):
+    response = app.test_client().post('/productsearch', data={'search': text})
+    return [row['id'] for row in response.get_json()['results']]
+
+
+def test_search_index_sees_other_processes_commits(apps):
+    first, second = apps
+    assert search_ids(second, 'lamp') == [1]
+    add_product(first, 2, 'Floor Lamp', 40.0)
+    assert search_ids(second, 'lamp') == [1, 2]
+    with first.app_context():
+        db.session.get(Product, 1).product_name = 'Desk Light'
+        db.session.commit()
+    assert search_ids(second, 'lamp') == [2]
+
+
+def test_own_commits_do_not_rebuild(apps):
+    first, _ = apps
+    assert search_ids(first, 'lamp') == [1]
+    index = first.extensions['product_search_index']
+    version = index.version
+    add_product(first, 2, 'Floor Lamp', 40.0)
+    assert index.built and index.version == version + 1
+    assert search_ids(first, 'lamp') == [1, 2]
+
+
+def test_price_index_sees_other_processes_commits(apps):
+    first, second = apps
+
+    def bucket_counts():
+        response = second.test_client().post('/productsearch', data={'price_buckets': '0,30'})
+        return [bucket['count'] for bucket in response.get_json()['price_facets']]
+
+    assert bucket_counts() == [1, 0]
+    add_product(first, 2, 'Floor Lamp', 40.0)
+    assert bucket_counts() == [1, 1]
+
+
+def test_suggestions_see_other_processes_commits(apps):
+    first, second = apps
+
+    def suggested_ids():
+        response = second.test_client().get('/productsearch/suggest?q=lamp')
+        return [row['id'] for row in response.get_json()['suggestions']]
+
+    assert suggested_ids() == [1]
+    add_product(first, 2, 'Floor Lamp', 40.0)
+    assert sorted(suggested_ids()) == [1, 2]
+
+
+def test_refresh_job_makes_other_processes_rebuild(apps):
+    from app import jobs
+    from app.catalog_version import load_version
+
+    first, second = apps
+    assert search_ids(second, 'lamp') == [1]
+    with first.app_context():
+        # A change made outside the app, which no commit hook sees.
+        db.session.connection().exec_driver_sql("UPDATE product SET product_name = 'Desk Light' WHERE id = 1")
+        db.session.commit()
+    assert search_ids(second, 'lamp') == [1]
+
+    with first.app_context():
+        version = load_version()[0]
+        jobs.enqueue('refresh_search_index')
+        db.session.commit()
+    assert jobs.Worker(first).run(burst=True) == 1
+    with first.app_context():
+        assert load_version()[0] == version + 1
+    assert search_ids(second, 'lamp') == []
+
+
+def test_product_cache_sees_other_processes_commits(apps):
+    first, second = apps
+
+    def search(**filters):
+        response = second.test_client().post('/productsearch', data={'search': 'lamp', **filters})
+        return [(row['id'], row['price']) for row in response.get_json()['results']]
+
+    assert search() == [(1, 20.0)]
+    with first.app_context():
+        db.session.get(Product, 1).current_price = 99.0
+        db.session.commit()
+    assert search() == [(1, 99.0)]
+    assert search(min_price='50') == [(1, 99.0)]
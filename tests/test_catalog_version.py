@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.http import http_date
+from app import create_app, db
+from app.catalog_version import VersionCache, current_version
+from app.checkout_service import checkout
+from app.models import Cart, Customer, Product
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'CATALOG_VERSION_TTL': 60})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='etag@example.com', username='etag', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Etag Shirt', current_price=10.0,
+                               previous_price=12.0, product_picture='e.jpg', in_stock=2))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_listing_revalidates_without_touching_the_database(app, client, count_queries):
+    first = client.get('/productsearch?limit=10')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'public, max-age=60'
+    assert first.headers['Last-Modified']
+
+    second, queries = count_queries(lambda: client.get('/productsearch?limit=10', headers={'If-None-Match': etag}))
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    assert queries == 0
+
+
+def test_etag_depends_on_normalized_parameters(client):
+    a = client.get('/productsearch?limit=10&after=0').headers['ETag']
+    b = client.get('/productsearch?after=0&limit=10').headers['ETag']
+    c = client.get('/productsearch?limit=5').headers['ETag']
+    assert a == b
+    assert a != c
+
+
+def test_product_changes_bump_the_version(app, client):
+    etag = client.get('/productsearch?limit=10').headers['ETag']
+    with app.app_context():
+        before = current_version()[0]
+        db.session.get(Product, 1).product_name = 'Renamed Shirt'
+        db.session.commit()
+        assert current_version()[0] == before + 1
+    response = client.get('/productsearch?limit=10', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Renamed Shirt' in response.data
+
+
+def test_stock_changes_bump_only_when_stock_status_changes(app):
+    with app.app_context():
+        start = current_version()[0]
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=1))
+        db.session.commit()
+        checkout(1, 'first')
+        assert current_version()[0] == start  # 2 -> 1, still in stock
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=1))
+        db.session.commit()
+        checkout(1, 'second')
+        assert current_version()[0] == start + 1  # 1 -> 0, now out of stock
+
+
+def test_rolled_back_changes_do_not_bump(app):
+    with app.app_context():
+        before = current_version()[0]
+        db.session.get(Product, 1).current_price = 1.0
+        db.session.flush()
+        db.session.rollback()
+        assert current_version()[0] == before
+
+
+def test_if_modified_since(client):
+    response = client.get('/productsearch?limit=10')
+    last_modified = response.headers['Last-Modified']
+    assert client.get('/productsearch?limit=10', headers={'If-Modified-Since': last_modified}).status_code == 304
+    earlier = http_date(datetime.utcnow() - timedelta(days=1))
+    assert client.get('/productsearch?limit=10', headers={'If-Modified-Since': earlier}).status_code == 200
+
+
+def test_post_search_and_errors_are_not_cached(client):
+    response = client.post('/productsearch', data={'search': 'shirt'})
+    assert 'ETag' not in response.headers
+    assert 'ETag' not in client.get('/productsearch?limit=0').headers
+
+
+def test_cache_control_is_configurable(app, client):
+    app.config['CATALOG_CACHE_CONTROL'] = 'no-cache'
+    assert client.get('/productsearch?limit=1').headers['Cache-Control'] == 'no-cache'
+    app.config['CATALOG_CACHE_CONTROL'] = None
+    assert 'Cache-Control' not in client.get('/productsearch?limit=1').headers
+
+
+def test_version_cache_expires_after_ttl():
+    now = [0.0]
+    loads = []
+    cache = VersionCache(ttl=5, clock=lambda: now[0])
+
+    def load():
+        loads.append(1)
+        return (len(loads), None)
+
+    assert cache.get(load) == (1, None)
+    now[0] = 4.9
+    assert cache.get(load) == (1, None)
+    now[0] = 5.0
+    assert cache.get(load) == (2, None)
+    cache.set((1, None))  # never moves backwards
+    assert cache.get(load) == (2, None)
@@ -0,0 +1,128 @@
+import pytest
+from flask import json
+from app import create_app, db
+from app.checkout_service import CheckoutError, checkout
+from app.models import Cart, Checkout, Customer, Order, Product
+from app.product_cache import get_product
+from app.search_index import get_index
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='buyer@example.com', username='buyer', password_hash='x'))
+        for product_id in range(1, 31):
+            db.session.add(Product(id=product_id, product_name=f'Checkout Product {product_id}',
+                                   current_price=10.0 + product_id, previous_price=50.0,
+                                   product_picture='p.jpg', in_stock=5))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def fill_cart(lines):
+    for product_id, quantity in lines.items():
+        db.session.add(Cart(customer_link=1, product_link=product_id, quantity=quantity))
+    db.session.commit()
+
+
+def test_checkout_creates_orders_and_empties_cart(app, client):
+    fill_cart({1: 2, 2: 1})
+    response = client.post('/checkout', headers={'Idempotency-Key': 'k1'}, json={'payment_id': 'pay_1'})
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['total'] == 2 * 11.0 + 12.0
+    assert [(order['product_id'], order['quantity'], order['price']) for order in data['orders']] == [
+        (1, 2, 11.0), (2, 1, 12.0)]
+
+    assert Cart.query.count() == 0
+    assert db.session.get(Product, 1).in_stock == 3
+    assert db.session.get(Product, 2).in_stock == 4
+    orders = Order.query.order_by(Order.id).all()
+    assert [order.id for order in orders] == [order['order_id'] for order in data['orders']]
+    assert {order.checkout_link for order in orders} == {data['checkout_id']}
+    assert {order.payment_id for order in orders} == {'pay_1'}
+
+
+def test_checkout_query_count_is_independent_of_cart_size(app, count_queries):
+    fill_cart({1: 1})
+    _, small = count_queries(lambda: checkout(1, 'small'))
+    fill_cart({product_id: 1 for product_id in range(2, 31)})
+    (result, _), large = count_queries(lambda: checkout(1, 'large'))
+    assert len(result['orders']) == 29
+    assert small == large
+
+
+def test_retry_with_same_key_does_not_order_twice(app, client):
+    fill_cart({1: 2})
+    first = client.post('/checkout', headers={'Idempotency-Key': 'retry'})
+    fill_cart({3: 1})
+    second = client.post('/checkout', headers={'Idempotency-Key': 'retry'})
+    assert second.status_code == 200
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(second.data) == json.loads(first.data)
+    assert Order.query.count() == 1
+    assert db.session.get(Product, 1).in_stock == 3
+    assert Cart.query.count() == 1
+
+
+def test_insufficient_stock_rolls_back_everything(app, client):
+    fill_cart({1: 2, 2: 6, 3: 9})
+    response = client.post('/checkout', headers={'Idempotency-Key': 'too-many'})
+    assert response.status_code == 409
+    assert json.loads(response.data) == {'error': 'Insufficient stock', 'product_ids': [2, 3]}
+    assert db.session.get(Product, 1).in_stock == 5
+    assert Order.query.count() == 0
+    assert Checkout.query.count() == 0
+    assert Cart.query.count() == 3
+
+    # The failed attempt did not use up the key.
+    Cart.query.filter(Cart.product_link != 1).delete()
+    db.session.commit()
+    assert client.post('/checkout', headers={'Idempotency-Key': 'too-many'}).status_code == 201
+
+
+def test_checkout_requires_key_and_items(client):
+    assert client.post('/checkout').status_code == 400
+    response = client.post('/checkout', headers={'Idempotency-Key': 'empty'})
+    assert response.status_code == 400
+    assert json.loads(response.data) == {'error': 'Cart is empty'}
+
+
+def test_zero_quantity_lines_are_not_ordered(app, client):
+    fill_cart({1: 0, 2: 1})
+    response = client.post('/checkout', headers={'Idempotency-Key': 'zero'})
+    assert response.status_code == 201
+    assert [order['product_id'] for order in json.loads(response.data)['orders']] == [2]
+    assert [order.product_link for order in Order.query.all()] == [2]
+    assert Cart.query.count() == 0
+    assert db.session.get(Product, 1).in_stock == 5
+
+    fill_cart({3: 0})
+    response = client.post('/checkout', headers={'Idempotency-Key': 'only-zero'})
+    assert response.status_code == 400
+    assert json.loads(response.data) == {'error': 'Cart is empty'}
+
+
+def test_checkout_error_is_raised_for_long_keys(app):
+    with pytest.raises(CheckoutError):
+        checkout(1, 'x' * 101)
+
+
+def test_stock_change_refreshes_caches_without_rebuilding_the_index(app):
+    fill_cart({1: 1})
+    assert get_product(1).in_stock == 5
+    index = get_index()
+    index.search('checkout')
+    assert index.built
+    checkout(1, 'cache')
+    assert get_product(1).in_stock == 4
+    assert index.built
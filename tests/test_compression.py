@@ -0,0 +1,122 @@
+import gzip
+import json
+
+import pytest
+from app import create_app, db
+from app.compression import compress
+from app.models import Product
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'CATALOG_VERSION_TTL': 60})
+
+    @app.route('/test-text')
+    def text():
+        return 'a' * int(app.config['TEST_TEXT_SIZE']), 200, {'Content-Type': 'text/plain'}
+
+    with app.app_context():
+        db.create_all()
+        for i in range(1, 41):
+            db.session.add(Product(id=i, product_name=f'Compressible product {i}', current_price=10.0 + i,
+                                   previous_price=20.0, product_picture=f'{i}.jpg', in_stock=5))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+
+
+def cache(app):
+    return app.extensions['compressed_bodies']
+
+
+def test_listing_is_gzipped_and_cached_by_catalog_version(app, client, count_queries):
+    plain = client.get('/productsearch')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    first = client.get('/productsearch', headers=GZIP)
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in first.headers['Vary']
+    assert json.loads(gzip.decompress(first.data)) == plain.get_json()
+    assert len(cache(app)) == 1
+
+    second, queries = count_queries(lambda: client.get('/productsearch', headers=GZIP))
+    assert queries == 0
+    assert second.data == first.data
+    assert second.headers['Content-Encoding'] == 'gzip'
+    assert cache(app).hits == 1
+
+
+def test_catalog_change_misses_the_cache(app, client):
+    client.get('/productsearch', headers=GZIP)
+    with app.app_context():
+        db.session.get(Product, 1).product_name = 'Renamed product'
+        db.session.commit()
+    response = client.get('/productsearch', headers=GZIP)
+    assert 'Renamed product' in gzip.decompress(response.data).decode()
+    assert cache(app).hits == 0
+
+
+def test_other_requests_are_cached_once_popular(app, client, count_queries):
+    url = '/productsearch?limit=30'
+    first = client.get(url, headers=GZIP)
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert len(cache(app)) == 0
+    client.get(url, headers=GZIP)
+    assert len(cache(app)) == 1
+    third, queries = count_queries(lambda: client.get(url, headers=GZIP))
+    assert queries == 0
+    assert gzip.decompress(third.data) == gzip.decompress(first.data)
+
+
+def test_post_search_is_compressed_and_keyed_by_form(app, client):
+    first = client.post('/productsearch', data={'search': 'compressible'}, headers=GZIP)
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(first.data))['results']) == 40
+    client.post('/productsearch', data={'search': 'compressible'}, headers=GZIP)
+    assert len(cache(app)) == 1
+    other = client.post('/productsearch', data={'search': 'product 7'}, headers=GZIP)
+    assert [row['id'] for row in other.get_json()['results']] == [7]  # below COMPRESS_MIN_SIZE
+
+
+def test_small_responses_are_sent_uncompressed(client):
+    response = client.get('/productsearch?limit=1', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['results'][0]['id'] == 1
+
+
+def test_refused_or_disabled_encodings_are_not_used(app, client):
+    assert 'Content-Encoding' not in client.get('/productsearch', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    app.config['COMPRESS_ENABLED'] = False
+    assert 'Content-Encoding' not in client.get('/productsearch', headers=GZIP).headers
+
+
+def test_compressed_responses_carry_weak_etags(client):
+    response = client.get('/productsearch?limit=30', headers=GZIP)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get('/productsearch?limit=30', headers={**GZIP, 'If-None-Match': etag}).status_code == 304
+
+
+def test_other_responses_are_compressed_above_the_threshold(app, client):
+    app.config['TEST_TEXT_SIZE'] = 2000
+    response = client.get('/test-text', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == b'a' * 2000
+    app.config['TEST_TEXT_SIZE'] = 100
+    assert 'Content-Encoding' not in client.get('/test-text', headers=GZIP).headers
+
+
+def test_compress_round_trips(app):
+    with app.app_context():
+        assert gzip.decompress(compress(b'{"results": []}' * 100, 'gzip')) == b'{"results": []}' * 100
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from app.config import engine_options
+
+
+def test_test_config_overrides_profile(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'app.db'}"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': uri})
+    assert app.config['PROFILE'] == 'test'
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == uri
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        create_app({'PROFILE': 'staging'})
+
+
+def test_sqlite_connections_get_pragmas(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"})
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+
+
+def test_server_databases_get_pool_options():
+    config = {
+        'SQLALCHEMY_DATABASE_URI': 'postgresql://localhost/shop',
+        'SQLALCHEMY_POOL_SIZE': 10, 'SQLALCHEMY_MAX_OVERFLOW': 20, 'SQLALCHEMY_POOL_TIMEOUT': 30,
+        'SQLALCHEMY_POOL_RECYCLE': 1800, 'SQLALCHEMY_POOL_PRE_PING': True,
+    }
+    assert engine_options(config) == {
+        'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30, 'pool_recycle': 1800, 'pool_pre_ping': True}
+    assert engine_options(dict(config, SQLALCHEMY_DATABASE_URI='sqlite:///:memory:')) == {}
+
+
+def test_deployments_setting_only_config_get_the_prod_profile(monkeypatch, tmp_path):
+    monkeypatch.delenv('APP_PROFILE', raising=False)
+    monkeypatch.setenv('CONFIG', f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setenv('KEY', 'from-env')
+    app = create_app()
+    assert app.config['PROFILE'] == 'prod'
+    assert not app.debug and not app.config['SLOW_QUERY_EXPLAIN']
+    assert app.config['SECRET_KEY'] == 'from-env'
+
+    monkeypatch.delenv('KEY')
+    with pytest.raises(RuntimeError):
+        create_app()
+
+
+def test_dev_profile_has_no_fixed_secret_key(monkeypatch, tmp_path):
+    monkeypatch.delenv('KEY', raising=False)
+    config = {'PROFILE': 'dev', 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"}
+    first, second = create_app(config), create_app(config)
+    assert first.config['SECRET_KEY'] and first.config['SECRET_KEY'] != second.config['SECRET_KEY']
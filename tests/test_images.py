@@ -0,0 +1,144 @@
+import json
+
+import pytest
+import sqlalchemy as sa
+from app import create_app, db, migrations
+from app.images import parse_images, primary_image
+from app.ingest import ingest_products
+from app.models import Cart, Customer, Product, ProductImage
+
+
+PICTURES = "['https://img.test/1/a.jpg', 'https://img.test/1/b.jpg']"
+
+
+def test_parse_images():
+    assert parse_images(PICTURES) == ['https://img.test/1/a.jpg', 'https://img.test/1/b.jpg']
+    assert parse_images(['https://img.test/x.jpg', '', 3]) == ['https://img.test/x.jpg']
+    assert parse_images('plain.jpg') == ['plain.jpg']
+    assert parse_images("['unterminated") == []
+    assert parse_images("[__import__('os')]") == []
+    assert parse_images('') == [] and parse_images(None) == []
+    assert primary_image(PICTURES) == 'https://img.test/1/a.jpg'
+    assert primary_image('[]') is None
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='images@example.com', username='images', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Blue Shirt', current_price=10.0, previous_price=20.0,
+                               product_picture=PICTURES, in_stock=3))
+        db.session.add(Product(id=2, product_name='Blue Jeans', current_price=30.0, previous_price=40.0,
+                               product_picture='jeans.jpg', in_stock=0))
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=2))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_primary_image_is_filled_on_insert(app):
+    assert db.session.get(Product, 1).primary_image == 'https://img.test/1/a.jpg'
+    assert db.session.get(Product, 2).primary_image == 'jeans.jpg'
+
+
+def test_search_sends_the_primary_image_and_requested_fields(app, client):
+    results = client.post('/productsearch', data={'search': 'shirt'}).get_json()['results']
+    assert results[0]['product_picture_link'] == 'https://img.test/1/a.jpg'
+
+    response = client.post('/productsearch', data={'search': 'blue', 'fields': 'id,price'})
+    assert response.get_json() == {'results': [{'id': 1, 'price': 10.0}, {'id': 2, 'price': 30.0}]}
+    response = client.post('/productsearch?format=columnar', data={'fields': 'price,id', 'max_price': '20'})
+    assert response.get_json() == {'columns': ['price', 'id'], 'rows': [[10.0, 1]]}
+
+
+def test_search_images_field_reads_product_images(app, client):
+    response = client.post('/productsearch', data={'search': 'blue', 'fields': 'id,images'})
+    assert response.get_json() == {'results': [
+        {'id': 1, 'images': ['https://img.test/1/a.jpg', 'https://img.test/1/b.jpg']},
+        {'id': 2, 'images': ['jeans.jpg']},
+    ]}
+
+
+def test_orm_writes_keep_images_in_step(app, client):
+    assert [image.url for image in db.session.get(Product, 1).images] == parse_images(PICTURES)
+
+    db.session.get(Product, 1).product_picture = "['https://img.test/1/new.jpg']"
+    db.session.commit()
+    assert db.session.get(Product, 1).primary_image == 'https://img.test/1/new.jpg'
+    assert ProductImage.query.filter_by(product_link=1).count() == 1
+    response = client.post('/productsearch', data={'search': 'shirt', 'fields': 'product_picture_link,images'})
+    assert response.get_json() == {'results': [
+        {'product_picture_link': 'https://img.test/1/new.jpg', 'images': ['https://img.test/1/new.jpg']}]}
+
+    db.session.get(Product, 1).product_name = 'Blue Shirt XL'  # pictures untouched
+    db.session.commit()
+    assert ProductImage.query.filter_by(product_link=1).count() == 1
+
+
+def test_bulk_inserted_products_fall_back_to_product_picture(app, client):
+    db.session.execute(db.insert(Product), [{'id': 3, 'product_name': 'Blue Cap', 'current_price': 5.0,
+                                             'previous_price': 5.0, 'in_stock': 1, 'product_picture': PICTURES}])
+    db.session.commit()
+    response = client.post('/productsearch', data={'search': 'cap', 'fields': 'product_picture_link,images'})
+    assert response.get_json() == {'results': [
+        {'product_picture_link': 'https://img.test/1/a.jpg', 'images': parse_images(PICTURES)}]}
+
+
+def test_listing_and_cart_fields(client):
+    page = client.get('/productsearch?limit=1&fields=id').get_json()
+    assert page == {'results': [{'id': 1}], 'next_after': 1}
+    streamed = client.get('/productsearch?fields=product_name,id').get_json()
+    assert streamed == {'results': [{'product_name': 'Blue Shirt', 'id': 1}, {'product_name': 'Blue Jeans', 'id': 2}]}
+    assert client.get('/cart?fields=product_id,quantity').get_json() == {
+        'cart': [{'product_id': 1, 'quantity': 2}], 'total': 20.0}
+
+
+def test_unknown_or_repeated_fields_are_rejected(client):
+    assert client.get('/productsearch?fields=id,product_picture_link').status_code == 400
+    assert client.post('/productsearch', data={'fields': 'id,id'}).status_code == 400
+    assert client.get('/cart?fields=password').status_code == 400
+
+
+def test_migration_converts_existing_pictures(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'images.db'}"})
+    with app.app_context():
+        migrations.upgrade(target=5)
+        with db.engine.begin() as connection:
+            connection.execute(sa.text('ALTER TABLE product DROP COLUMN primary_image'))
+            connection.execute(sa.text(
+                'INSERT INTO product (id, product_name, current_price, previous_price, in_stock, product_picture) '
+                "VALUES (1, 'Shirt', 1.0, 1.0, 1, :pictures), (2, 'Broken', 1.0, 1.0, 1, '[oops')"),
+                {'pictures': PICTURES})
+
+        assert migrations.upgrade() == [6]
+        rows = db.session.execute(sa.text('SELECT id, primary_image FROM product ORDER BY id')).all()
+        assert [tuple(row) for row in rows] == [(1, 'https://img.test/1/a.jpg'), (2, None)]
+        assert [image.url for image in db.session.get(Product, 1).images] == parse_images(PICTURES)
+        assert migrations.upgrade() == []
+        db.session.remove()
+
+
+def test_ingest_stores_images(app, tmp_path):
+    source = tmp_path / 'products.json'
+    record = {
+        'pid': 'PIMG1', 'title': 'Track Pants', 'selling_price': '921', 'actual_price': '2,999',
+        'out_of_stock': False, 'images': ['https://img.test/p/1.jpg', 'https://img.test/p/2.jpg'],
+        'crawled_at': '10/02/2021, 20:11:51',
+    }
+    source.write_text(json.dumps([record]))
+    ingest_products(str(source), checkpoint_path=str(tmp_path / 'checkpoint'))
+    record['images'] = ['https://img.test/p/3.jpg']
+    source.write_text(json.dumps([record]))
+    ingest_products(str(source), checkpoint_path=str(tmp_path / 'checkpoint'))
+
+    product = Product.query.filter_by(sku='PIMG1').one()
+    assert product.primary_image == 'https://img.test/p/3.jpg'
+    assert [image.url for image in product.images] == ['https://img.test/p/3.jpg']
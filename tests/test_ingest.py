@@ -0,0 +1,71 @@
+import io
+import json
+import pytest
+from app import create_app, db
+from app.ingest import clean_record, ingest_products, iter_json_records
+from app.models import Product
+
+
+def make_record(pid, title='Solid Men Track Pants', out_of_stock=False, **overrides):
+    record = {
+        '_id': f'id-{pid}', 'actual_price': '2,999', 'average_rating': '3.9', 'brand': 'York',
+        'category': 'Clothing and Accessories', 'crawled_at': '10/02/2021, 20:11:51',
+        'description': 'Track pants', 'discount': '69% off',
+        'images': ['https://example.com/a.jpg', 'https://example.com/b.jpg'],
+        'out_of_stock': out_of_stock, 'pid': pid, 'product_details': [{'Closure': 'Elastic'}],
+        'seller': 'Shyam Enterprises', 'selling_price': '921', 'sub_category': 'Bottomwear',
+        'title': title, 'url': 'https://www.flipkart.com/x',
+    }
+    record.update(overrides)
+    return record
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.mark.parametrize('text', [
+    '[{"a": 1}, {"a": 2},\n {"a": "]"}]',
+    '{"a": 1}\n{"a": 2}\n{"a": "]"}\n',
+])
+def test_iter_json_records_handles_arrays_and_json_lines(text):
+    assert list(iter_json_records(io.StringIO(text), read_size=3)) == [{'a': 1}, {'a': 2}, {'a': ']'}]
+
+
+def test_clean_record_matches_notebook_mapping():
+    row = clean_record(make_record('TKPFCZ9EA7H5FYZH'))
+    assert row['sku'] == 'TKPFCZ9EA7H5FYZH'
+    assert row['current_price'] == 921.0 and row['previous_price'] == 2999.0
+    assert row['in_stock'] == 1
+    assert row['product_picture'] == "['https://example.com/a.jpg', 'https://example.com/b.jpg']"
+    assert row['date_added'].year == 2021 and row['date_added'].month == 2
+    assert clean_record(make_record('X', seller='')) is None
+
+
+def test_ingest_upserts_by_sku_and_resumes(app, tmp_path):
+    source = tmp_path / 'products.json'
+    records = [make_record(f'PID{n}', title=f'Product {n}') for n in range(5)]
+    records.insert(2, make_record('BROKEN', title=''))
+    source.write_text(json.dumps(records))
+    checkpoint = tmp_path / 'products.checkpoint'
+    # A previous run committed the first three records before it was interrupted.
+    checkpoint.write_text(json.dumps({'records': 3}))
+
+    stats = ingest_products(str(source), chunk_size=2, checkpoint_path=str(checkpoint))
+    assert stats['resumed_from'] == 3
+    assert stats['written'] == 3
+    assert sorted(sku for (sku,) in db.session.query(Product.sku)) == ['PID2', 'PID3', 'PID4']
+    assert not checkpoint.exists()
+
+    records[3] = make_record('PID2', title='Renamed', out_of_stock=True)
+    source.write_text(json.dumps(records))
+    stats = ingest_products(str(source), chunk_size=2, checkpoint_path=str(checkpoint))
+    assert stats == dict(stats, read=6, skipped=1, written=5)
+    assert Product.query.count() == 5
+    renamed = Product.query.filter_by(sku='PID2').one()
+    assert renamed.product_name == 'Renamed' and renamed.in_stock == 0
@@ -0,0 +1,118 @@
+import logging
+
+import pytest
+from app import create_app, db
+from app.instrumentation import Histogram, get_metrics
+from app.models import Customer, Product
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='m@example.com', username='m', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Metric Shirt', current_price=10.0,
+                               previous_price=12.0, product_picture='m.jpg', in_stock=3))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram([1, 5])
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (5, 3), (float('inf'), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 14.5
+
+
+def test_queries_are_counted_per_endpoint(app, client):
+    client.get('/add-to-cart/1')
+    client.get('/cart')
+    with app.app_context():
+        metrics = get_metrics()
+        assert metrics.queries['views.show_cart'].count == 1
+        assert metrics.queries['views.show_cart'].sum == 1
+        assert metrics.requests[('views.add_to_cart', 'GET', 200)] == 1
+
+
+def test_streamed_listing_is_timed_after_the_body(app, client):
+    response = client.get('/productsearch')
+    assert b'Metric Shirt' in response.data
+    with app.app_context():
+        assert get_metrics().queries['productsearch.search_page'].sum >= 1
+
+
+def test_metrics_endpoint_uses_prometheus_format(client):
+    client.get('/cart')
+    client.get('/no-such-page')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="views.show_cart",method="GET",le="+Inf"} 1' in body
+    assert 'http_requests_total{endpoint="unmatched",method="GET",status="404"} 1' in body
+    assert 'db_queries_per_request_count{endpoint="views.show_cart"} 1' in body
+    assert 'cache_hits_total{cache="product_cache"}' in body
+
+
+def test_metrics_endpoint_can_be_disabled(app, client):
+    app.config['METRICS_ENABLED'] = False
+    assert client.get('/metrics').status_code == 404
+
+
+def test_slow_queries_are_logged_with_route(app, client, caplog):
+    app.config['SLOW_QUERY_THRESHOLD'] = 0
+    with caplog.at_level(logging.WARNING, logger='app.slow_queries'):
+        client.get('/pluscart?cart_id=999')
+    messages = [record.getMessage() for record in caplog.records if record.name == 'app.slow_queries']
+    assert messages
+    assert 'GET /pluscart [views]' in messages[0]
+    assert 'UPDATE cart' in messages[0]
+    with app.app_context():
+        assert get_metrics().slow_queries['views.plus_cart'] >= 1
+
+
+def test_slow_query_parameters_are_redacted_outside_development(app, client, caplog):
+    app.config['SLOW_QUERY_THRESHOLD'] = 0
+    with caplog.at_level(logging.WARNING, logger='app.slow_queries'):
+        client.post('/login', json={'email': 'm@example.com', 'password': 'secret'})
+        app.config['SLOW_QUERY_LOG_PARAMETERS'] = True
+        client.post('/login', json={'email': 'm@example.com', 'password': 'secret'})
+    messages = [record.getMessage() for record in caplog.records if record.name == 'app.slow_queries']
+    redacted = [message for message in messages if 'redacted' in message]
+    assert redacted and not any('m@example.com' in message for message in redacted)
+    assert any('m@example.com' in message for message in messages)
+
+
+def test_metrics_are_off_in_the_prod_profile(tmp_path):
+    app = create_app({'PROFILE': 'prod', 'SECRET_KEY': 'x', 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'm.db'}"})
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_slow_selects_include_the_query_plan(app, client, caplog):
+    app.config.update(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_EXPLAIN=True)
+    with caplog.at_level(logging.WARNING, logger='app.slow_queries'):
+        client.get('/cart')
+    messages = [record.getMessage() for record in caplog.records if record.name == 'app.slow_queries']
+    assert any('plan:' in message and 'SEARCH' in message.upper() for message in messages)
+    with app.app_context():
+        # The EXPLAIN itself is not counted as a request query.
+        assert get_metrics().queries['views.show_cart'].sum == 1
+
+
+def test_slow_query_log_can_be_disabled(app, client, caplog):
+    app.config['SLOW_QUERY_THRESHOLD'] = None
+    with caplog.at_level(logging.WARNING, logger='app.slow_queries'):
+        client.get('/cart')
+    assert not [record for record in caplog.records if record.name == 'app.slow_queries']
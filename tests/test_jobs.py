@@ -0,0 +1,171 @@
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+from flask import json
+from app import create_app, db, jobs
+from app.models import Cart, Customer, Job, Product
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'jobs.db'}",
+        'JOB_RETRY_BACKOFF': 10,
+        'JOB_MAX_ATTEMPTS': 3,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='jobs@example.com', username='jobs', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Job Product', current_price=10.0,
+                               previous_price=12.0, product_picture='j.jpg', in_stock=5))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def flaky_handler():
+    calls = []
+
+    @jobs.handler('test_flaky')
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) <= payload.get('failures', 0):
+            raise RuntimeError('temporary failure')
+
+    yield calls
+    jobs.HANDLERS.pop('test_flaky')
+
+
+def get_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        db.session.expunge(job)
+        return job
+
+
+def test_enqueue_is_part_of_the_callers_transaction(app, flaky_handler):
+    with app.app_context():
+        jobs.enqueue('test_flaky')
+        db.session.rollback()
+        assert Job.query.count() == 0
+        job_id = jobs.enqueue('test_flaky', {'n': 1})
+        db.session.commit()
+    assert jobs.Worker(app).run_one() == 'done'
+    assert flaky_handler == [{'n': 1}]
+    job = get_job(app, job_id)
+    assert (job.status, job.attempts, job.locked_by) == ('done', 1, None)
+    assert jobs.Worker(app).run_one() is None
+
+
+def test_enqueue_rejects_unknown_kinds(app):
+    with app.app_context(), pytest.raises(jobs.UnknownJobKind):
+        jobs.enqueue('no_such_job')
+
+
+def test_failures_are_retried_with_backoff(app, flaky_handler, caplog):
+    with app.app_context():
+        job_id = jobs.enqueue('test_flaky', {'failures': 1})
+        db.session.commit()
+
+    worker = jobs.Worker(app)
+    with caplog.at_level(logging.ERROR, logger='app.jobs'):
+        before = datetime.utcnow()
+        assert worker.run_one() == 'queued'
+    job = get_job(app, job_id)
+    assert job.last_error == "RuntimeError('temporary failure')"
+    assert job.run_at >= before + timedelta(seconds=10)
+    # Not due yet.
+    assert worker.run_one() is None
+
+    with app.app_context():
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(run_at=datetime.utcnow()))
+        db.session.commit()
+    assert worker.run_one() == 'done'
+    assert get_job(app, job_id).attempts == 2
+
+
+def test_jobs_fail_after_max_attempts(app, flaky_handler):
+    with app.app_context():
+        job_id = jobs.enqueue('test_flaky', {'failures': 10})
+        db.session.commit()
+    worker = jobs.Worker(app)
+    for _ in range(3):
+        with app.app_context():
+            db.session.execute(db.update(Job).where(Job.id == job_id).values(run_at=datetime.utcnow()))
+            db.session.commit()
+        worker.run_one()
+    job = get_job(app, job_id)
+    assert (job.status, job.attempts) == ('failed', 3)
+    assert len(flaky_handler) == 3
+
+
+def test_retry_delay_doubles_up_to_the_maximum():
+    assert [jobs.retry_delay(attempt, 10, 60) for attempt in range(1, 6)] == [10, 20, 40, 60, 60]
+
+
+def test_expired_lock_is_claimed_by_another_worker(app, flaky_handler):
+    with app.app_context():
+        job_id = jobs.enqueue('test_flaky')
+        db.session.commit()
+        # A worker claimed it and died.
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(
+            status='running', attempts=1, locked_by='dead', locked_until=datetime.utcnow() + timedelta(minutes=5)))
+        db.session.commit()
+
+    assert jobs.Worker(app).run_one() is None
+    with app.app_context():
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(
+            locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+    assert jobs.Worker(app, name='rescuer').run_one() == 'done'
+    assert get_job(app, job_id).attempts == 2
+
+
+def test_sign_up_and_checkout_enqueue_jobs(app, client, caplog):
+    response = client.post('/sign-up', json={'email': 'new@example.com', 'username': 'new',
+                                             'password1': 'secret-pw', 'password2': 'secret-pw'})
+    assert response.status_code == 201
+    with app.app_context():
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=1))
+        db.session.commit()
+    response = client.post('/checkout', headers={'Idempotency-Key': 'jobs'}, json={'payment_id': 'pay_9'})
+    assert response.status_code == 201
+
+    with app.app_context():
+        assert [job.kind for job in Job.query.order_by(Job.id)] == ['send_welcome_email', 'reconcile_payment']
+    with caplog.at_level(logging.INFO, logger='app.tasks'):
+        assert jobs.Worker(app).run(burst=True) == 2
+    messages = [record.getMessage() for record in caplog.records if record.name == 'app.tasks']
+    assert 'Welcome email to new <new@example.com>' in messages
+    checkout_id = json.loads(response.data)['checkout_id']
+    assert f'Checkout {checkout_id}: payment pay_9 should cover 10.00 over 1 orders' in messages
+    with app.app_context():
+        assert jobs.queue_stats()['done'] == 2
+
+
+def test_worker_pool_runs_jobs_in_threads(app, flaky_handler):
+    app.config['JOB_POLL_INTERVAL'] = 0.01
+    with app.app_context():
+        for n in range(5):
+            jobs.enqueue('test_flaky', {'n': n})
+        db.session.commit()
+    pool = jobs.WorkerPool(app, 2).start()
+    try:
+        for _ in range(500):
+            with app.app_context():
+                if jobs.queue_stats()['done'] == 5:
+                    break
+            pool.stop_event.wait(0.01)
+    finally:
+        pool.stop(timeout=5)
+    assert sorted(payload['n'] for payload in flaky_handler) == [0, 1, 2, 3, 4]
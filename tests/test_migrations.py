@@ -0,0 +1,71 @@
+import pytest
+import sqlalchemy as sa
+from app import create_app, db, migrations
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'legacy.db'}"})
+    with app.app_context():
+        yield app
+
+
+def build_legacy_schema(connection):
+    # The tables as created by the original models: no sku, no secondary indexes.
+    connection.execute(sa.text('DROP TABLE IF EXISTS cart'))
+    connection.execute(sa.text('DROP TABLE IF EXISTS "order"'))
+    connection.execute(sa.text('DROP TABLE IF EXISTS product'))
+    connection.execute(sa.text('DROP TABLE IF EXISTS customer'))
+    connection.execute(sa.text(
+        'CREATE TABLE customer (id INTEGER PRIMARY KEY, email VARCHAR(100) UNIQUE, username VARCHAR(100), '
+        'password_hash VARCHAR(150), date_joined DATETIME)'))
+    connection.execute(sa.text(
+        'CREATE TABLE product (id INTEGER PRIMARY KEY, product_name VARCHAR(100) NOT NULL, '
+        'current_price FLOAT NOT NULL, previous_price FLOAT NOT NULL, in_stock INTEGER NOT NULL, '
+        'product_picture VARCHAR(1000) NOT NULL, date_added DATETIME)'))
+    connection.execute(sa.text(
+        'CREATE TABLE cart (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, '
+        'customer_link INTEGER NOT NULL, product_link INTEGER NOT NULL)'))
+    connection.execute(sa.text(
+        'CREATE TABLE "order" (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, price FLOAT NOT NULL, '
+        'status VARCHAR(100) NOT NULL, payment_id VARCHAR(1000) NOT NULL, '
+        'customer_link INTEGER NOT NULL, product_link INTEGER NOT NULL)'))
+    connection.execute(sa.text(
+        'INSERT INTO cart (id, quantity, customer_link, product_link) VALUES (1, 2, 1, 5), (2, 3, 1, 5), (3, 1, 2, 5)'))
+
+
+def index_names(table):
+    return {index['name'] for index in sa.inspect(db.engine).get_indexes(table)}
+
+
+def test_upgrade_migrates_legacy_database(app):
+    with db.engine.begin() as connection:
+        build_legacy_schema(connection)
+    assert migrations.current_version() == 0
+
+    assert migrations.upgrade() == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.current_version() == migrations.MIGRATIONS[-1][0]
+
+    with db.engine.connect() as connection:
+        rows = connection.execute(sa.text('SELECT id, quantity FROM cart ORDER BY id')).all()
+    assert [tuple(row) for row in rows] == [(1, 5), (3, 1)]
+    assert 'sku' in {column['name'] for column in sa.inspect(db.engine).get_columns('product')}
+    assert {'uq_cart_customer_product', 'ix_cart_product_link'} <= index_names('cart')
+    assert {'ix_order_customer_link', 'ix_order_product_link'} <= index_names('order')
+    assert {'uq_product_sku', 'ix_product_current_price'} <= index_names('product')
+    assert 'ix_customer_username' in index_names('customer')
+    assert migrations.upgrade() == []
+
+
+def test_upgrade_is_a_no_op_on_a_fresh_schema(app):
+    db.create_all()
+    expected = {table: index_names(table) for table in ('cart', 'order', 'product', 'customer')}
+    migrations.upgrade()
+    assert {table: index_names(table) for table in expected} == expected
+
+
+def test_added_columns_use_the_dialects_type_names():
+    statements = []
+    engine = sa.create_mock_engine('postgresql://', lambda sql, *args, **kwargs: statements.append(str(sql)))
+    migrations._add_column(engine, 'order', 'created_at', sa.DateTime())
+    assert statements == ['ALTER TABLE "order" ADD COLUMN created_at TIMESTAMP WITHOUT TIME ZONE']
@@ -0,0 +1,128 @@
+import pytest
+from app import create_app, db
+from app.checkout_service import checkout
+from app.models import Cart, Customer, Product
+from app.price_index import PriceIndex, PriceRange, get_price_index
+
+
+@pytest.fixture
+def index():
+    index = PriceIndex()
+    # (id, price, stock)
+    index.load([(1, 10.0, 5), (2, 20.0, 0), (3, 20.0, 2), (4, 35.5, 1), (5, 50.0, 0), (6, 5.0, 3)])
+    return index
+
+
+def test_closed_and_open_ranges(index):
+    assert list(index.ids_in_range(PriceRange(10, 20))) == [1, 2, 3]
+    assert list(index.ids_in_range(PriceRange(10, 20, low_inclusive=False))) == [2, 3]
+    assert list(index.ids_in_range(PriceRange(10, 20, high_inclusive=False))) == [1]
+    assert list(index.ids_in_range(PriceRange(low=35.5))) == [4, 5]
+    assert list(index.ids_in_range(PriceRange(high=10))) == [6, 1]
+    assert list(index.ids_in_range(PriceRange())) == [6, 1, 2, 3, 4, 5]
+    assert list(index.ids_in_range(PriceRange(40, 30))) == []
+    assert index.count(PriceRange(low=20)) == (4, 2)
+
+
+def test_histogram_with_open_last_bucket(index):
+    assert index.histogram([0, 10, 25]) == [
+        (0.0, 10.0, 1, 1),
+        (10.0, 25.0, 3, 2),
+        (25.0, None, 2, 1),
+    ]
+    # Products below the first edge are not counted.
+    assert index.histogram([15]) == [(15.0, None, 4, 2)]
+
+
+def test_histogram_of_selected_ids(index):
+    assert index.histogram_of([2, 3, 5, 99], [0, 25]) == [(0.0, 25.0, 2, 1), (25.0, None, 1, 0)]
+
+
+def test_bad_bucket_edges_are_rejected(index):
+    with pytest.raises(ValueError):
+        index.histogram([10, 10])
+    with pytest.raises(ValueError):
+        index.histogram([])
+
+
+def test_incremental_updates_keep_the_arrays_sorted(index):
+    index.upsert(1, price=40.0)          # move, keeping stock
+    index.upsert(3, in_stock=0)          # stock only
+    index.upsert(7, price=20.0, in_stock=4)
+    index.remove(5)
+    index.remove(99)
+    assert list(index.ids_in_range(PriceRange())) == [6, 2, 3, 7, 4, 1]
+    assert index.count(PriceRange(20, 20)) == (3, 1)
+    assert index.histogram([0, 30]) == [(0.0, 30.0, 4, 2), (30.0, None, 2, 2)]
+    with pytest.raises(ValueError):
+        index.upsert(8, price=1.0)
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='price@example.com', username='price', password_hash='x'))
+        for i, (price, stock) in enumerate([(5.0, 1), (15.0, 0), (25.0, 4), (45.0, 2)], start=1):
+            db.session.add(Product(id=i, product_name=f'Lamp {i}', current_price=price, previous_price=price,
+                                   product_picture=f'{i}.jpg', in_stock=stock))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_index_follows_committed_product_changes(app):
+    with app.app_context():
+        index = get_price_index()
+        assert index.count(PriceRange()) == (4, 3)
+
+        db.session.get(Product, 2).current_price = 50.0
+        db.session.delete(db.session.get(Product, 4))
+        db.session.add(Product(id=5, product_name='Lamp 5', current_price=1.0, previous_price=1.0,
+                               product_picture='5.jpg', in_stock=3))
+        db.session.commit()
+        assert list(index.ids_in_range(PriceRange())) == [5, 1, 3, 2]
+
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=1))
+        db.session.commit()
+        checkout(1, 'price-index')
+        assert index.count(PriceRange(high=5)) == (2, 1)  # product 1 sold out
+        assert index.built
+
+
+def test_open_ended_price_filters(client):
+    response = client.post('/productsearch', data={'min_price': '20'})
+    assert [row['id'] for row in response.get_json()['results']] == [3, 4]
+    response = client.post('/productsearch', data={'search': 'lamp', 'max_price': '15'})
+    assert sorted(row['id'] for row in response.get_json()['results']) == [1, 2]
+
+
+def test_price_facets(client):
+    response = client.post('/productsearch', data={'price_buckets': '0,10,30', 'max_price': '10'})
+    body = response.get_json()
+    assert [row['id'] for row in body['results']] == [1]
+    # Facets cover every product, not just the ones inside the price filter.
+    assert body['price_facets'] == [
+        {'min': 0.0, 'max': 10.0, 'count': 1, 'in_stock': 1},
+        {'min': 10.0, 'max': 30.0, 'count': 2, 'in_stock': 1},
+        {'min': 30.0, 'max': None, 'count': 1, 'in_stock': 1},
+    ]
+    response = client.post('/productsearch', data={'search': 'lamp 3', 'price_buckets': '0,20'})
+    assert response.get_json()['price_facets'] == [
+        {'min': 0.0, 'max': 20.0, 'count': 0, 'in_stock': 0},
+        {'min': 20.0, 'max': None, 'count': 1, 'in_stock': 1},
+    ]
+
+
+def test_invalid_price_parameters(client):
+    assert client.post('/productsearch', data={'min_price': 'cheap'}).status_code == 400
+    assert client.post('/productsearch', data={'max_price': 'nan'}).status_code == 400
+    assert client.post('/productsearch', data={'price_buckets': '10,5'}).status_code == 400
@@ -55,4 +55,69 @@ def test_search_results_filtered_by_price_range(client):
     data = json.loads(response.data)
     assert len(data['results']) == 1
     assert data['results'][0]['product_name'] == 'Test Product 1'
-    assert data['results'][0]['price'] == 50.0
\ No newline at end of file
+    assert data['results'][0]['price'] == 50.0
+
+def test_multi_word_search_ranks_best_match_first(client):
+    with client.application.app_context():
+        db.session.add(Product(product_name='Blue Denim Jacket', current_price=70.0,
+                               previous_price=80.0, product_picture='j.jpg', in_stock=3))
+        db.session.add(Product(product_name='Blue Denim Denim Jeans', current_price=40.0,
+                               previous_price=50.0, product_picture='d.jpg', in_stock=3))
+        db.session.commit()
+    response = client.post('/productsearch', data={'search': 'denim blue'})
+    names = [product['product_name'] for product in json.loads(response.data)['results']]
+    assert names == ['Blue Denim Denim Jeans', 'Blue Denim Jacket']
+
+
+def test_search_index_follows_committed_changes(client):
+    assert len(json.loads(client.post('/productsearch', data={'search': 'Widget'}).data)['results']) == 0
+    with client.application.app_context():
+        widget = Product(product_name='Shiny Widget', current_price=5.0,
+                         previous_price=6.0, product_picture='w.jpg', in_stock=1)
+        db.session.add(widget)
+        db.session.commit()
+        widget_id = widget.id
+    data = json.loads(client.post('/productsearch', data={'search': 'widget'}).data)
+    assert [product['id'] for product in data['results']] == [widget_id]
+
+    with client.application.app_context():
+        db.session.delete(db.session.get(Product, widget_id))
+        db.session.commit()
+    assert len(json.loads(client.post('/productsearch', data={'search': 'widget'}).data)['results']) == 0
+
+
+def test_get_request_pages_with_keyset_cursor(client):
+    first = json.loads(client.get('/productsearch?limit=1').data)
+    assert [product['product_name'] for product in first['results']] == ['Test Product 1']
+    assert first['next_after'] == first['results'][0]['id']
+
+    second = json.loads(client.get(f"/productsearch?limit=1&after={first['next_after']}").data)
+    assert [product['product_name'] for product in second['results']] == ['Test Product 2']
+
+    last = json.loads(client.get(f"/productsearch?limit=1&after={second['next_after']}").data)
+    assert last == {'results': [], 'next_after': None}
+
+
+def test_get_request_rejects_invalid_limit(client):
+    response = client.get('/productsearch?limit=abc')
+    assert response.status_code == 400
+
+
+def test_columnar_format_matches_row_format(client):
+    rows = json.loads(client.get('/productsearch?limit=10').data)
+    columnar = json.loads(client.get('/productsearch?limit=10&format=columnar').data)
+    assert columnar['columns'] == ['id', 'product_name', 'price', 'stock_status']
+    assert [dict(zip(columnar['columns'], row)) for row in columnar['rows']] == rows['results']
+    assert columnar['next_after'] is None
+
+    streamed = json.loads(client.get('/productsearch?format=columnar').data)
+    assert streamed['rows'] == columnar['rows']
+
+    searched = json.loads(client.post('/productsearch?format=columnar', data={'search': 'product'}).data)
+    assert searched['columns'] == ['id', 'product_name', 'price', 'product_picture_link', 'stock_status']
+    assert sorted(row[0] for row in searched['rows']) == [1, 2]
+
+
+def test_unfiltered_search_returns_every_product(client):
+    data = json.loads(client.post('/productsearch', data={}).data)
+    assert [product['product_picture_link'] for product in data['results']] == ['test1.jpg', 'test2.jpg']
@@ -0,0 +1,62 @@
+import pytest
+from flask import json
+from app import create_app, db
+from app.models import Customer, Product
+from app.routing import get_router
+
+
+def make_app(tmp_path, replica_uri):
+    primary = tmp_path / 'primary.db'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'SQLALCHEMY_REPLICA_URI': replica_uri.format(primary=primary),
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='r@example.com', username='r', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Replica Product', current_price=10.0,
+                               previous_price=12.0, product_picture='r.jpg', in_stock=3))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    return make_app(tmp_path, 'sqlite:///file:{primary}?mode=ro&uri=true')
+
+
+def test_catalog_reads_are_served_by_the_replica(app):
+    client = app.test_client()
+    with app.app_context():
+        before = dict(get_router().stats)
+    response = client.get('/productsearch?limit=10')
+    assert [product['product_name'] for product in json.loads(response.data)['results']] == ['Replica Product']
+    with app.app_context():
+        stats = get_router().stats
+    assert stats['replica_queries'] > before['replica_queries']
+    assert stats['primary_queries'] == before['primary_queries']
+
+
+def test_client_reads_its_own_writes_from_the_primary(app):
+    client = app.test_client()
+    assert client.get('/add-to-cart/1').status_code == 200
+    with app.app_context():
+        before = dict(get_router().stats)
+    assert client.get('/cart').json['cart'][0]['quantity'] == 1
+    with app.app_context():
+        stats = get_router().stats
+    assert stats['sticky_primary_reads'] > before['sticky_primary_reads']
+    assert stats['replica_queries'] == before['replica_queries']
+
+
+def test_unreachable_replica_falls_back_to_primary(tmp_path):
+    app = make_app(tmp_path, 'sqlite:///file:' + str(tmp_path / 'missing.db') + '?mode=ro&uri=true')
+    response = app.test_client().get('/productsearch?limit=10')
+    assert response.status_code == 200
+    assert len(json.loads(response.data)['results']) == 1
+    with app.app_context():
+        stats = get_router().stats
+    assert stats['failed_checks'] == 1
+    assert stats['fallback_reads'] >= 1
+    assert stats['replica_queries'] == 0
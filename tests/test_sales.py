@@ -0,0 +1,156 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import event
+from app import create_app, db, migrations, sales
+from app.checkout_service import checkout
+from app.models import Cart, Customer, CustomerSales, DailyProductSales, Order, Product, ProductSales
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='sales@example.com', username='sales', password_hash='x'))
+        for product_id in range(1, 6):
+            db.session.add(Product(id=product_id, product_name=f'Sales Product {product_id}',
+                                   current_price=float(product_id), previous_price=10.0,
+                                   product_picture='p.jpg', in_stock=100))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def buy(lines, key):
+    for product_id, quantity in lines.items():
+        db.session.add(Cart(customer_link=1, product_link=product_id, quantity=quantity))
+    db.session.commit()
+    checkout(1, key)
+
+
+def rollups():
+    return {
+        'products': sorted(tuple(row) for row in db.session.execute(
+            sa.select(ProductSales.product_link, ProductSales.orders, ProductSales.units, ProductSales.revenue))),
+        'days': sorted(tuple(row) for row in db.session.execute(
+            sa.select(DailyProductSales.day, DailyProductSales.product_link, DailyProductSales.orders,
+                      DailyProductSales.units, DailyProductSales.revenue))),
+        'customers': sorted(tuple(row) for row in db.session.execute(
+            sa.select(CustomerSales.customer_link, CustomerSales.orders, CustomerSales.units, CustomerSales.revenue))),
+    }
+
+
+def test_checkout_updates_rollups(app):
+    buy({1: 2, 2: 1}, 'a')
+    buy({2: 3}, 'b')
+    today = datetime.utcnow().date()
+    assert rollups() == {
+        'products': [(1, 1, 2, 2.0), (2, 2, 4, 8.0)],
+        'days': [(today, 1, 1, 2, 2.0), (today, 2, 2, 4, 8.0)],
+        'customers': [(1, 3, 6, 10.0)],
+    }
+    assert db.session.get(CustomerSales, 1).last_ordered_at is not None
+
+
+def test_rebuild_matches_incremental_rollups(app):
+    buy({1: 2, 2: 1}, 'a')
+    buy({2: 3, 3: 1}, 'b')
+    incremental = rollups()
+    sales.rebuild(db.session.connection())
+    db.session.commit()
+    assert rollups() == incremental
+
+
+def test_top_products(app, client):
+    buy({1: 2, 2: 5}, 'a')
+    buy({3: 4}, 'b')
+    # An old order, folded in by a rebuild: it counts all time but not in the last week.
+    db.session.add(Order(quantity=10, price=1.0, status='Paid', payment_id='p', customer_link=1, product_link=1,
+                         created_at=datetime.utcnow() - timedelta(days=30)))
+    db.session.commit()
+    sales.rebuild(db.session.connection())
+    db.session.commit()
+
+    response = client.get('/products/top?limit=2')
+    assert response.get_json() == {'results': [
+        {'id': 1, 'product_name': 'Sales Product 1', 'units': 12, 'revenue': 12.0, 'orders': 2},
+        {'id': 2, 'product_name': 'Sales Product 2', 'units': 5, 'revenue': 10.0, 'orders': 1},
+    ]}
+    recent = client.get('/products/top?days=7').get_json()['results']
+    assert [(row['id'], row['units']) for row in recent] == [(2, 5), (3, 4), (1, 2)]
+
+
+def test_top_products_validation(client):
+    assert client.get('/products/top').get_json() == {'results': []}
+    for query in ('limit=x', 'limit=0', 'limit=101', 'days=0', 'days=367', 'days=x'):
+        assert client.get(f'/products/top?{query}').status_code == 400
+
+
+def test_top_products_reads_do_not_grow_with_orders(app, client):
+    def statements_for(path):
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            client.get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return statements
+
+    buy({1: 1}, 'a')
+    before = [statements_for('/products/top'), statements_for('/products/top?days=30')]
+    for i in range(20):
+        buy({1 + i % 5: 1}, f'more-{i}')
+    after = [statements_for('/products/top'), statements_for('/products/top?days=30')]
+    assert after == before
+    assert all('"order"' not in statement for statement in after[0] + after[1])
+
+
+def test_orders_are_paged_newest_first_with_a_summary(app, client):
+    buy({1: 2, 2: 1}, 'a')
+    buy({3: 1}, 'b')
+    first = client.get('/orders?limit=2').get_json()
+    assert [order['product_id'] for order in first['orders']] == [3, 2]
+    assert first['summary']['orders'] == 3
+    assert first['summary']['units'] == 4
+    assert first['summary']['revenue'] == 7.0
+    second = client.get(f"/orders?limit=2&before={first['next_before']}").get_json()
+    assert [order['product_id'] for order in second['orders']] == [1]
+    assert second['next_before'] is None
+    assert client.get('/orders?before=x').status_code == 400
+
+
+def test_migration_backfills_dates_and_rollups(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'sales.db'}"})
+    with app.app_context():
+        migrations.upgrade(target=4)
+        with db.engine.begin() as connection:
+            connection.execute(sa.text('DROP INDEX IF EXISTS ix_order_created_at'))
+            connection.execute(sa.text('ALTER TABLE "order" DROP COLUMN created_at'))
+            connection.execute(sa.text(
+                "INSERT INTO customer (id, email, username, password_hash) VALUES (1, 'm@example.com', 'm', 'x')"))
+            connection.execute(sa.text(
+                "INSERT INTO product (id, product_name, current_price, previous_price, in_stock, product_picture) "
+                "VALUES (1, 'Old Lamp', 5.0, 5.0, 1, 'p.jpg')"))
+            connection.execute(sa.text(
+                "INSERT INTO checkout (id, customer_link, idempotency_key, status, total, created_at) "
+                "VALUES (1, 1, 'k', 'placed', 10.0, '2024-03-01 10:00:00.000000')"))
+            connection.execute(sa.text(
+                'INSERT INTO "order" (quantity, price, status, payment_id, customer_link, product_link, checkout_link) '
+                "VALUES (2, 5.0, 'Paid', '', 1, 1, 1), (1, 5.0, 'Paid', '', 1, 1, NULL)"))
+
+        assert migrations.upgrade(target=5) == [5]
+        assert db.session.get(ProductSales, 1).units == 3
+        assert db.session.get(CustomerSales, 1).orders == 2
+        # Only the order with a checkout could be dated.
+        assert [(row.day, row.units) for row in db.session.scalars(sa.select(DailyProductSales))] == [
+            (date(2024, 3, 1), 2)]
+        db.session.remove()
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+from flask import json
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.serialization import FastJSONProvider, columnar
+
+
+def make_app(provider):
+    return create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'JSON_PROVIDER': provider})
+
+
+def test_auto_uses_orjson_when_installed():
+    pytest.importorskip('orjson')
+    assert isinstance(make_app('auto').json, FastJSONProvider)
+    assert type(make_app('default').json) is DefaultJSONProvider
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        make_app('simplejson')
+
+
+def test_fast_provider_matches_default_output():
+    pytest.importorskip('orjson')
+    document = {'b': 1, 'a': [1.5, None, True], 'when': datetime(2024, 1, 2, 3, 4, 5), 'nested': {'z': 'x', 'y': 2}}
+    fast, default = make_app('orjson'), make_app('default')
+    assert json.loads(fast.json.dumps(document)) == json.loads(default.json.dumps(document))
+    # Sorted keys and Flask's HTTP date format, as with the default provider.
+    assert fast.json.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+    assert json.loads(fast.json.dumps(document))['when'] == 'Tue, 02 Jan 2024 03:04:05 GMT'
+    with fast.app_context():
+        response = fast.json.response(results=[1, 2])
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.data) == {'results': [1, 2]}
+
+
+def test_columnar_document():
+    assert columnar(('id', 'name'), [(1, 'a'), (2, 'b')], next_after=2) == {
+        'columns': ['id', 'name'], 'rows': [[1, 'a'], [2, 'b']], 'next_after': 2}
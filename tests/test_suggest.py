@@ -0,0 +1,127 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.checkout_service import checkout
+from app.models import Cart, Customer, Product, ProductSales
+from app import suggest as suggest_module
+from app.suggest import SuggestIndex
+
+
+@pytest.fixture
+def index():
+    index = SuggestIndex()
+    # (id, name, in_stock, popularity)
+    index.load([
+        (1, 'Red Cotton Shirt', 5, 10),
+        (2, 'Cotton Socks', 0, 50),
+        (3, 'Cotton Shirt Slim', 3, 10),
+        (4, 'Silk Scarf', 2, 1),
+    ])
+    return index
+
+
+def test_prefixes_match_any_word_start(index):
+    assert [product_id for product_id, _ in index.suggest('cot')] == [1, 3, 2]
+    assert [product_id for product_id, _ in index.suggest('cotton sh')] == [1, 3]
+    assert [product_id for product_id, _ in index.suggest('SLI')] == [3]
+    assert index.suggest('shirt slim') == [(3, 'Cotton Shirt Slim')]
+    assert index.suggest('ton') == []
+    assert index.suggest('   ') == []
+
+
+def test_ranking_and_limit(index):
+    # In stock first, then popularity, then stock count, then lowest id.
+    assert [product_id for product_id, _ in index.suggest('s')] == [1, 3, 4, 2]
+    assert [product_id for product_id, _ in index.suggest('s', limit=2)] == [1, 3]
+
+
+def test_incremental_updates(index):
+    index.upsert(4, name='Silk Shirt')
+    index.upsert(5, name='Shirt Box', in_stock=1, popularity=99)
+    index.upsert(3, in_stock=0)    # sold out
+    index.upsert(2, in_stock=4)    # restocked
+    index.remove(1)
+    assert [product_id for product_id, _ in index.suggest('shirt')] == [5, 4, 3]
+    assert [product_id for product_id, _ in index.suggest('cotton')] == [2, 3]
+    assert index.suggest('scarf') == []
+    with pytest.raises(ValueError):
+        index.upsert(6, name='No stock given')
+
+
+def test_broad_prefixes_are_cached_and_invalidated(monkeypatch):
+    monkeypatch.setattr(suggest_module, 'SCAN_LIMIT', 2)
+    index = SuggestIndex()
+    index.load([(i, f'Lamp {i}', 1, i) for i in range(1, 6)])
+    assert [product_id for product_id, _ in index.suggest('lamp', limit=2)] == [5, 4]
+    assert index._top.get('lamp', count=False) is not None
+    index.upsert(1, in_stock=0)
+    index.upsert(2, popularity=100)
+    assert index._top.get('lamp', count=False) is None
+    assert [product_id for product_id, _ in index.suggest('lamp', limit=2)] == [2, 5]
+
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(id=1, email='suggest@example.com', username='suggest', password_hash='x'))
+        db.session.add(Product(id=1, product_name='Desk Lamp', current_price=20.0, previous_price=20.0,
+                               product_picture='1.jpg', in_stock=5))
+        db.session.add(Product(id=2, product_name='Floor Lamp', current_price=40.0, previous_price=40.0,
+                               product_picture='2.jpg', in_stock=5))
+        db.session.add(ProductSales(product_link=2, orders=1, units=3, revenue=120.0))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_suggest_endpoint_ranks_by_units_sold_without_queries(app, client):
+    assert client.get('/productsearch/suggest?q=lamp').get_json() == {'suggestions': [
+        {'id': 2, 'product_name': 'Floor Lamp'},
+        {'id': 1, 'product_name': 'Desk Lamp'},
+    ]}
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get('/productsearch/suggest?q=De&limit=1')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.get_json() == {'suggestions': [{'id': 1, 'product_name': 'Desk Lamp'}]}
+    assert statements == []
+
+
+def test_suggestions_follow_catalog_changes(app, client):
+    client.get('/productsearch/suggest?q=lamp')
+    with app.app_context():
+        db.session.add(Cart(customer_link=1, product_link=1, quantity=4))
+        db.session.commit()
+        checkout(1, 'suggest')  # 4 desk lamps sold: more popular than the floor lamp
+    assert [row['id'] for row in client.get('/productsearch/suggest?q=lamp').get_json()['suggestions']] == [1, 2]
+    with app.app_context():
+        db.session.get(Product, 1).in_stock = 2  # a stock correction, not a sale
+        db.session.get(Product, 2).in_stock = 1
+        db.session.commit()
+    assert [row['id'] for row in client.get('/productsearch/suggest?q=lamp').get_json()['suggestions']] == [1, 2]
+    with app.app_context():
+        db.session.get(Product, 2).product_name = 'Floor Light'
+        db.session.commit()
+    assert [row['id'] for row in client.get('/productsearch/suggest?q=lamp').get_json()['suggestions']] == [1]
+    assert [row['id'] for row in client.get('/productsearch/suggest?q=light').get_json()['suggestions']] == [2]
+
+
+def test_suggest_validation(client):
+    assert client.get('/productsearch/suggest').get_json() == {'suggestions': []}
+    assert client.get('/productsearch/suggest?q=lamp&limit=x').status_code == 400
+    assert client.get('/productsearch/suggest?q=lamp&limit=0').status_code == 400
@@ -55,3 +55,12 @@ def test_no_cart_id_provided(client):
     response = client.get('/plus-cart')  # No cart_id provided in the query string
     assert response.status_code == 400
     assert response.json == {'error': 'No cart ID provided'}
+
+def test_cart_columnar_format(client):
+    response = client.get('/cart?format=columnar')
+    assert response.status_code == 200
+    assert response.json == {
+        'columns': ['cart_id', 'product_id', 'product_name', 'quantity', 'price_per_item', 'subtotal'],
+        'rows': [],
+        'total': 0.0,
+    }
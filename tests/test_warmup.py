@@ -0,0 +1,67 @@
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+import app as app_package
+from app import create_app, db
+from app.models import Product
+from app.warmup import warmup
+
+
+def make_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}", **config})
+
+
+def seed(app):
+    with app.app_context():
+        db.create_all()
+        for i in range(1, 41):
+            db.session.add(Product(id=i, product_name=f'Warm product {i}', current_price=10.0,
+                                   previous_price=12.0, product_picture=f'{i}.jpg', in_stock=3))
+        db.session.commit()
+
+
+def test_import_and_create_app_leave_the_database_alone(tmp_path):
+    assert not isinstance(getattr(app_package, 'app', None), Flask)
+    app = make_app(tmp_path)
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+
+
+def test_warmup_fills_the_caches(tmp_path):
+    app = make_app(tmp_path)
+    seed(app)
+    timings = warmup(app)
+    assert list(timings) == ['catalog_version', 'search_index', 'price_index', 'suggest', 'product_cache', 'listing']
+    assert app.extensions['product_search_index'].built
+    assert len(app.extensions['product_cache']) == 40
+    assert len(app.extensions['compressed_bodies']) == 1
+
+
+def test_warmup_on_start(tmp_path):
+    seed(make_app(tmp_path))
+    app = make_app(tmp_path, WARMUP_ON_START=True, WARMUP_STEPS=('search_index',))
+    assert app.extensions['product_search_index'].built
+    assert len(app.extensions['product_cache']) == 0
+
+
+def test_failing_steps_are_logged_and_skipped(tmp_path, caplog):
+    app = make_app(tmp_path)  # No tables, so every step that reads the catalog fails.
+    with caplog.at_level(logging.ERROR, logger='app.warmup'):
+        assert warmup(app, steps=['search_index']) == {}
+    assert 'Warmup step search_index failed' in caplog.text
+
+
+def test_unknown_steps_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        warmup(make_app(tmp_path), steps=['everything'])
+
+
+def test_warmup_command(tmp_path):
+    app = make_app(tmp_path)
+    seed(app)
+    result = app.test_cli_runner().invoke(args=['warmup', '--step', 'search_index'])
+    assert result.exit_code == 0
+    assert result.output.startswith('search_index')
+    assert app.extensions['product_search_index'].built